@@ -0,0 +1,366 @@
+"""
+AI Provider Emulator
+Local stand-in for the Gemini generateContent / streamGenerateContent REST API and the OpenAI
+chat-completions API, with configurable latency, 429 quota errors, server errors, malformed
+JSON and broken streams. Point the app at it with AI_EMULATOR_URL to load-test note
+processing without spending API quota.
+
+Usage:
+    python ai_emulator.py                                        # http://127.0.0.1:8089, ~800ms responses
+    python ai_emulator.py --latency lognormal:1200:0.6 --rate-limit-rate 0.05 --malformed-rate 0.1
+    AI_EMULATOR_URL=http://127.0.0.1:8089 python main.py         # app uses the emulator for both providers
+
+    curl -X POST localhost:8089/emulator/config -d '{"error_rate": 0.5}'   # change faults at runtime
+    curl localhost:8089/emulator/stats                                     # requests by provider/outcome
+
+Latency distributions (milliseconds): fixed:<ms>, uniform:<low>:<high>, normal:<mean>:<sd>,
+lognormal:<median>:<sigma>. Streaming responses send the first chunk after --ttft-fraction of
+the sampled latency and spread the rest over the remaining chunks.
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import zlib
+import argparse
+import threading
+from flask import Flask, Response, request, jsonify
+
+CATEGORIES = [
+    'Actionable', 'Goals', 'Relationship_Strategy', 'Social', 'Professional_Background',
+    'Financial_Situation', 'Wellbeing', 'Avocation', 'Environment_And_Lifestyle',
+    'Psychology_And_Values', 'Communication_Style', 'Challenges_And_Development'
+]
+
+MALFORMATIONS = ['code_fence', 'trailing_comma', 'raw_newline', 'prose', 'truncated']
+
+_NOTE_SECTION = re.compile(
+    r"New Note to Analyze[^\n]*\n(.*?)(?:\n\nCategorize the content|\n\nReturn ONLY|\Z)", re.S
+)
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class EmulatorConfig:
+    """Fault-injection settings; every field can be changed at runtime through /emulator/config"""
+    
+    FIELDS = {
+        'latency': str,
+        'ttft_fraction': float,
+        'stream_chunks': int,
+        'rate_limit_rate': float,
+        'error_rate': float,
+        'malformed_rate': float,
+        'stream_break_rate': float,
+    }
+    
+    def __init__(self, latency='lognormal:800:0.4', ttft_fraction=0.25, stream_chunks=8,
+                 rate_limit_rate=0.0, error_rate=0.0, malformed_rate=0.0, stream_break_rate=0.0, seed=None):
+        self.latency = latency
+        self.ttft_fraction = ttft_fraction
+        self.stream_chunks = stream_chunks
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.stream_break_rate = stream_break_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        parse_latency(latency)
+    
+    def update(self, values):
+        for key, value in values.items():
+            if key not in self.FIELDS:
+                raise ValueError(f"unknown setting '{key}'")
+            value = self.FIELDS[key](value)
+            if key == 'latency':
+                parse_latency(value)
+            setattr(self, key, value)
+    
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.FIELDS}
+    
+    def chance(self, rate):
+        with self._lock:
+            return rate > 0 and self.rng.random() < rate
+    
+    def sample_latency_seconds(self):
+        kind, params = parse_latency(self.latency)
+        with self._lock:
+            if kind == 'fixed':
+                value = params[0]
+            elif kind == 'uniform':
+                value = self.rng.uniform(params[0], params[1])
+            elif kind == 'normal':
+                value = self.rng.gauss(params[0], params[1])
+            else:
+                value = params[0] * self.rng.lognormvariate(0, params[1])
+        return max(value, 0.0) / 1000.0
+    
+    def choose(self, options):
+        with self._lock:
+            return self.rng.choice(options)
+
+
+def parse_latency(spec):
+    """Parse a latency spec like 'lognormal:800:0.4' into (kind, [params])"""
+    kind, *params = spec.split(':')
+    expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+    if kind not in expected or len(params) != expected[kind]:
+        raise ValueError(f"invalid latency '{spec}' (expected fixed:MS, uniform:LOW:HIGH, normal:MEAN:SD or lognormal:MEDIAN:SIGMA)")
+    return kind, [float(param) for param in params]
+
+
+def extract_note(prompt):
+    """The new-note section of an AIService prompt (or the whole prompt for other callers)"""
+    match = _NOTE_SECTION.search(prompt)
+    return (match.group(1) if match else prompt).strip()
+
+
+def analysis_for(note):
+    """A plausible, deterministic categories object: each sentence goes to a category chosen by its hash"""
+    categories = {}
+    for sentence in _SENTENCE.split(note):
+        sentence = sentence.strip()
+        if len(sentence) <= 5:
+            continue
+        checksum = zlib.crc32(sentence.encode('utf-8'))
+        category = CATEGORIES[checksum % len(CATEGORIES)]
+        confidence = round(0.7 + (checksum % 26) / 100, 2)
+        if category in categories:
+            categories[category]['content'] += f"\n{sentence}"
+        else:
+            categories[category] = {'content': sentence, 'confidence': confidence}
+    return {'categories': categories or {'Others': {'content': note[:200] or 'Empty note', 'confidence': 0.5}}}
+
+
+def malform(text, kind):
+    """Break valid JSON the way LLMs do"""
+    if kind == 'code_fence':
+        return f"```json\n{text}\n```"
+    if kind == 'trailing_comma':
+        return text[:-2] + ',}}' if text.endswith('}}') else text + ','
+    if kind == 'raw_newline':
+        return text.replace('\\n', '\n')
+    if kind == 'prose':
+        return f"Sure! Here is the analysis:\n{text}\nLet me know if you need anything else."
+    return text[:max(len(text) * 2 // 3, 1)]
+
+
+def estimate_tokens(text):
+    return max(1, (len(text) + 3) // 4)
+
+
+def split_chunks(text, count):
+    size = max(1, -(-len(text) // max(count, 1)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def create_emulator_app(config):
+    app = Flask(__name__)
+    stats = {}
+    stats_lock = threading.Lock()
+    
+    def count(provider, outcome):
+        with stats_lock:
+            key = f"{provider}:{outcome}"
+            stats[key] = stats.get(key, 0) + 1
+    
+    def response_text(prompt, provider):
+        """Analysis JSON for the prompt, malformed at the configured rate"""
+        text = json.dumps(analysis_for(extract_note(prompt)))
+        if config.chance(config.malformed_rate):
+            kind = config.choose(MALFORMATIONS)
+            count(provider, f"malformed_{kind}")
+            return malform(text, kind)
+        count(provider, 'ok')
+        return text
+    
+    def injected_error(provider):
+        """A 429 or 500 response when fault injection says so, else None"""
+        if config.chance(config.rate_limit_rate):
+            count(provider, 'rate_limited')
+            if provider == 'gemini':
+                body = {'error': {'code': 429, 'message': 'Resource has been exhausted (e.g. check quota).',
+                                  'status': 'RESOURCE_EXHAUSTED'}}
+            else:
+                body = {'error': {'message': 'Rate limit reached for requests', 'type': 'requests',
+                                  'param': None, 'code': 'rate_limit_exceeded'}}
+            return jsonify(body), 429, {'Retry-After': '1'}
+        if config.chance(config.error_rate):
+            count(provider, 'server_error')
+            if provider == 'gemini':
+                body = {'error': {'code': 500, 'message': 'Internal error encountered.', 'status': 'INTERNAL'}}
+            else:
+                body = {'error': {'message': 'The server had an error while processing your request.',
+                                  'type': 'server_error', 'param': None, 'code': None}}
+            return jsonify(body), 500
+        return None
+    
+    def paced(chunks, latency):
+        """Yield chunks on the configured schedule, possibly dropping the connection halfway"""
+        first_delay = latency * config.ttft_fraction
+        chunk_delay = (latency - first_delay) / max(len(chunks) - 1, 1)
+        break_at = len(chunks) // 2 if config.chance(config.stream_break_rate) else None
+        time.sleep(first_delay)
+        for index, chunk in enumerate(chunks):
+            if index == break_at:
+                raise ConnectionAbortedError("emulated stream break")
+            if index:
+                time.sleep(chunk_delay)
+            yield index, chunk
+    
+    @app.route('/v1beta/models/<model>:generateContent', methods=['POST'])
+    def gemini_generate(model):
+        error = injected_error('gemini')
+        if error:
+            return error
+        prompt = ''.join(part.get('text', '') for item in request.get_json().get('contents', [])
+                         for part in item.get('parts', []))
+        latency = config.sample_latency_seconds()
+        text = response_text(prompt, 'gemini')
+        time.sleep(latency)
+        return jsonify(_gemini_body(model, text, prompt, final=True))
+    
+    @app.route('/v1beta/models/<model>:streamGenerateContent', methods=['POST'])
+    def gemini_stream(model):
+        error = injected_error('gemini')
+        if error:
+            return error
+        prompt = ''.join(part.get('text', '') for item in request.get_json().get('contents', [])
+                         for part in item.get('parts', []))
+        latency = config.sample_latency_seconds()
+        text = response_text(prompt, 'gemini')
+        chunks = split_chunks(text, config.stream_chunks)
+        sse = request.args.get('alt') == 'sse'
+        
+        def generate():
+            # REST streaming is one JSON array whose elements arrive over time; alt=sse uses events
+            if not sse:
+                yield '['
+            for index, chunk in paced(chunks, latency):
+                body = json.dumps(_gemini_body(model, chunk, prompt, final=index == len(chunks) - 1, full_text=text))
+                if sse:
+                    yield f"data: {body}\r\n\r\n"
+                else:
+                    yield (',\r\n' if index else '') + body
+            if not sse:
+                yield ']'
+        
+        return Response(generate(), mimetype='text/event-stream' if sse else 'application/json')
+    
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def openai_chat():
+        error = injected_error('openai')
+        if error:
+            return error
+        payload = request.get_json()
+        prompt = '\n'.join(message.get('content', '') for message in payload.get('messages', [])
+                           if message.get('role') == 'user')
+        model = payload.get('model', 'gpt-3.5-turbo')
+        latency = config.sample_latency_seconds()
+        text = response_text(prompt, 'openai')
+        created = int(time.time())
+        
+        if not payload.get('stream'):
+            time.sleep(latency)
+            prompt_tokens = estimate_tokens(prompt)
+            completion_tokens = estimate_tokens(text)
+            return jsonify({
+                'id': f"chatcmpl-emu{created}", 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                          'total_tokens': prompt_tokens + completion_tokens},
+            })
+        
+        chunks = split_chunks(text, config.stream_chunks)
+        
+        def generate():
+            for index, chunk in paced(chunks, latency):
+                delta = {'role': 'assistant', 'content': chunk} if index == 0 else {'content': chunk}
+                body = {'id': f"chatcmpl-emu{created}", 'object': 'chat.completion.chunk', 'created': created,
+                        'model': model, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]}
+                yield f"data: {json.dumps(body)}\n\n"
+            done = {'id': f"chatcmpl-emu{created}", 'object': 'chat.completion.chunk', 'created': created,
+                    'model': model, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+            yield f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n"
+        
+        return Response(generate(), mimetype='text/event-stream')
+    
+    @app.route('/emulator/config', methods=['GET', 'POST'])
+    def emulator_config():
+        if request.method == 'POST':
+            try:
+                config.update(request.get_json(force=True) or {})
+            except (ValueError, TypeError) as e:
+                return jsonify({'error': str(e)}), 400
+        return jsonify(config.as_dict())
+    
+    @app.route('/emulator/stats', methods=['GET', 'DELETE'])
+    def emulator_stats():
+        with stats_lock:
+            snapshot = dict(stats)
+            if request.method == 'DELETE':
+                stats.clear()
+        return jsonify(snapshot)
+    
+    return app
+
+
+def _gemini_body(model, text, prompt, final, full_text=None):
+    body = {
+        'candidates': [{
+            'content': {'parts': [{'text': text}], 'role': 'model'},
+            'index': 0,
+        }],
+        'modelVersion': model,
+    }
+    if final:
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(full_text or text)
+        body['candidates'][0]['finishReason'] = 'STOP'
+        body['usageMetadata'] = {'promptTokenCount': prompt_tokens, 'candidatesTokenCount': completion_tokens,
+                                 'totalTokenCount': prompt_tokens + completion_tokens}
+    return body
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Gemini/OpenAI emulator with fault injection')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8089, help='Port (default: 8089)')
+    parser.add_argument('--latency', default='lognormal:800:0.4',
+                       help='Response latency distribution in ms (default: lognormal:800:0.4)')
+    parser.add_argument('--ttft-fraction', type=float, default=0.25,
+                       help='Share of the latency before the first streamed chunk (default: 0.25)')
+    parser.add_argument('--stream-chunks', type=int, default=8, help='Chunks per streamed response (default: 8)')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Fraction of responses with malformed JSON')
+    parser.add_argument('--stream-break-rate', type=float, default=0.0,
+                       help='Fraction of streams cut off halfway')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible fault sequences')
+    
+    args = parser.parse_args()
+    
+    try:
+        config = EmulatorConfig(
+            latency=args.latency,
+            ttft_fraction=args.ttft_fraction,
+            stream_chunks=args.stream_chunks,
+            rate_limit_rate=args.rate_limit_rate,
+            error_rate=args.error_rate,
+            malformed_rate=args.malformed_rate,
+            stream_break_rate=args.stream_break_rate,
+            seed=args.seed
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    
+    print(f"🧪 AI emulator on http://{args.host}:{args.port} ({json.dumps(config.as_dict())})")
+    print(f"   Run the app with AI_EMULATOR_URL=http://{args.host}:{args.port}")
+    create_emulator_app(config).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -118,6 +118,12 @@ def create_app(config_name=None):
             else:
                 app.logger.info(f"✅ All required database tables exist ({len(existing_tables)} tables)")
             
+            # Add and backfill columns newer than the existing tables
+            try:
+                db_manager.upgrade_schema()
+            except Exception as upgrade_error:
+                app.logger.error(f"❌ Schema upgrade failed: {upgrade_error}", exc_info=True)
+            
             # Ensure at least one user exists (for open access mode)
             try:
                 from app.models import User
@@ -163,6 +169,13 @@ def create_app(config_name=None):
             # Log warning but don't fail - tables might already exist or DB might not be ready yet
             app.logger.warning(f"Database initialization check: {e} (this is OK if tables already exist)")
     
+    # Load the embedding model now rather than inside the first note's request
+    try:
+        from app.utils.chromadb_client import start_embedding_model
+        start_embedding_model()
+    except Exception as e:
+        app.logger.warning(f"Embedding model preload not started: {e}")
+    
     # Register blueprints
     from app.api import contacts, notes, auth
     app.register_blueprint(auth.auth_bp, url_prefix='/api/auth')
@@ -199,18 +212,77 @@ def create_app(config_name=None):
         """Check AI service configuration and availability"""
         try:
             from flask import jsonify
-            from app.services.ai_service import AIService
-            ai_service = AIService()
+            from app.services.ai_service import get_ai_service
+            ai_service = get_ai_service()
             
             status = {
                 'gemini_configured': bool(ai_service.gemini_api_key),
                 'openai_configured': bool(ai_service.openai_api_key),
                 'ai_available': bool(ai_service.gemini_api_key or ai_service.openai_api_key),
                 'gemini_model': ai_service.gemini_model if ai_service.gemini_api_key else None,
+                'emulator_url': ai_service.emulator_url,
                 'using_fallback': not (ai_service.gemini_api_key or ai_service.openai_api_key),
                 'message': 'AI services configured' if (ai_service.gemini_api_key or ai_service.openai_api_key) else '⚠️ No AI API keys configured - using fallback keyword matching'
             }
             
+            from app.utils.analysis_cache import get_analysis_cache
+            analysis_cache = get_analysis_cache()
+            status['analysis_cache'] = analysis_cache.stats() if analysis_cache else {'enabled': False}
+            
+            from app.utils.rate_limiter import get_rate_limiter
+            status['rate_limits'] = {}
+            if ai_service.gemini_api_key:
+                status['rate_limits']['gemini'] = get_rate_limiter('gemini').status()
+            if ai_service.openai_api_key:
+                status['rate_limits']['openai'] = get_rate_limiter('openai').status()
+            
+            from app.utils.circuit_breaker import get_circuit_breaker
+            status['circuit_breakers'] = {
+                provider: get_circuit_breaker(provider).snapshot()
+                for provider, _ in ai_service._providers()
+            }
+            
+            from app.utils.latency import get_latency_histogram
+            status['hedging'] = {'enabled': ai_service.hedging_enabled}
+            status['provider_latency'] = {}
+            for provider, _ in ai_service._providers():
+                latency = get_latency_histogram(provider).snapshot()
+                latency.pop('buckets')
+                latency.pop('sum_ms')
+                latency['hedge_delay_ms'] = round(ai_service.hedge_delay_seconds(provider) * 1000)
+                status['provider_latency'][provider] = latency
+            
+            from app.services.local_classifier import get_local_classifier
+            classifier = get_local_classifier()
+            status['local_classifier'] = {
+                'loaded': classifier is not None,
+                'categories': classifier.labels if classifier else [],
+                'trained_at': classifier.metadata.get('trained_at') if classifier else None,
+                'validation_accuracy': classifier.metadata.get('validation_accuracy') if classifier else None,
+                'min_confidence': ai_service.local_classifier_min_confidence,
+            }
+            
+            from app.utils.chromadb_client import get_collection_mode, get_collection_cache, get_embedding_cache, get_embedding_model
+            from app.utils.vector_writer import write_behind_enabled, get_vector_writer
+            status['vector_store'] = {
+                'collection_mode': get_collection_mode(),
+                'collection_cache': get_collection_cache().stats(),
+                'write_behind': get_vector_writer().stats() if write_behind_enabled() else {'enabled': False},
+            }
+            embedding_model = get_embedding_model()
+            status['vector_store']['embedding_model'] = embedding_model.stats() if embedding_model else {'custom': os.getenv('EMBEDDING_FUNCTION')}
+            embedding_cache = get_embedding_cache()
+            status['vector_store']['embedding_cache'] = embedding_cache.stats() if embedding_cache else {'enabled': False}
+            from app.utils.hybrid_retriever import get_hybrid_retriever
+            retriever = get_hybrid_retriever()
+            status['vector_store']['hybrid_retrieval'] = retriever.stats() if retriever else {'enabled': False}
+            
+            # Streaming endpoint: request start to first category on the wire
+            ttfc = get_latency_histogram('time_to_first_category').snapshot()
+            ttfc.pop('buckets')
+            ttfc.pop('sum_ms')
+            status['time_to_first_category'] = ttfc
+            
             return jsonify(status), 200
         except Exception as e:
             app.logger.error(f"AI status check failed: {e}")
@@ -220,6 +292,49 @@ def create_app(config_name=None):
                 'ai_available': False
             }), 500
     
+    # AI metrics endpoint (aggregated over all workers on this host)
+    @app.route('/api/ai/metrics', methods=['GET'])
+    def ai_metrics():
+        """Per-provider call counts, latency and token histograms, retries and fallback/repair rates"""
+        from flask import jsonify
+        try:
+            from app.utils.metrics import get_metrics, counter_total
+            metrics = get_metrics().aggregate()
+            
+            analyses = counter_total(metrics, 'ai_analyses')
+            offline = counter_total(metrics, 'ai_analyses', source='local_classifier') + counter_total(metrics, 'ai_analyses', source='keywords')
+            parsed = counter_total(metrics, 'ai_json_parse')
+            repaired = counter_total(metrics, 'ai_json_parse', result='repaired')
+            collection_lookups = counter_total(metrics, 'chroma_collection_cache')
+            embedding_lookups = counter_total(metrics, 'embedding_cache')
+            retrievals = counter_total(metrics, 'rag_retrievals')
+            metrics['rates'] = {
+                'offline_fallback': round(offline / analyses, 4) if analyses else None,
+                'cache_hit': round(counter_total(metrics, 'ai_analyses', source='cache') / analyses, 4) if analyses else None,
+                'json_repair': round(repaired / parsed, 4) if parsed else None,
+                'json_parse_failure': round(counter_total(metrics, 'ai_json_parse', result='failed') / parsed, 4) if parsed else None,
+                'collection_cache_hit': round(counter_total(metrics, 'chroma_collection_cache', result='hit') / collection_lookups, 4) if collection_lookups else None,
+                'embedding_cache_hit': round(counter_total(metrics, 'embedding_cache', result='hit') / embedding_lookups, 4) if embedding_lookups else None,
+                'rag_retrieval_degraded': round(counter_total(metrics, 'rag_retrieval_degraded') / retrievals, 4) if retrievals else None,
+            }
+            
+            # Optional cost estimate, e.g. GEMINI_INPUT_COST_PER_MTOK=0.10 GEMINI_OUTPUT_COST_PER_MTOK=0.40
+            metrics['estimated_cost_usd'] = {}
+            for provider in ('gemini', 'openai'):
+                input_cost = float(os.getenv(f'{provider.upper()}_INPUT_COST_PER_MTOK', 0))
+                output_cost = float(os.getenv(f'{provider.upper()}_OUTPUT_COST_PER_MTOK', 0))
+                if input_cost or output_cost:
+                    prompt_tokens = counter_total(metrics, 'ai_tokens', provider=provider, kind='prompt')
+                    completion_tokens = counter_total(metrics, 'ai_tokens', provider=provider, kind='completion')
+                    metrics['estimated_cost_usd'][provider] = round(
+                        (prompt_tokens * input_cost + completion_tokens * output_cost) / 1e6, 4
+                    )
+            
+            return jsonify(metrics), 200
+        except Exception as e:
+            app.logger.error(f"AI metrics collection failed: {e}")
+            return jsonify({'error': str(e)}), 500
+    
     # Login route - redirect to main app (login disabled)
     @app.route('/login')
     def login_route():
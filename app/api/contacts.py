@@ -8,6 +8,7 @@ from flask_login import current_user
 from app.services.contact_service import ContactService
 from app.utils.database import DatabaseManager
 from app.models import Contact, RawNote, SynthesizedEntry
+import os
 import logging
 
 logger = logging.getLogger(__name__)
@@ -689,12 +690,173 @@ def check_similar_names():
         return jsonify({'error': 'Failed to check similar names', 'details': str(e)}), 500
 
 
+def _lexical_matches(session, user_id, query):
+    """Contacts of a user matching ``query`` in their name, category content or notes
+    
+    Returns:
+        dict: contact_id -> {'contact', 'matches', 'score'}
+    """
+    # Search pattern (case-insensitive)
+    search_pattern = f'%{query}%'
+    
+    # 1. Search by contact name (highest priority)
+    try:
+        name_matches = session.query(Contact).filter(
+            Contact.user_id == user_id,
+            Contact.full_name.ilike(search_pattern)
+        ).all()
+        logger.debug(f"Name matches: {len(name_matches)}")
+    except Exception as e:
+        logger.error(f"Error in name search: {e}", exc_info=True)
+        name_matches = []
+    
+    # 2. Search in category content
+    try:
+        category_matches = session.query(Contact).join(
+            SynthesizedEntry, Contact.id == SynthesizedEntry.contact_id
+        ).filter(
+            Contact.user_id == user_id,
+            SynthesizedEntry.content.ilike(search_pattern)
+        ).distinct().all()
+        logger.debug(f"Category matches: {len(category_matches)}")
+    except Exception as e:
+        logger.error(f"Error in category search: {e}", exc_info=True)
+        category_matches = []
+    
+    # 3. Search in audit trail (raw notes)
+    try:
+        note_matches = session.query(Contact).join(
+            RawNote, Contact.id == RawNote.contact_id
+        ).filter(
+            Contact.user_id == user_id,
+            RawNote.content.ilike(search_pattern)
+        ).distinct().all()
+        logger.debug(f"Note matches: {len(note_matches)}")
+    except Exception as e:
+        logger.error(f"Error in note search: {e}", exc_info=True)
+        note_matches = []
+    
+    # Combine all matches and build results with match context
+    contact_results = {}
+    
+    # Process name matches (score: 100)
+    for contact in name_matches:
+        if contact.id not in contact_results:
+            contact_results[contact.id] = {
+                'contact': contact,
+                'matches': [],
+                'score': 0
+            }
+        contact_results[contact.id]['matches'].append({
+            'type': 'name',
+            'category': None,
+            'snippet': contact.full_name
+        })
+        contact_results[contact.id]['score'] += 100
+    
+    # Process category matches (score: 50)
+    for contact in category_matches:
+        if contact.id not in contact_results:
+            contact_results[contact.id] = {
+                'contact': contact,
+                'matches': [],
+                'score': 0
+            }
+        
+        # Get matching entries for this contact
+        matching_entries = session.query(SynthesizedEntry).filter(
+            SynthesizedEntry.contact_id == contact.id,
+            SynthesizedEntry.content.ilike(search_pattern)
+        ).all()
+        
+        for entry in matching_entries:
+            # Create snippet (50 chars before and after match)
+            content = entry.content
+            match_pos = content.lower().find(query.lower())
+            if match_pos >= 0:
+                start = max(0, match_pos - 30)
+                end = min(len(content), match_pos + len(query) + 30)
+                snippet = content[start:end]
+                if start > 0:
+                    snippet = '...' + snippet
+                if end < len(content):
+                    snippet = snippet + '...'
+            else:
+                snippet = content[:80] + '...' if len(content) > 80 else content
+            
+            contact_results[contact.id]['matches'].append({
+                'type': 'category',
+                'category': entry.category,
+                'snippet': snippet
+            })
+            contact_results[contact.id]['score'] += 50
+    
+    # Process audit trail matches (score: 25)
+    for contact in note_matches:
+        if contact.id not in contact_results:
+            contact_results[contact.id] = {
+                'contact': contact,
+                'matches': [],
+                'score': 0
+            }
+        
+        # Get matching notes for this contact
+        matching_notes = session.query(RawNote).filter(
+            RawNote.contact_id == contact.id,
+            RawNote.content.ilike(search_pattern)
+        ).all()
+        
+        for note in matching_notes:
+            # Create snippet
+            content = note.content
+            match_pos = content.lower().find(query.lower())
+            if match_pos >= 0:
+                start = max(0, match_pos - 30)
+                end = min(len(content), match_pos + len(query) + 30)
+                snippet = content[start:end]
+                if start > 0:
+                    snippet = '...' + snippet
+                if end < len(content):
+                    snippet = snippet + '...'
+            else:
+                snippet = content[:80] + '...' if len(content) > 80 else content
+            
+            contact_results[contact.id]['matches'].append({
+                'type': 'note',
+                'category': None,
+                'snippet': snippet,
+                'source': note.source
+            })
+            contact_results[contact.id]['score'] += 25
+    return contact_results
+
+
+def _format_results(contact_results):
+    """Search results sorted by score, then name, in the format static/js/modules/search.js renders"""
+    # Sort by score (descending), then by name
+    sorted_results = sorted(
+        contact_results.values(),
+        key=lambda x: (-x['score'], x['contact'].full_name.lower())
+    )
+    
+    # Format results
+    results = []
+    for result in sorted_results:
+        contact = result['contact']
+        results.append({
+            'id': contact.id,
+            'full_name': contact.full_name,
+            'tier': contact.tier,
+            'matches': result['matches'],
+            'score': result['score']
+        })
+    return results
+
+
 @contacts_bp.route('/search', methods=['GET'])
 def search_contacts():
     """Search contacts by name, category content, or audit trail"""
     try:
-        from sqlalchemy import or_, func
-        
         # Get user_id first and handle errors
         try:
             user_id = get_user_id()
@@ -713,166 +875,111 @@ def search_contacts():
         
         db_manager = DatabaseManager()
         with db_manager.get_session() as session:
-            # Search pattern (case-insensitive)
-            search_pattern = f'%{query}%'
-            
-            # 1. Search by contact name (highest priority)
-            try:
-                name_matches = session.query(Contact).filter(
-                    Contact.user_id == user_id,
-                    Contact.full_name.ilike(search_pattern)
-                ).all()
-                logger.debug(f"Name matches: {len(name_matches)}")
-            except Exception as e:
-                logger.error(f"Error in name search: {e}", exc_info=True)
-                name_matches = []
-            
-            # 2. Search in category content
-            try:
-                category_matches = session.query(Contact).join(
-                    SynthesizedEntry, Contact.id == SynthesizedEntry.contact_id
-                ).filter(
-                    Contact.user_id == user_id,
-                    SynthesizedEntry.content.ilike(search_pattern)
-                ).distinct().all()
-                logger.debug(f"Category matches: {len(category_matches)}")
-            except Exception as e:
-                logger.error(f"Error in category search: {e}", exc_info=True)
-                category_matches = []
-            
-            # 3. Search in audit trail (raw notes)
-            try:
-                note_matches = session.query(Contact).join(
-                    RawNote, Contact.id == RawNote.contact_id
-                ).filter(
-                    Contact.user_id == user_id,
-                    RawNote.content.ilike(search_pattern)
-                ).distinct().all()
-                logger.debug(f"Note matches: {len(note_matches)}")
-            except Exception as e:
-                logger.error(f"Error in note search: {e}", exc_info=True)
-                note_matches = []
-            
-            # Combine all matches and build results with match context
-            contact_results = {}
-            
-            # Process name matches (score: 100)
-            for contact in name_matches:
-                if contact.id not in contact_results:
-                    contact_results[contact.id] = {
-                        'contact': contact,
-                        'matches': [],
-                        'score': 0
-                    }
-                contact_results[contact.id]['matches'].append({
-                    'type': 'name',
-                    'category': None,
-                    'snippet': contact.full_name
-                })
-                contact_results[contact.id]['score'] += 100
-            
-            # Process category matches (score: 50)
-            for contact in category_matches:
-                if contact.id not in contact_results:
-                    contact_results[contact.id] = {
-                        'contact': contact,
-                        'matches': [],
-                        'score': 0
-                    }
-                
-                # Get matching entries for this contact
-                matching_entries = session.query(SynthesizedEntry).filter(
-                    SynthesizedEntry.contact_id == contact.id,
-                    SynthesizedEntry.content.ilike(search_pattern)
-                ).all()
-                
-                for entry in matching_entries:
-                    # Create snippet (50 chars before and after match)
-                    content = entry.content
-                    match_pos = content.lower().find(query.lower())
-                    if match_pos >= 0:
-                        start = max(0, match_pos - 30)
-                        end = min(len(content), match_pos + len(query) + 30)
-                        snippet = content[start:end]
-                        if start > 0:
-                            snippet = '...' + snippet
-                        if end < len(content):
-                            snippet = snippet + '...'
-                    else:
-                        snippet = content[:80] + '...' if len(content) > 80 else content
-                    
-                    contact_results[contact.id]['matches'].append({
-                        'type': 'category',
-                        'category': entry.category,
-                        'snippet': snippet
-                    })
-                    contact_results[contact.id]['score'] += 50
+            results = _format_results(_lexical_matches(session, user_id, query))
+            
+            logger.info(f"Search '{query}' found {len(results)} contacts")
+            return jsonify({
+                'results': results,
+                'query': query,
+                'count': len(results)
+            }), 200
             
-            # Process audit trail matches (score: 25)
-            for contact in note_matches:
-                if contact.id not in contact_results:
+    except Exception as e:
+        current_app.logger.error(f"Error searching contacts: {e}", exc_info=True)
+        return jsonify({'error': 'Failed to search contacts', 'details': str(e)}), 500
+
+
+def _note_snippet(content, length=120):
+    return content[:length] + '...' if len(content) > length else content
+
+
+@contacts_bp.route('/search/semantic', methods=['GET'])
+def semantic_search_contacts():
+    """Search contacts by meaning across all their notes, merged with the lexical matches
+    
+    The query is embedded and matched against the note vectors of every contact of the
+    user. Each contact with notes scoring at least SEMANTIC_SEARCH_MIN_SCORE (cosine
+    similarity, default 0.3) gets up to three 'semantic' matches, and its best
+    similarity adds up to 40 to its score, so name and category matches still rank
+    first. If the vector store fails, the lexical results are returned alone.
+    
+    Query params:
+        q: Search text
+        limit: Note vectors to retrieve (default: 20, max: 100)
+    """
+    try:
+        try:
+            user_id = get_user_id()
+            logger.info(f"Semantic search request - user_id={user_id}, query='{request.args.get('q', '')}'")
+        except Exception as user_error:
+            current_app.logger.error(f"Failed to get user_id for search: {user_error}", exc_info=True)
+            return jsonify({
+                'error': 'Database error: Could not get user account',
+                'details': str(user_error)
+            }), 500
+        
+        query = request.args.get('q', '').strip()
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        
+        if not query:
+            return jsonify({'results': [], 'query': query, 'count': 0, 'semantic_notes': 0}), 200
+        
+        db_manager = DatabaseManager()
+        with db_manager.get_session() as session:
+            contact_results = _lexical_matches(session, user_id, query)
+            
+            # One or two characters carry no meaning to embed
+            hits = []
+            if len(query) >= 3:
+                try:
+                    from app.utils.chromadb_client import search_user_notes
+                    contact_ids = [contact_id for (contact_id,) in
+                                   session.query(Contact.id).filter(Contact.user_id == user_id).all()]
+                    hits = search_user_notes(user_id, query, contact_ids, n_results=limit)
+                except Exception as e:
+                    logger.warning(f"Semantic search failed, returning lexical matches only: {e}")
+            
+            min_score = float(os.getenv('SEMANTIC_SEARCH_MIN_SCORE', 0.3))
+            hits_by_contact = {}
+            for hit in hits:
+                if hit['score'] >= min_score:
+                    hits_by_contact.setdefault(hit['contact_id'], []).append(hit)
+            
+            new_ids = [contact_id for contact_id in hits_by_contact if contact_id not in contact_results]
+            if new_ids:
+                for contact in session.query(Contact).filter(Contact.id.in_(new_ids)).all():
                     contact_results[contact.id] = {
                         'contact': contact,
                         'matches': [],
                         'score': 0
                     }
-                
-                # Get matching notes for this contact
-                matching_notes = session.query(RawNote).filter(
-                    RawNote.contact_id == contact.id,
-                    RawNote.content.ilike(search_pattern)
-                ).all()
-                
-                for note in matching_notes:
-                    # Create snippet
-                    content = note.content
-                    match_pos = content.lower().find(query.lower())
-                    if match_pos >= 0:
-                        start = max(0, match_pos - 30)
-                        end = min(len(content), match_pos + len(query) + 30)
-                        snippet = content[start:end]
-                        if start > 0:
-                            snippet = '...' + snippet
-                        if end < len(content):
-                            snippet = snippet + '...'
-                    else:
-                        snippet = content[:80] + '...' if len(content) > 80 else content
-                    
-                    contact_results[contact.id]['matches'].append({
-                        'type': 'note',
+            
+            # Hits arrive best first, so each contact's first hit is its best
+            for contact_id, contact_hits in hits_by_contact.items():
+                if contact_id not in contact_results:
+                    continue
+                for hit in contact_hits[:3]:
+                    contact_results[contact_id]['matches'].append({
+                        'type': 'semantic',
                         'category': None,
-                        'snippet': snippet,
-                        'source': note.source
+                        'snippet': _note_snippet(hit['document']),
+                        'note_id': hit['note_id'],
+                        'similarity': hit['score']
                     })
-                    contact_results[contact.id]['score'] += 25
-            
-            # Sort by score (descending), then by name
-            sorted_results = sorted(
-                contact_results.values(),
-                key=lambda x: (-x['score'], x['contact'].full_name.lower())
-            )
+                contact_results[contact_id]['score'] += round(40 * contact_hits[0]['score'])
             
-            # Format results
-            results = []
-            for result in sorted_results:
-                contact = result['contact']
-                results.append({
-                    'id': contact.id,
-                    'full_name': contact.full_name,
-                    'tier': contact.tier,
-                    'matches': result['matches'],
-                    'score': result['score']
-                })
+            results = _format_results(contact_results)
             
-            logger.info(f"Search '{query}' found {len(results)} contacts")
+            logger.info(f"Semantic search '{query}' found {len(results)} contacts ({len(hits)} note vectors)")
             return jsonify({
                 'results': results,
                 'query': query,
-                'count': len(results)
+                'count': len(results),
+                'semantic_notes': sum(len(contact_hits) for contact_hits in hits_by_contact.values())
             }), 200
-            
+    
     except Exception as e:
-        current_app.logger.error(f"Error searching contacts: {e}", exc_info=True)
+        current_app.logger.error(f"Error in semantic search: {e}", exc_info=True)
         return jsonify({'error': 'Failed to search contacts', 'details': str(e)}), 500
 
 
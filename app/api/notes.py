@@ -3,9 +3,10 @@ Notes API
 API endpoints for note processing and analysis
 """
 
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_login import current_user
-from app.services.note_service import NoteService
+from app.services.note_service import get_note_service
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -90,7 +91,7 @@ def process_note():
         except (ValueError, TypeError):
             return jsonify({"error": "contact_id must be a valid integer"}), 400
         
-        note_service = NoteService()
+        note_service = get_note_service()
         result = note_service.process_note(
             contact_id=contact_id,
             content=raw_note_text.strip(),
@@ -106,11 +107,69 @@ def process_note():
         return jsonify({"error": "Failed to process note"}), 500
 
 
+def _sse(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@notes_bp.route('/process-note/stream', methods=['POST'])
+def process_note_stream():
+    """Process a note, streaming categories to the client as server-sent events"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        raw_note_text = data.get('note') or data.get('note_text') or ''
+        contact_id = data.get('contact_id')
+        
+        if not raw_note_text or not raw_note_text.strip():
+            return jsonify({"error": "Valid note text is required"}), 400
+        
+        if not contact_id:
+            return jsonify({"error": "Valid contact_id is required"}), 400
+        
+        try:
+            contact_id = int(contact_id)
+        except (ValueError, TypeError):
+            return jsonify({"error": "contact_id must be a valid integer"}), 400
+        
+        note_service = get_note_service()
+        events = note_service.process_note_stream(
+            contact_id=contact_id,
+            content=raw_note_text.strip(),
+            user_id=get_user_id()
+        )
+        # Pull the first event now so a missing contact is still a plain 404
+        first_event = next(events)
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        current_app.logger.error(f"Error processing note: {e}", exc_info=True)
+        return jsonify({"error": "Failed to process note"}), 500
+    
+    def generate():
+        yield _sse(first_event['event'], first_event['data'])
+        try:
+            for event in events:
+                yield _sse(event['event'], event['data'])
+        except Exception as e:
+            logger.error(f"Error streaming note for contact {contact_id}: {e}", exc_info=True)
+            yield _sse('error', {"error": "Failed to process note"})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @notes_bp.route('/contact/<int:contact_id>', methods=['GET'])
 def get_notes(contact_id):
     """Get all notes for a contact"""
     try:
-        note_service = NoteService()
+        note_service = get_note_service()
         result = note_service.get_notes_for_contact(contact_id, get_user_id())
         return jsonify(result), 200
         
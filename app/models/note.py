@@ -4,12 +4,17 @@ RawNote: Original notes from user
 SynthesizedEntry: AI-extracted categories (one row per category)
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from app.utils.database import Base
+from app.utils.hashing import note_fingerprint
 from datetime import datetime
 
 
+def _content_fingerprint(context):
+    return note_fingerprint(context.get_current_parameters()['content'])
+
+
 class RawNote(Base):
     """Raw note model - stores original notes"""
     __tablename__ = 'raw_notes'
@@ -19,8 +24,13 @@ class RawNote(Base):
     content = Column(Text, nullable=False)
     source = Column(String(50), default='manual')  # 'manual', 'telegram', 'voice', 'file', 'ui_edit'
     metadata_tags = Column(JSON, nullable=True)  # For audit trail and metadata
+    content_hash = Column(String(64), nullable=True, default=_content_fingerprint)  # note_fingerprint(content), for deduplication
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        Index('ix_raw_notes_contact_content_hash', 'contact_id', 'content_hash'),
+    )
+    
     # Relationships
     contact = relationship("Contact", back_populates="raw_notes")
     synthesized_entries = relationship("SynthesizedEntry", back_populates="raw_note", cascade="all, delete-orphan")
@@ -4,31 +4,47 @@ Unified AI analysis service with Gemini (preferred) and OpenAI fallback
 """
 
 import os
-import json
 import logging
 import time
+from concurrent.futures import wait, FIRST_COMPLETED
 from typing import Dict, Any, Optional
+from app.services.prompt_builder import get_prompt_builder, PROMPT_VERSION
+from app.services.local_classifier import get_local_classifier
+from app.utils.analysis_cache import get_analysis_cache
+from app.utils.ai_clients import get_gemini_model, openai_chat_completion, openai_chat_completion_stream, get_emulator_url
+from app.utils.rate_limiter import get_rate_limiter, is_rate_limit_error, RateLimitExceeded
+from app.utils.circuit_breaker import get_circuit_breaker
+from app.utils.latency import get_latency_histogram
+from app.utils.metrics import get_metrics
+from app.utils.executor import get_executor
+from app.utils.json_stream import CategoryStreamParser
+from app.utils.json_repair import parse_llm_json
+from app.utils.keyword_matcher import get_keyword_matcher
 
 logger = logging.getLogger(__name__)
 
-CATEGORY_DEFINITIONS = """
-- Actionable: Immediate tasks, follow-ups, reminders, requests, or discussion topics requiring attention within days or weeks.
-- Goals: Clearly defined aspirations and objectives across all life domains, including short-term targets (3-12 months), medium-term goals (1-5 years), and long-term visions (5+ years).
-- Relationship_Strategy: Structured approaches to nurturing, deepening, or improving your relationship with specific tactics for connection and support.
-- Social: Comprehensive mapping of their social ecosystem including family dynamics, friendship networks, romantic relationships, professional connections, community involvement.
-- Professional_Background: Detailed career history and occupational profile including employment timeline, educational credentials, skill inventory, achievement record. **IMPORTANT: Education information (degrees, universities, schools) should be categorized under Professional_Background, NOT as a separate "Education" category.**
-- Financial_Situation: Comprehensive portrait of their economic circumstances, money management approach, and financial outlook.
-- Wellbeing: Holistic health status encompassing physical, mental, emotional, and spiritual dimensions.
-- Avocation: Comprehensive inventory of non-professional interests, passions, and recreational activities. This includes hobbies, leisure activities, creative pursuits, sports, games, collections, and any activities done for enjoyment outside of work (e.g., cooking, reading, gardening, music, art, travel, etc.).
-- Environment_And_Lifestyle: Detailed portrait of their daily living context and routine patterns.
-- Psychology_And_Values: In-depth profile of their mental frameworks, belief systems, and guiding principles.
-- Communication_Style: Comprehensive analysis of their interpersonal communication patterns and preferences across all contexts.
-- Challenges_And_Development: Nuanced exploration of their struggles, growth areas, and evolution across personal and professional domains.
-- Deeper_Insights: Profound observations about their core essence, philosophical outlook, and unique qualities that transcend conventional categorization.
-- Admin_matters: Administrative details including important dates, birthdays, anniversaries, and other key information to track.
-- Others: Any other important information that doesn't fit into the categories above.
-"""
+_ai_service = None
+
+# Completion tokens reserved per call when sizing token-per-minute budgets
+EXPECTED_COMPLETION_TOKENS = int(os.getenv('AI_EXPECTED_COMPLETION_TOKENS', 1024))
+
+# Longest a request may sleep for rate-limit budget; beyond this it fails over instead
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv('AI_RATE_LIMIT_MAX_WAIT', 1.0))
+
+# Ask providers for JSON output natively (disable for models without a JSON mode)
+JSON_MODE = os.getenv('AI_JSON_MODE', 'true').lower() not in ('0', 'false', 'no')
 
+# Use generation config to get cleaner JSON responses
+GEMINI_GENERATION_CONFIG = {
+    "temperature": 0.3,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+}
+if JSON_MODE:
+    GEMINI_GENERATION_CONFIG["response_mime_type"] = "application/json"
+
+OPENAI_RESPONSE_FORMAT = {"response_format": {"type": "json_object"}} if JSON_MODE else {}
 
 class AIService:
     """AI service for note analysis with Gemini and OpenAI support"""
@@ -36,241 +52,434 @@ class AIService:
     def __init__(self):
         self.gemini_api_key = os.getenv('GEMINI_API_KEY')
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
+        self.emulator_url = get_emulator_url()
+        if self.emulator_url:
+            # The emulator accepts any key; enable both providers unless one is explicitly disabled
+            self.gemini_api_key = self.gemini_api_key or 'emulator'
+            self.openai_api_key = self.openai_api_key or 'emulator'
+            logger.warning(f"🧪 AI_EMULATOR_URL is set - provider calls go to {self.emulator_url}")
         self.gemini_model = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash-exp')
+        self.openai_model = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+        
+        # Hedged requests: race a second provider when the first is unusually slow
+        self.hedging_enabled = os.getenv('AI_HEDGING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+        self.hedge_percentile = float(os.getenv('AI_HEDGE_PERCENTILE', 95))
+        self.hedge_min_samples = int(os.getenv('AI_HEDGE_MIN_SAMPLES', 20))
+        self.hedge_default_delay_ms = float(os.getenv('AI_HEDGE_DEFAULT_DELAY_MS', 4000))
+        self.hedge_min_delay_ms = float(os.getenv('AI_HEDGE_MIN_DELAY_MS', 500))
+        self.hedge_max_delay_ms = float(os.getenv('AI_HEDGE_MAX_DELAY_MS', 15000))
+        # Blocks the local classifier is less sure about than this go to keyword matching
+        self.local_classifier_min_confidence = float(os.getenv('LOCAL_CLASSIFIER_MIN_CONFIDENCE', 0.6))
+    
+    def _cache_model_key(self) -> str:
+        """Identify the provider/model chain that would answer, for cache keys"""
+        models = []
+        if self.gemini_api_key:
+            models.append(f"gemini:{self.gemini_model}")
+        if self.openai_api_key:
+            models.append(f"openai:{self.openai_model}")
+        if self.emulator_url:
+            models.append(f"emulator:{self.emulator_url}")
+        # The context budget changes what the model sees, so it is part of the key too
+        models.append(f"context:{get_prompt_builder().context_token_budget}")
+        return "|".join(models)
+    
+    def _providers(self):
+        """Configured providers in preference order, as (name, analyze function) pairs"""
+        providers = []
+        if self.gemini_api_key:
+            providers.append(('gemini', self._analyze_with_gemini))
+        if self.openai_api_key:
+            providers.append(('openai', self._analyze_with_openai))
+        return providers
+    
+    def _acquire_budget(self, provider: str, prompt_tokens: int):
+        """Reserve rate-limit budget for one call, waiting only if the shared queue allows it
+        
+        The wait runs on the calling (request or pipeline) thread, so it is capped at
+        AI_RATE_LIMIT_MAX_WAIT; a longer one raises RateLimitExceeded without taking the
+        reservation, and the next provider or offline analysis answers instead.
+        """
+        limiter = get_rate_limiter(provider)
+        estimated_tokens = prompt_tokens + EXPECTED_COMPLETION_TOKENS
+        wait = limiter.acquire(estimated_tokens, max_wait=RATE_LIMIT_MAX_WAIT_SECONDS)
+        if wait > 0:
+            time.sleep(wait)
+        return limiter, estimated_tokens
+    
+    def _log_token_usage(self, provider: str, stats: Dict[str, Any], prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        """Log and count per-call token usage (provider-reported where available, else our estimate)"""
+        metrics = get_metrics()
+        metrics.increment('ai_tokens', prompt_tokens if prompt_tokens is not None else stats['prompt_tokens'],
+                          provider=provider, kind='prompt', estimated=prompt_tokens is None)
+        metrics.observe('ai_prompt_tokens', prompt_tokens if prompt_tokens is not None else stats['prompt_tokens'], provider=provider)
+        metrics.increment('ai_tokens', stats['context_tokens'], provider=provider, kind='context', estimated=True)
+        if completion_tokens is not None:
+            metrics.increment('ai_tokens', completion_tokens, provider=provider, kind='completion', estimated=False)
+            metrics.observe('ai_completion_tokens', completion_tokens, provider=provider)
+        prompt_label = prompt_tokens if prompt_tokens is not None else f"~{stats['prompt_tokens']}"
+        completion_label = completion_tokens if completion_tokens is not None else '?'
+        logger.info(
+            f"📊 {provider} tokens: prompt={prompt_label} completion={completion_label} "
+            f"(context {stats['context_tokens']} tokens from {stats['context_chunks']} notes, "
+            f"{stats['context_chunks_dropped']} dropped)"
+        )
+    
+    def analyze_note(self, content: str, contact_name: str, context: Optional[str] = None,
+                     allow_offline: bool = True) -> Dict[str, Any]:
+        """Analyze note and extract structured categories
+        
+        Args:
+            allow_offline: Fall back to offline analysis when no provider answers; when
+                False, raise RuntimeError instead (e.g. so a reprocess keeps existing entries)
+        """
+        cache = get_analysis_cache() if (self.gemini_api_key or self.openai_api_key) else None
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(content, context, self._cache_model_key(), PROMPT_VERSION)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.info("✅ Analysis cache hit - skipping AI call")
+                get_metrics().increment('ai_analyses', source='cache', mode='sync')
+                return cached
         
-    def analyze_note(self, content: str, contact_name: str, context: Optional[str] = None) -> Dict[str, Any]:
-        """Analyze note and extract structured categories"""
         # Log which service will be used
         if not self.gemini_api_key and not self.openai_api_key:
-            logger.warning("⚠️ No AI API keys configured - using fallback keyword matching")
+            logger.warning("⚠️ No AI API keys configured - using offline analysis")
         elif self.gemini_api_key:
             logger.info("🤖 Using Gemini AI for analysis")
         elif self.openai_api_key:
             logger.info("🤖 Using OpenAI AI for analysis")
         
-        if self.gemini_api_key:
-            try:
-                result = self._analyze_with_gemini(content, contact_name, context)
-                logger.info("✅ Gemini analysis successful")
-                return result
-            except Exception as e:
-                logger.warning(f"Gemini analysis failed: {e}, trying OpenAI fallback")
+        providers = self._providers()
+        if self.hedging_enabled and len(providers) >= 2:
+            outcome = self._analyze_hedged(providers, content, contact_name, context)
+        else:
+            outcome = self._analyze_sequential(providers, content, contact_name, context)
         
-        if self.openai_api_key:
-            try:
-                result = self._analyze_with_openai(content, contact_name, context)
-                logger.info("✅ OpenAI analysis successful")
-                return result
-            except Exception as e:
-                logger.warning(f"OpenAI analysis failed: {e}, using local fallback")
-                # Don't return yet - try fallback below
+        if outcome is not None:
+            provider, result = outcome
+            logger.info(f"✅ {provider} analysis successful")
+            get_metrics().increment('ai_analyses', source=provider, mode='sync')
+            if cache is not None:
+                cache.set(cache_key, result)
+            return result
+        
+        if not allow_offline:
+            raise RuntimeError("No AI provider produced an analysis")
         
         # Only use fallback if both AI services failed or are unavailable
         if not self.gemini_api_key and not self.openai_api_key:
-            logger.warning("⚠️ No AI API keys configured - using fallback keyword matching")
+            logger.warning("⚠️ No AI API keys configured - using offline analysis")
         else:
-            logger.warning("⚠️ All AI services failed - using fallback keyword matching")
+            logger.warning("⚠️ All AI services failed or unavailable - using offline analysis")
+        return self.offline_analysis(content, contact_name)
+    
+    def offline_analysis(self, content: str, contact_name: str) -> Dict[str, Any]:
+        """Best analysis available without an AI provider: the local classifier, then keyword fallback"""
+        classifier = get_local_classifier()
+        if classifier is not None:
+            start = time.perf_counter()
+            categories = classifier.classify_note(content, min_confidence=self.local_classifier_min_confidence)
+            if categories:
+                logger.info(f"✅ Local classifier found {len(categories)} categories in {(time.perf_counter() - start) * 1000:.1f}ms")
+                get_metrics().increment('ai_analyses', source='local_classifier')
+                return self._remove_others_if_other_categories_exist({'categories': categories})
+            logger.info("Local classifier was not confident about any block - using keyword matching")
+        get_metrics().increment('ai_analyses', source='keywords')
         return self._fallback_analysis(content, contact_name)
     
-    def _analyze_with_gemini(self, content: str, contact_name: str, context: Optional[str] = None) -> Dict[str, Any]:
-        """Analyze note using Google Gemini"""
+    def _call_provider(self, provider: str, analyze, content: str, contact_name: str, context: Optional[str]) -> Dict[str, Any]:
+        """Call one provider, feeding its circuit breaker and latency histogram"""
+        breaker = get_circuit_breaker(provider)
+        start = time.perf_counter()
         try:
-            import google.generativeai as genai
-            genai.configure(api_key=self.gemini_api_key)
-            model = genai.GenerativeModel(self.gemini_model)
+            result = analyze(content, contact_name, context)
+        except Exception as e:
+            latency_ms = (time.perf_counter() - start) * 1000
+            if isinstance(e, RateLimitExceeded) or is_rate_limit_error(e):
+                # Quota pressure is handled by the rate limiter, not treated as ill health
+                breaker.record_ignored()
+                self._record_call(provider, 'rate_limited', latency_ms, 'sync')
+            else:
+                breaker.record_failure(latency_ms, e)
+                self._record_call(provider, 'error', latency_ms, 'sync')
+            logger.warning(f"{provider} analysis failed after {latency_ms:.0f}ms: {e}")
+            raise
+        latency_ms = (time.perf_counter() - start) * 1000
+        breaker.record_success(latency_ms)
+        get_latency_histogram(provider).record(latency_ms)
+        self._record_call(provider, 'success', latency_ms, 'sync')
+        return result
+    
+    def _record_call(self, provider: str, outcome: str, latency_ms: float, mode: str):
+        metrics = get_metrics()
+        metrics.increment('ai_calls', provider=provider, outcome=outcome, mode=mode)
+        metrics.observe('ai_call_latency_ms', latency_ms, provider=provider, outcome=outcome)
+    
+    def _analyze_sequential(self, providers, content: str, contact_name: str, context: Optional[str]):
+        """Try providers one after another, skipping those with an open circuit"""
+        failed = False
+        for provider, analyze in providers:
+            breaker = get_circuit_breaker(provider)
+            if not breaker.allow_request():
+                logger.warning(f"⏭️ Skipping {provider}: circuit is {breaker.state}")
+                continue
+            if failed:
+                get_metrics().increment('ai_retries', provider=provider, reason='failover')
+            try:
+                return provider, self._call_provider(provider, analyze, content, contact_name, context)
+            except Exception:
+                failed = True
+                continue
+        return None
+    
+    def hedge_delay_seconds(self, provider: str) -> float:
+        """How long to wait on ``provider`` before sending a hedge request to the next one
+        
+        Uses the configured percentile of the provider's observed latency, clamped to
+        [AI_HEDGE_MIN_DELAY_MS, AI_HEDGE_MAX_DELAY_MS]; AI_HEDGE_DEFAULT_DELAY_MS is used
+        until AI_HEDGE_MIN_SAMPLES calls have been observed.
+        """
+        histogram = get_latency_histogram(provider)
+        delay_ms = self.hedge_default_delay_ms
+        if histogram.count >= self.hedge_min_samples:
+            delay_ms = histogram.percentile(self.hedge_percentile) or delay_ms
+        return min(max(delay_ms, self.hedge_min_delay_ms), self.hedge_max_delay_ms) / 1000.0
+    
+    def _analyze_hedged(self, providers, content: str, contact_name: str, context: Optional[str]):
+        """Send to the primary provider; if it is slower than the hedge delay (or fails),
+        also send to the next healthy provider and take the first successful result
+        
+        As in _analyze_sequential, any response that parsed counts as a success, even
+        one with no categories."""
+        executor = get_executor('ai')
+        remaining = list(providers)
+        pending = {}
+        
+        def launch_next():
+            while remaining:
+                provider, analyze = remaining.pop(0)
+                breaker = get_circuit_breaker(provider)
+                if not breaker.allow_request():
+                    logger.warning(f"⏭️ Skipping {provider}: circuit is {breaker.state}")
+                    continue
+                future = executor.submit(self._call_provider, provider, analyze, content, contact_name, context)
+                pending[future] = provider
+                return provider
+            return None
+        
+        primary = launch_next()
+        if primary is None:
+            return None
+        delay = self.hedge_delay_seconds(primary)
+        hedged = False
+        
+        while pending:
+            timeout = None if hedged or not remaining else delay
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
             
-            context_section = ""
-            if context and context != "No relevant history found.":
-                context_section = f"""
-**Retrieved Relevant History (FOR REFERENCE ONLY - DO NOT RE-CATEGORIZE):**
-{context}
-
-IMPORTANT: The history above shows information that has ALREADY been categorized. Use it ONLY for:
-- Understanding context and maintaining consistency
-- Identifying if new information contradicts or updates old information
-- Building upon existing knowledge
-
-DO NOT extract or re-categorize any content from the history above. ONLY analyze the new note below.
-
-"""
+            if not done:
+                # Primary is slower than its hedge delay - race the next provider
+                hedged = True
+                hedge_provider = launch_next()
+                if hedge_provider:
+                    logger.info(f"⏱️ {primary} slower than {delay * 1000:.0f}ms - hedging with {hedge_provider}")
+                    get_metrics().increment('ai_retries', provider=hedge_provider, reason='hedge')
+                continue
             
-            prompt = f"""Analyze this note about {contact_name} and extract structured information.
-
-{context_section}**New Note to Analyze (ONLY EXTRACT FROM THIS SECTION):**
-{content}
-
-Categorize the content into these categories (only include if relevant):
-
-CATEGORY_DEFINITIONS:
-{CATEGORY_DEFINITIONS}
-
-CRITICAL: UNDERSTAND HIERARCHICAL STRUCTURE
-- When a header/title is followed by bullet points or a list, ALL items in that list inherit the context of the header
-- Example: "Hobbies\n- Cooking\n- Doing work" means BOTH "Cooking" AND "Doing work" are hobbies (Avocation category)
-- Example: "Goals\n- Learn Spanish\n- Travel to Japan" means BOTH are goals
-- Example: "Interests\n- Reading\n- Music" means BOTH are interests (Avocation)
-- Do NOT categorize items under a header separately - they all belong to the same category as the header
-
-EXAMPLES FOR CLARITY:
-- "Hobbies\n- Cooking\n- Doing work" → ALL should be "Avocation" (both cooking and doing work are hobbies in this context)
-- "Hobbies: Cooking, Reading" → Should be categorized as "Avocation" (not "Others")
-- "Likes playing guitar and painting" → Should be categorized as "Avocation"
-- "Goals\n- Learn coding\n- Start business" → ALL should be "Goals"
-- "Interests\n- Photography\n- Travel" → ALL should be "Avocation"
-
-Return a JSON response with this structure:
-{{
-    "categories": {{
-        "Actionable": {{"content": "specific factual information extracted", "confidence": 0.85}},
-        "Goals": {{"content": "specific factual information extracted", "confidence": 0.80}}
-    }}
-}}
-
-IMPORTANT:
-- Only include categories that have relevant content from the note
-- Extract specific, factual information - not interpretations
-- Confidence should be between 0.0 and 1.0 based on clarity of information
-- Be precise and concise in your extraction
-- **CRITICAL FORMATTING RULES:**
-  - PRESERVE ALL BULLET POINTS: If the input has bullet points (using `- `, `•`, `*`, `+`, or any list format), you MUST preserve them exactly as `- ` (dash-space) format in your output
-  - PRESERVE LINE BREAKS: Maintain all line breaks (`\n`) from the original text
-  - PRESERVE STRUCTURE: If the input has indented bullets, sub-bullets, or hierarchical lists, maintain that structure using `- ` for each level
-  - PRESERVE SECTIONS: If the input has headers, sections, or categories, maintain that organization
-  - PRESERVE HEADERS: If the input has section headers (like "Experience:", "Education:", job titles, etc.), keep them as separate lines with the same formatting
-  - PRESERVE JOB TITLES AND DATES: If the input has job titles with dates (e.g., "Manager: Jan 2020 - Dec 2022 • 2 yrs"), preserve this exact format
-  - PRESERVE HIERARCHY: Maintain the exact hierarchical structure - headers, sub-headers, job titles, descriptions, bullet points
-  - Use markdown formatting: `- ` for bullet points, `**text**` for bold, `\n` for line breaks
-  - DO NOT convert bullet points to paragraphs - keep them as lists
-  - DO NOT flatten structured content - preserve lists, sections, headers, and formatting exactly as they appear
-  - DO NOT merge separate lines into one paragraph - keep each line as a separate line
-
-NEGATIVE CONSTRAINTS (What NOT to do):
-- Do NOT infer feelings, emotions, or internal states not explicitly stated
-- Do NOT add information that is not present in the note text
-- Do NOT make assumptions about relationships beyond what is stated
-- Do NOT extrapolate future plans or intentions unless explicitly mentioned
-- Do NOT categorize information into multiple categories if it clearly belongs to one
-- Do NOT include generic or vague statements that don't add value
-- Do NOT flatten structured content into a single paragraph - preserve lists, sections, and formatting
-- **CRITICAL: Do NOT include "Others" category if ANY other category is present. "Others" should ONLY be used when the note truly does not fit into any of the main categories above.**
-
-Return ONLY the JSON response."""
+            for future in done:
+                provider = pending.pop(future)
+                if future.exception() is None:
+                    for loser in pending:
+                        # Running calls cannot be interrupted; their results are ignored
+                        loser.cancel()
+                    if hedged:
+                        logger.info(f"🏁 Hedged request won by {provider}")
+                    return provider, future.result()
+            
+            # Everything that finished failed - send the next provider straight away
+            if not pending:
+                hedged = True
+                next_provider = launch_next()
+                if next_provider:
+                    get_metrics().increment('ai_retries', provider=next_provider, reason='failover')
+        return None
+    
+    def stream_analyze_note(self, content: str, contact_name: str, context: Optional[str] = None):
+        """Analyze a note, yielding categories as soon as the provider finishes each one
+        
+        Yields ``('category', name, data)`` tuples and finally ``('result', result, provider)``
+        with the complete analysis. A provider that fails before producing a category is
+        skipped for the next one; a failure mid-stream ends with the categories seen so far.
+        """
+        cache = get_analysis_cache() if (self.gemini_api_key or self.openai_api_key) else None
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(content, context, self._cache_model_key(), PROMPT_VERSION)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.info("✅ Analysis cache hit - skipping AI call")
+                get_metrics().increment('ai_analyses', source='cache', mode='stream')
+                for name, data in cached.get('categories', {}).items():
+                    yield 'category', name, data
+                yield 'result', cached, 'cache'
+                return
+        
+        streamers = []
+        if self.gemini_api_key:
+            streamers.append(('gemini', self._stream_gemini))
+        if self.openai_api_key:
+            streamers.append(('openai', self._stream_openai))
+        
+        failed = False
+        for provider, stream in streamers:
+            breaker = get_circuit_breaker(provider)
+            if not breaker.allow_request():
+                logger.warning(f"⏭️ Skipping {provider}: circuit is {breaker.state}")
+                continue
+            if failed:
+                get_metrics().increment('ai_retries', provider=provider, reason='failover')
             
-            max_retries = 3
-            retry_delay = 2
-            for attempt in range(max_retries):
+            logger.info(f"🤖 Streaming {provider} analysis")
+            parser = CategoryStreamParser()
+            emitted = 0
+            start = time.perf_counter()
+            chunks = stream(content, contact_name, context)
+            outcome_recorded = False
+            try:
                 try:
-                    # Use generation config to get cleaner JSON responses
-                    generation_config = {
-                        "temperature": 0.3,
-                        "top_p": 0.95,
-                        "top_k": 40,
-                        "max_output_tokens": 8192,
-                    }
-                    response = model.generate_content(
-                        prompt,
-                        generation_config=generation_config
-                    )
-                    break
+                    for text in chunks:
+                        for name, data in parser.feed(text):
+                            emitted += 1
+                            yield 'category', name, data
                 except Exception as e:
-                    if "quota" in str(e).lower() or "429" in str(e) or "ResourceExhausted" in str(type(e).__name__):
-                        if attempt < max_retries - 1:
-                            logger.warning(f"Gemini API rate limit hit, retrying in {retry_delay}s")
-                            time.sleep(retry_delay)
-                            retry_delay *= 2
-                            continue
-                        else:
-                            raise Exception(f"Gemini API rate limit exceeded")
+                    outcome_recorded = True
+                    latency_ms = (time.perf_counter() - start) * 1000
+                    if isinstance(e, RateLimitExceeded) or is_rate_limit_error(e):
+                        breaker.record_ignored()
+                        self._record_call(provider, 'rate_limited', latency_ms, 'stream')
                     else:
-                        raise
-            
-            response_text = response.text.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.startswith('```'):
-                response_text = response_text[3:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            # Clean and fix JSON - handle newlines in string values
-            import re
-            response_text = response_text.strip()
-            
-            # Fix unescaped newlines in JSON string values
-            # This regex finds string values and replaces literal newlines with \n
-            def fix_json_newlines(text):
-                """Fix unescaped newlines in JSON string values"""
-                # Pattern to match string values in JSON (between quotes)
-                # This is a simplified approach - find content between quotes and fix newlines
-                result = []
-                in_string = False
-                escape_next = False
-                i = 0
+                        breaker.record_failure(latency_ms, e)
+                        self._record_call(provider, 'error', latency_ms, 'stream')
+                    if not emitted:
+                        logger.warning(f"{provider} stream failed after {latency_ms:.0f}ms: {e}")
+                        failed = True
+                        continue
+                    # Categories already reached the client - finish with what we have (uncached)
+                    logger.warning(f"{provider} stream broke after {emitted} categories: {e}")
+                    get_metrics().increment('ai_analyses', source=provider, mode='stream', partial=True)
+                    result = self._remove_others_if_other_categories_exist({'categories': dict(parser.categories)})
+                    yield 'result', result, provider
+                    return
                 
-                while i < len(text):
-                    char = text[i]
-                    
-                    if escape_next:
-                        result.append(char)
-                        escape_next = False
-                    elif char == '\\':
-                        result.append(char)
-                        escape_next = True
-                    elif char == '"' and not escape_next:
-                        result.append(char)
-                        in_string = not in_string
-                    elif in_string and char == '\n':
-                        # Replace literal newline with escaped newline
-                        result.append('\\n')
-                    elif in_string and char == '\r':
-                        # Replace carriage return
-                        result.append('\\r')
-                    elif in_string and char == '\t':
-                        # Replace tab with escaped tab
-                        result.append('\\t')
-                    else:
-                        result.append(char)
-                    i += 1
+                outcome_recorded = True
+                latency_ms = (time.perf_counter() - start) * 1000
+                if not parser.categories:
+                    breaker.record_failure(latency_ms, ValueError('no categories in streamed response'))
+                    self._record_call(provider, 'parse_failed', latency_ms, 'stream')
+                    get_metrics().increment('ai_json_parse', provider=provider, result='failed', mode='stream')
+                    logger.warning(f"{provider} stream returned no parseable categories")
+                    failed = True
+                    continue
+                breaker.record_success(latency_ms)
+                get_latency_histogram(provider).record(latency_ms)
+                self._record_call(provider, 'success', latency_ms, 'stream')
+                get_metrics().increment('ai_analyses', source=provider, mode='stream')
                 
-                return ''.join(result)
+                result = self._remove_others_if_other_categories_exist({'categories': dict(parser.categories)})
+                logger.info(f"✅ {provider} streamed analysis successful")
+                if cache is not None:
+                    cache.set(cache_key, result)
+                yield 'result', result, provider
+                return
+            finally:
+                if not outcome_recorded:
+                    # Closed mid-stream (the client disconnected): says nothing about the
+                    # provider's health, but a half-open probe slot must be given back
+                    chunks.close()
+                    breaker.record_ignored()
+                    self._record_call(provider, 'cancelled', (time.perf_counter() - start) * 1000, 'stream')
+        
+        logger.warning("⚠️ All AI services failed or unavailable - using offline analysis")
+        result = self.offline_analysis(content, contact_name)
+        for name, data in result['categories'].items():
+            yield 'category', name, data
+        yield 'result', result, 'offline'
+    
+    def _stream_gemini(self, content: str, contact_name: str, context: Optional[str] = None):
+        """Yield Gemini response text as it is generated"""
+        model = get_gemini_model(self.gemini_api_key, self.gemini_model)
+        prompt, stats = get_prompt_builder().gemini_prompt(content, contact_name, context)
+        limiter, estimated_tokens = self._acquire_budget('gemini', stats['prompt_tokens'])
+        try:
+            response = model.generate_content(
+                prompt,
+                generation_config=GEMINI_GENERATION_CONFIG,
+                stream=True
+            )
+            for chunk in response:
+                # Chunks without candidates (e.g. a final usage-only chunk) raise on .text
+                if chunk.candidates and chunk.candidates[0].content.parts:
+                    yield chunk.text
+        except Exception as e:
+            if is_rate_limit_error(e):
+                limiter.penalize()
+                raise Exception(f"Gemini API rate limit exceeded")
+            raise
+        limiter.record_success()
+        usage = getattr(response, 'usage_metadata', None)
+        limiter.record_usage(estimated_tokens, getattr(usage, 'total_token_count', None))
+        self._log_token_usage('gemini', stats, getattr(usage, 'prompt_token_count', None),
+                              getattr(usage, 'candidates_token_count', None))
+    
+    def _stream_openai(self, content: str, contact_name: str, context: Optional[str] = None):
+        """Yield OpenAI response text as it is generated"""
+        messages, stats = get_prompt_builder().openai_messages(content, contact_name, context)
+        limiter, _ = self._acquire_budget('openai', stats['prompt_tokens'])
+        try:
+            for text in openai_chat_completion_stream(
+                self.openai_api_key,
+                model=self.openai_model,
+                messages=messages,
+                temperature=0.3,
+                **OPENAI_RESPONSE_FORMAT
+            ):
+                yield text
+        except Exception as e:
+            if is_rate_limit_error(e):
+                limiter.penalize()
+            raise
+        limiter.record_success()
+        # Streamed responses carry no usage block, so only the prompt estimate is known
+        self._log_token_usage('openai', stats, None, None)
+    
+    def _analyze_with_gemini(self, content: str, contact_name: str, context: Optional[str] = None) -> Dict[str, Any]:
+        """Analyze note using Google Gemini"""
+        try:
+            model = get_gemini_model(self.gemini_api_key, self.gemini_model)
             
+            prompt, stats = get_prompt_builder().gemini_prompt(content, contact_name, context)
+            
+            limiter, estimated_tokens = self._acquire_budget('gemini', stats['prompt_tokens'])
             try:
-                # IMPORTANT: Fix newlines BEFORE removing control characters
-                # This ensures we escape newlines in string values first
-                cleaned = fix_json_newlines(response_text)
-                # Then remove other control characters (but keep already-escaped \n, \r, \t)
-                cleaned = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', cleaned)
-                result = json.loads(cleaned)
-            except json.JSONDecodeError as json_error:
-                logger.error(f"JSON decode error: {json_error}")
-                logger.error(f"Response text (first 1000 chars): {response_text[:1000]}")
-                
-                # Try alternative: use json5 or manual parsing
-                try:
-                    # Try to fix common JSON issues
-                    # Replace literal newlines in string values with \n
-                    fixed_text = response_text
-                    # Find all string values and escape newlines
-                    fixed_text = re.sub(r'(?<!\\)"(?:[^"\\]|\\.)*"', lambda m: m.group(0).replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t'), fixed_text, flags=re.DOTALL)
-                    result = json.loads(fixed_text)
-                    logger.info("Successfully fixed JSON by escaping newlines")
-                except:
-                    # Last resort: try to extract JSON from the response if it's embedded in text
-                    json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response_text, re.DOTALL)
-                    if json_match:
-                        try:
-                            extracted = json_match.group(0)
-                            # Fix newlines in extracted JSON
-                            extracted = fix_json_newlines(extracted)
-                            result = json.loads(extracted)
-                            logger.info("Successfully extracted and fixed JSON from response")
-                        except Exception as extract_error:
-                            logger.error(f"Failed to extract JSON: {extract_error}")
-                            raise json_error
-                    else:
-                        raise json_error
-            if 'categories' not in result:
-                result = {'categories': result}
+                response = model.generate_content(
+                    prompt,
+                    generation_config=GEMINI_GENERATION_CONFIG
+                )
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    # Shared backoff: every worker skips Gemini until the penalty expires
+                    limiter.penalize()
+                    raise Exception(f"Gemini API rate limit exceeded")
+                raise
+            limiter.record_success()
+            usage = getattr(response, 'usage_metadata', None)
+            limiter.record_usage(estimated_tokens, getattr(usage, 'total_token_count', None))
+            self._log_token_usage('gemini', stats, getattr(usage, 'prompt_token_count', None),
+                                  getattr(usage, 'candidates_token_count', None))
+            
+            result = self._parse_response('gemini', response.text)
             
             # Post-process: Remove "Others" if any other category exists
             result = self._remove_others_if_other_categories_exist(result)
@@ -285,164 +494,27 @@ Return ONLY the JSON response."""
     def _analyze_with_openai(self, content: str, contact_name: str, context: Optional[str] = None) -> Dict[str, Any]:
         """Analyze note using OpenAI"""
         try:
-            import openai
-            openai.api_key = self.openai_api_key
-            
-            context_section = ""
-            if context and context != "No relevant history found.":
-                context_section = f"""**Retrieved Relevant History (FOR REFERENCE ONLY - DO NOT RE-CATEGORIZE):**
-{context}
-
-IMPORTANT: The history above shows information that has ALREADY been categorized. Use it ONLY for:
-- Understanding context and maintaining consistency
-- Identifying if new information contradicts or updates old information
-- Building upon existing knowledge
-
-DO NOT extract or re-categorize any content from the history above. ONLY analyze the new note below.
-
-"""
-            
-            system_prompt = f"""You are an AI assistant that analyzes personal notes and extracts structured information into specific categories.
-
-Available categories:
-{CATEGORY_DEFINITIONS}
-
-Return ONLY a JSON object with this structure:
-{{
-    "categories": {{
-        "category_name": {{"content": "specific factual information", "confidence": 0.85}}
-    }}
-}}
-
-CRITICAL INSTRUCTION:
-- **ONLY extract information from the "New Note to Analyze" section in the user message**
-- **DO NOT extract or re-categorize any content from the "Retrieved Relevant History" section - that information has already been categorized**
-- The history is provided ONLY for context and consistency, not for re-categorization
-
-IMPORTANT FORMATTING RULES:
-- **CRITICAL: ONLY extract from the NEW note, not from the history section**
-- **CRITICAL FORMATTING RULES:**
-  - PRESERVE ALL BULLET POINTS: If the input has bullet points (using `- `, `•`, `*`, `+`, or any list format), you MUST preserve them exactly as `- ` (dash-space) format in your output
-  - PRESERVE LINE BREAKS: Maintain all line breaks (`\n`) from the original text
-  - PRESERVE STRUCTURE: If the input has indented bullets, sub-bullets, or hierarchical lists, maintain that structure using `- ` for each level
-  - PRESERVE SECTIONS: If the input has headers, sections, or categories, maintain that organization
-  - PRESERVE HEADERS: If the input has section headers (like "Experience:", "Education:", job titles, etc.), keep them as separate lines with the same formatting
-  - PRESERVE JOB TITLES AND DATES: If the input has job titles with dates (e.g., "Manager: Jan 2020 - Dec 2022 • 2 yrs"), preserve this exact format
-  - PRESERVE HIERARCHY: Maintain the exact hierarchical structure - headers, sub-headers, job titles, descriptions, bullet points
-  - Use markdown formatting: `- ` for bullet points, `**text**` for bold, `\n` for line breaks
-  - DO NOT convert bullet points to paragraphs - keep them as lists
-  - DO NOT flatten structured content - preserve lists, sections, headers, and formatting exactly as they appear
-  - DO NOT merge separate lines into one paragraph - keep each line as a separate line
-
-CRITICAL: UNDERSTAND HIERARCHICAL STRUCTURE
-- When a header/title is followed by bullet points or a list, ALL items in that list inherit the context of the header
-- Example: "Hobbies\n- Cooking\n- Doing work" means BOTH "Cooking" AND "Doing work" are hobbies (Avocation category)
-- Example: "Goals\n- Learn Spanish\n- Travel" means BOTH are goals
-- Example: "Interests\n- Reading\n- Music" means BOTH are interests (Avocation)
-- Do NOT categorize items under a header separately - they all belong to the same category as the header
-
-CRITICAL CATEGORIZATION RULE:
-- **Do NOT include "Others" category if ANY other category is present. "Others" should ONLY be used when the note truly does not fit into any of the main categories above. If you categorize the note into any main category (Actionable, Goals, Social, etc.), you must NOT also include "Others".**
-
-Only include categories with relevant content. Be factual and precise."""
-            
-            user_prompt = f"""{context_section}**New Note to Analyze (ONLY EXTRACT FROM THIS SECTION):**
-{content}
-
-Return ONLY the JSON response with categories extracted from the NEW note above. Do NOT include any information from the history section."""
+            messages, stats = get_prompt_builder().openai_messages(content, contact_name, context)
             
+            limiter, estimated_tokens = self._acquire_budget('openai', stats['prompt_tokens'])
             try:
-                from openai import OpenAI
-                client = OpenAI(api_key=self.openai_api_key)
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.3
+                response = openai_chat_completion(
+                    self.openai_api_key,
+                    model=self.openai_model,
+                    messages=messages,
+                    temperature=0.3,
+                    **OPENAI_RESPONSE_FORMAT
                 )
-                result_text = response.choices[0].message.content
-            except:
-                response = openai.ChatCompletion.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.3
-                )
-                result_text = response.choices[0].message.content
-            
-            result_text = result_text.strip()
-            if result_text.startswith('```json'):
-                result_text = result_text[7:]
-            if result_text.startswith('```'):
-                result_text = result_text[3:]
-            if result_text.endswith('```'):
-                result_text = result_text[:-3]
-            
-            # Use the same JSON fixing function as Gemini
-            def fix_json_newlines(text):
-                """Fix unescaped newlines in JSON string values"""
-                result = []
-                in_string = False
-                escape_next = False
-                i = 0
-                
-                while i < len(text):
-                    char = text[i]
-                    
-                    if escape_next:
-                        result.append(char)
-                        escape_next = False
-                    elif char == '\\':
-                        result.append(char)
-                        escape_next = True
-                    elif char == '"' and not escape_next:
-                        result.append(char)
-                        in_string = not in_string
-                    elif in_string and char == '\n':
-                        result.append('\\n')
-                    elif in_string and char == '\r':
-                        result.append('\\r')
-                    elif in_string and char == '\t':
-                        result.append('\\t')
-                    else:
-                        result.append(char)
-                    i += 1
-                
-                return ''.join(result)
-            
-            # Clean and fix JSON
-            import re
-            try:
-                # Fix newlines BEFORE removing control characters
-                cleaned = fix_json_newlines(result_text)
-                # Then remove other control characters
-                cleaned = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', cleaned)
-                result = json.loads(cleaned)
-            except json.JSONDecodeError as json_error:
-                logger.error(f"JSON decode error: {json_error}")
-                logger.error(f"Response text (first 1000 chars): {result_text[:1000]}")
-                # Try alternative fix
-                try:
-                    fixed_text = re.sub(r'(?<!\\)"(?:[^"\\]|\\.)*"', lambda m: m.group(0).replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t'), result_text, flags=re.DOTALL)
-                    result = json.loads(fixed_text)
-                    logger.info("Successfully fixed JSON by escaping newlines (regex method)")
-                except:
-                    json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', result_text, re.DOTALL)
-                    if json_match:
-                        try:
-                            extracted = fix_json_newlines(json_match.group(0))
-                            result = json.loads(extracted)
-                            logger.info("Successfully extracted and fixed JSON from response")
-                        except:
-                            raise json_error
-                    else:
-                        raise json_error
-            if 'categories' not in result:
-                result = {'categories': result}
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    limiter.penalize()
+                raise
+            limiter.record_success()
+            usage = getattr(response, 'usage', None)
+            limiter.record_usage(estimated_tokens, getattr(usage, 'total_tokens', None))
+            self._log_token_usage('openai', stats, getattr(usage, 'prompt_tokens', None),
+                                  getattr(usage, 'completion_tokens', None))
+            result = self._parse_response('openai', response.choices[0].message.content)
             
             # Post-process: Remove "Others" if any other category exists
             result = self._remove_others_if_other_categories_exist(result)
@@ -454,10 +526,23 @@ Return ONLY the JSON response with categories extracted from the NEW note above.
             logger.error(f"OpenAI analysis error: {e}")
             raise
     
+    def _parse_response(self, provider: str, text: str) -> Dict[str, Any]:
+        """Parse a provider's JSON answer (repairing it if needed) into ``{'categories': ...}``"""
+        try:
+            result, repaired = parse_llm_json(text)
+        except ValueError:
+            get_metrics().increment('ai_json_parse', provider=provider, result='failed', mode='sync')
+            raise
+        get_metrics().increment('ai_json_parse', provider=provider, result='repaired' if repaired else 'clean', mode='sync')
+        if repaired:
+            logger.info(f"Repaired malformed JSON in {provider} response")
+        if 'categories' not in result:
+            result = {'categories': result}
+        return result
+    
     def _fallback_analysis(self, content: str, contact_name: str) -> Dict[str, Any]:
         """Fallback analysis when AI services are unavailable"""
         logger.info("Using fallback analysis - AI services unavailable")
-        content_lower = content.lower()
         categories = {}
         
         # Check for hierarchical structure (header followed by bullets)
@@ -477,54 +562,34 @@ Return ONLY the JSON response with categories extracted from the NEW note above.
                     if line_stripped.startswith('-') or line_stripped.startswith('•'):
                         bullet_items.append(line_stripped.lstrip('- •').strip())
         
+        matcher = get_keyword_matcher()
+        match_text = content
+        
         # If we found a header with bullets, categorize based on header
         if header and bullet_items:
             logger.info(f"Detected hierarchical structure: header='{header}', items={bullet_items}")
             
-            # Combine header and all bullet items for categorization
-            combined_text = f"{header} {' '.join(bullet_items)}"
-            combined_lower = combined_text.lower()
-            
-            # Check header keywords
-            if any(word in header for word in ['hobby', 'hobbies', 'interest', 'interests', 'like', 'likes', 'enjoy', 'passion']):
-                # All items under "Hobbies" or "Interests" are Avocation
-                all_items = f"{header}\n" + "\n".join([f"- {item}" for item in bullet_items])
-                categories['Avocation'] = {'content': all_items, 'confidence': 0.7}
-                logger.info(f"Fallback: Detected '{header}' header - categorizing all items as Avocation")
-            elif any(word in header for word in ['goal', 'goals', 'want', 'plan', 'aspire', 'hope', 'aim']):
-                all_items = f"{header}\n" + "\n".join([f"- {item}" for item in bullet_items])
-                categories['Goals'] = {'content': all_items, 'confidence': 0.7}
-                logger.info(f"Fallback: Detected '{header}' header - categorizing all items as Goals")
-            elif any(word in header for word in ['task', 'todo', 'remind', 'action', 'follow']):
+            header_category = matcher.match_header(header)
+            if header_category:
+                # All items under e.g. "Hobbies" or "Goals" belong to the header's category
                 all_items = f"{header}\n" + "\n".join([f"- {item}" for item in bullet_items])
-                categories['Actionable'] = {'content': all_items, 'confidence': 0.7}
-                logger.info(f"Fallback: Detected '{header}' header - categorizing all items as Actionable")
+                categories[header_category] = {'content': all_items, 'confidence': 0.7}
+                logger.info(f"Fallback: Detected '{header}' header - categorizing all items as {header_category}")
             else:
                 # Header not recognized, fall through to regular keyword matching
-                content_lower = combined_lower
+                match_text = f"{header} {' '.join(bullet_items)}"
         
         # Regular keyword matching (if no hierarchical structure detected or header not recognized)
         if not categories:
-            # Check for goals
-            if any(word in content_lower for word in ['goal', 'goals', 'want', 'wants', 'plan', 'plans', 'aspire', 'aspires', 'hope', 'hopes', 'aim', 'aims', 'objective', 'objectives']):
-                categories['Goals'] = {'content': content[:200], 'confidence': 0.5}
-            
-            # Check for actionable items
-            if any(word in content_lower for word in ['task', 'tasks', 'todo', 'todos', 'remind', 'reminder', 'follow', 'follow-up', 'call', 'meet', 'meeting', 'schedule']):
-                categories['Actionable'] = {'content': content[:200], 'confidence': 0.5}
-            
-            # Check for interests/hobbies (Avocation) - IMPROVED KEYWORD MATCHING
-            avocation_keywords = [
-                'hobby', 'hobbies', 'interest', 'interests', 'interested', 'like', 'likes', 'love', 'loves', 
-                'enjoy', 'enjoys', 'passion', 'passions', 'favorite', 'favourite', 'favorites', 'favourites',
-                'cooking', 'baking', 'reading', 'writing', 'music', 'art', 'painting', 'drawing', 'photography',
-                'gardening', 'travel', 'sports', 'fitness', 'exercise', 'gaming', 'games', 'collecting', 'collection',
-                'craft', 'crafts', 'sewing', 'knitting', 'woodworking', 'dancing', 'singing', 'playing', 'instrument',
-                'recreational', 'leisure', 'pastime', 'pastimes', 'activity', 'activities'
-            ]
-            if any(word in content_lower for word in avocation_keywords):
-                categories['Avocation'] = {'content': content[:200], 'confidence': 0.6}
-                logger.info(f"Fallback detected Avocation keywords in: {content[:50]}...")
+            for category, match in matcher.match(match_text).items():
+                categories[category] = {
+                    'content': content[:200],
+                    'confidence': matcher.confidence(category),
+                    'keywords': match['keywords'],
+                    'hits': match['hits'],
+                    'score': match['score']
+                }
+                logger.info(f"Fallback detected {category} keywords {match['keywords']} (score {match['score']}) in: {content[:50]}...")
         
         if not categories:
             categories['Others'] = {'content': content[:200], 'confidence': 0.3}
@@ -552,3 +617,10 @@ Return ONLY the JSON response with categories extracted from the NEW note above.
         
         return result
 
+
+def get_ai_service() -> AIService:
+    """Get the process-wide AIService (clients and caches are shared across requests)"""
+    global _ai_service
+    if _ai_service is None:
+        _ai_service = AIService()
+    return _ai_service
@@ -134,7 +134,7 @@ class ContactService:
                 # Clean up ChromaDB collection (non-blocking)
                 try:
                     from app.utils.chromadb_client import delete_contact_collection
-                    delete_contact_collection(contact_id)
+                    delete_contact_collection(contact_id, user_id=user_id)
                 except Exception as e:
                     logger.error(f"ChromaDB collection cleanup failed for contact {contact_id}: {e}")
                     # Continue - database deletion succeeded
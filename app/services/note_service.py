@@ -3,56 +3,118 @@ Note Service
 Business logic for note processing with AI analysis and RAG
 """
 
+import os
 import logging
-from typing import Dict, Any
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, List
 from datetime import datetime
 from app.models import Contact, RawNote, SynthesizedEntry
-from app.services.ai_service import AIService
+from app.services.ai_service import get_ai_service
 from app.utils.database import DatabaseManager
-from app.utils.chromadb_client import store_note_in_chromadb, get_relevant_history
+from app.utils.chromadb_client import store_note_in_chromadb, get_relevant_history, embed_texts
+from app.utils.executor import get_executor
+from app.utils.latency import get_latency_histogram
+from app.utils.metrics import get_metrics
+from app.utils.hashing import normalize_text, note_fingerprint, minhash_signature, estimate_similarity
 
 logger = logging.getLogger(__name__)
 
+_note_service = None
+
+# Categories the UI knows about; anything else is mapped onto one of these
+VALID_CATEGORIES = {
+    'Actionable', 'Goals', 'Relationship_Strategy', 'Social',
+    'Professional_Background', 'Financial_Situation', 'Wellbeing',
+    'Avocation', 'Environment_And_Lifestyle', 'Psychology_And_Values',
+    'Communication_Style', 'Challenges_And_Development', 'Deeper_Insights',
+    'Admin_matters', 'Others'
+}
+
+# Audit-trail notes written by the app itself; never treated as duplicates of user notes
+AUDIT_SOURCES = ('manual_edit', 'ui_edit')
+
+SIGNATURE_CACHE_SIZE = 4096
+
+CATEGORY_MAP = {
+    'education': 'Professional_Background',
+    'Education': 'Professional_Background',
+    'EDUCATION': 'Professional_Background',
+    'experience': 'Professional_Background',
+    'Experience': 'Professional_Background',
+    'EXPERIENCE': 'Professional_Background',
+    'work': 'Professional_Background',
+    'Work': 'Professional_Background',
+    'career': 'Professional_Background',
+    'Career': 'Professional_Background',
+}
+
+
+class SignatureCache:
+    """Bounded, thread-safe LRU of MinHash signatures keyed by note content hash
+    
+    Shared by every request thread (and the reprocess workers), so reads and
+    evictions happen under one lock.
+    """
+    
+    def __init__(self, max_size: int = SIGNATURE_CACHE_SIZE):
+        self.max_size = max_size
+        self._signatures = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get_many(self, fingerprints: List[str]) -> Dict[str, Any]:
+        """Cached signatures for ``fingerprints`` (missing ones are left out)"""
+        found = {}
+        with self._lock:
+            for fingerprint in fingerprints:
+                if fingerprint in self._signatures:
+                    self._signatures.move_to_end(fingerprint)
+                    found[fingerprint] = self._signatures[fingerprint]
+        return found
+    
+    def put(self, fingerprint: str, signature):
+        with self._lock:
+            self._signatures[fingerprint] = signature
+            self._signatures.move_to_end(fingerprint)
+            while len(self._signatures) > self.max_size:
+                self._signatures.popitem(last=False)
+
+
+# MinHash signatures of recent notes
+_signature_cache = SignatureCache()
+
 
 class NoteService:
     """Service for note processing and AI analysis"""
     
     def __init__(self):
         self.db_manager = DatabaseManager()
-        self.ai_service = AIService()
+        self.ai_service = get_ai_service()
+        # Estimated Jaccard similarity at which a note counts as a near-duplicate (0 disables)
+        self.near_duplicate_threshold = float(os.getenv('NOTE_NEAR_DUPLICATE_THRESHOLD', 0))
+        self.near_duplicate_window = int(os.getenv('NOTE_NEAR_DUPLICATE_WINDOW', 200))
     
     def process_note(self, contact_id: int, content: str, user_id: int) -> Dict[str, Any]:
         """Process a note with AI analysis and RAG context"""
         with self.db_manager.get_session() as session:
-            contact = session.query(Contact).filter(
-                Contact.id == contact_id,
-                Contact.user_id == user_id
-            ).first()
-            
-            if not contact:
-                raise ValueError("Contact not found")
+            contact = self._get_contact(session, contact_id, user_id)
+            duplicate, similarity = self.find_duplicate(session, contact_id, content)
+            if duplicate is not None:
+                reused = self._reuse_analysis(session, contact, duplicate, similarity, content)
+                if reused is not None:
+                    return reused
+                if similarity >= 1.0:
+                    return self._reanalyze_duplicate(contact_id, contact.full_name, duplicate.id)
+            raw_note = self._create_raw_note(session, contact_id, content)
             
-            raw_note = RawNote(
-                contact_id=contact_id,
-                content=content.strip(),
-                source='manual',
-                created_at=datetime.utcnow()
-            )
-            session.add(raw_note)
-            session.flush()
-            
-            try:
-                store_note_in_chromadb(contact_id, content, raw_note.id)
-            except Exception as e:
-                logger.warning(f"Failed to store note in ChromaDB: {e}")
-            
-            retrieved_history = "No relevant history found."
-            try:
-                query_text = " ".join(content.split()[:30])
-                retrieved_history = get_relevant_history(contact_id, query_text, n_results=3)
-            except Exception as e:
-                logger.warning(f"RAG retrieval failed: {e}")
+            # Run the vector-store write and RAG retrieval concurrently; analysis
+            # only depends on retrieval, so it overlaps with the write as well
+            pipeline_start = time.perf_counter()
+            timings = {}
+            store_future, retrieved_history = self._start_vector_stages(contact_id, content, raw_note.id, timings)
             
+            analysis_start = time.perf_counter()
             try:
                 analysis_result = self.ai_service.analyze_note(
                     content=content,
@@ -61,102 +123,17 @@ class NoteService:
                 )
             except Exception as e:
                 logger.error(f"AI analysis failed: {e}")
-                analysis_result = self.ai_service._fallback_analysis(content, contact.full_name)
-            
-            synthesis_results = []
-            categories = analysis_result.get('categories', {})
+                analysis_result = self.ai_service.offline_analysis(content, contact.full_name)
+            timings['analysis_ms'] = round((time.perf_counter() - analysis_start) * 1000, 1)
             
-            # If AI returned no categories, use fallback
-            if not categories or len(categories) == 0:
-                logger.warning(f"No categories extracted by AI, using fallback analysis")
-                analysis_result = self.ai_service._fallback_analysis(content, contact.full_name)
-                categories = analysis_result.get('categories', {})
+            self._finish_vector_store(store_future)
+            timings['pipeline_ms'] = round((time.perf_counter() - pipeline_start) * 1000, 1)
             
-            # Normalize category names (map invalid categories to valid ones)
-            VALID_CATEGORIES = {
-                'Actionable', 'Goals', 'Relationship_Strategy', 'Social',
-                'Professional_Background', 'Financial_Situation', 'Wellbeing',
-                'Avocation', 'Environment_And_Lifestyle', 'Psychology_And_Values',
-                'Communication_Style', 'Challenges_And_Development', 'Deeper_Insights',
-                'Admin_matters', 'Others'
-            }
-            
-            CATEGORY_MAP = {
-                'education': 'Professional_Background',
-                'Education': 'Professional_Background',
-                'EDUCATION': 'Professional_Background',
-                'experience': 'Professional_Background',
-                'Experience': 'Professional_Background',
-                'EXPERIENCE': 'Professional_Background',
-                'work': 'Professional_Background',
-                'Work': 'Professional_Background',
-                'career': 'Professional_Background',
-                'Career': 'Professional_Background',
-            }
-            
-            normalized_categories = {}
-            for category, data in categories.items():
-                # Normalize category name
-                category_lower = category.strip()
-                if category_lower in CATEGORY_MAP:
-                    normalized_name = CATEGORY_MAP[category_lower]
-                    logger.info(f"Normalizing category '{category}' to '{normalized_name}'")
-                elif category in VALID_CATEGORIES:
-                    normalized_name = category
-                else:
-                    # Invalid category - map to Others or Professional_Background based on content
-                    content_text = data.get('content', '') if isinstance(data, dict) else str(data)
-                    if any(keyword in content_text.lower() for keyword in ['education', 'degree', 'university', 'school', 'college', 'work', 'job', 'career', 'experience']):
-                        normalized_name = 'Professional_Background'
-                        logger.info(f"Mapping invalid category '{category}' to 'Professional_Background' based on content")
-                    else:
-                        normalized_name = 'Others'
-                        logger.info(f"Mapping invalid category '{category}' to 'Others'")
-                
-                # Merge if category already exists
-                if normalized_name in normalized_categories:
-                    existing_content = normalized_categories[normalized_name].get('content', '')
-                    new_content = data.get('content', '') if isinstance(data, dict) else str(data)
-                    normalized_categories[normalized_name]['content'] = f"{existing_content}\n\n{new_content}".strip()
-                    # Use higher confidence
-                    existing_conf = normalized_categories[normalized_name].get('confidence', 0.0)
-                    new_conf = data.get('confidence', 0.0) if isinstance(data, dict) else 0.0
-                    normalized_categories[normalized_name]['confidence'] = max(existing_conf, new_conf)
-                else:
-                    normalized_categories[normalized_name] = data if isinstance(data, dict) else {'content': str(data), 'confidence': 0.0}
-            
-            categories = normalized_categories
-            
-            # Post-process: Remove "Others" if any other category exists (safety check)
-            if 'Others' in categories:
-                other_categories = [k for k in categories.keys() if k != 'Others']
-                if other_categories:
-                    logger.info(f"Removing 'Others' category because other categories exist: {other_categories}")
-                    del categories['Others']
-            
-            for category, data in categories.items():
-                content_text = data.get('content', '')
-                confidence = float(data.get('confidence', 0.0))
-                
-                # Lower threshold to 5 characters to catch short notes like "likes fish"
-                if content_text and len(content_text.strip()) > 5:
-                    entry = SynthesizedEntry(
-                        contact_id=contact_id,
-                        raw_note_id=raw_note.id,
-                        category=category,
-                        content=content_text.strip(),
-                        confidence_score=confidence,
-                        created_at=datetime.utcnow()
-                    )
-                    session.add(entry)
-                    synthesis_results.append({
-                        'category': category,
-                        'content': content_text,
-                        'confidence': confidence
-                    })
+            categories = self._categories_or_fallback(analysis_result, content, contact.full_name)
+            synthesis_results = self._save_entries(session, contact_id, raw_note.id, self.normalize_categories(categories))
             
             session.commit()
-            logger.info(f"Processed note {raw_note.id} for contact {contact_id}: {len(synthesis_results)} categories")
+            logger.info(f"Processed note {raw_note.id} for contact {contact_id}: {len(synthesis_results)} categories ({timings})")
             
             return {
                 'success': True,
@@ -165,9 +142,425 @@ class NoteService:
                 'contact_name': contact.full_name,
                 'synthesis': synthesis_results,
                 'categories_count': len(synthesis_results),
-                'rag_context_used': retrieved_history != "No relevant history found."
+                'rag_context_used': retrieved_history != "No relevant history found.",
+                'timings': timings
             }
     
+    def process_note_stream(self, contact_id: int, content: str, user_id: int):
+        """Process a note like ``process_note``, yielding progress events as they happen
+        
+        Yields dicts with an ``event`` name and ``data`` payload: ``started`` once the raw
+        note exists, ``category`` for each category as the model finishes it, and ``done``
+        with the persisted synthesis (the same shape ``process_note`` returns). The raw note
+        is committed before ``started``; entries are written in a second transaction once
+        the analysis is complete, so a dropped stream leaves a note without entries that
+        the next exact resubmission (or a reprocess run) analyzes. Raises ValueError before the first event if the
+        contact does not belong to the user.
+        """
+        request_start = time.perf_counter()
+        # The raw note is committed before streaming, so a client that disconnects
+        # mid-stream cannot roll it back and leave its vector orphaned in Chroma
+        with self.db_manager.get_session() as session:
+            contact = self._get_contact(session, contact_id, user_id)
+            contact_name = contact.full_name
+            duplicate, similarity = self.find_duplicate(session, contact_id, content)
+            reused = None
+            reanalyze_id = None
+            if duplicate is not None:
+                reused = self._reuse_analysis(session, contact, duplicate, similarity, content)
+                if reused is None and similarity >= 1.0:
+                    reanalyze_id = duplicate.id
+            if reused is None and reanalyze_id is None:
+                raw_note_id = self._create_raw_note(session, contact_id, content).id
+        if reused is not None:
+            yield {'event': 'started', 'data': {'raw_note_id': reused['raw_note_id'], 'contact_id': contact_id}}
+            yield {'event': 'done', 'data': reused}
+            return
+        if reanalyze_id is not None:
+            yield {'event': 'started', 'data': {'raw_note_id': reanalyze_id, 'contact_id': contact_id}}
+            yield {'event': 'done', 'data': self._reanalyze_duplicate(contact_id, contact_name, reanalyze_id)}
+            return
+        yield {'event': 'started', 'data': {'raw_note_id': raw_note_id, 'contact_id': contact_id}}
+        
+        pipeline_start = time.perf_counter()
+        timings = {}
+        store_future, retrieved_history = self._start_vector_stages(contact_id, content, raw_note_id, timings)
+        
+        analysis_start = time.perf_counter()
+        analysis_result = None
+        provider = None
+        try:
+            for kind, *payload in self.ai_service.stream_analyze_note(
+                content=content,
+                contact_name=contact_name,
+                context=retrieved_history
+            ):
+                if kind == 'result':
+                    analysis_result, provider = payload
+                    continue
+                name, data = payload
+                if 'time_to_first_category_ms' not in timings:
+                    ttfc_ms = (time.perf_counter() - request_start) * 1000
+                    timings['time_to_first_category_ms'] = round(ttfc_ms, 1)
+                    get_latency_histogram('time_to_first_category').record(ttfc_ms)
+                if not isinstance(data, dict):
+                    data = {'content': str(data), 'confidence': 0.0}
+                yield {'event': 'category', 'data': {
+                    'category': self.normalize_category_name(name, data),
+                    'content': data.get('content', ''),
+                    'confidence': data.get('confidence', 0.0)
+                }}
+        except Exception as e:
+            logger.error(f"AI analysis failed: {e}")
+        if analysis_result is None:
+            analysis_result = self.ai_service.offline_analysis(content, contact_name)
+        timings['analysis_ms'] = round((time.perf_counter() - analysis_start) * 1000, 1)
+        
+        self._finish_vector_store(store_future)
+        timings['pipeline_ms'] = round((time.perf_counter() - pipeline_start) * 1000, 1)
+        
+        categories = self._categories_or_fallback(analysis_result, content, contact_name)
+        with self.db_manager.get_session() as session:
+            # A duplicate submitted meanwhile may have analyzed this note already; replace its entries
+            session.query(SynthesizedEntry).filter(
+                SynthesizedEntry.raw_note_id == raw_note_id
+            ).delete(synchronize_session=False)
+            synthesis_results = self._save_entries(session, contact_id, raw_note_id, self.normalize_categories(categories))
+        logger.info(f"Streamed note {raw_note_id} for contact {contact_id} via {provider}: {len(synthesis_results)} categories ({timings})")
+        
+        yield {'event': 'done', 'data': {
+            'success': True,
+            'raw_note_id': raw_note_id,
+            'contact_id': contact_id,
+            'contact_name': contact_name,
+            'synthesis': synthesis_results,
+            'categories_count': len(synthesis_results),
+            'rag_context_used': retrieved_history != "No relevant history found.",
+            'timings': timings
+        }}
+    
+    def reprocess_note(self, raw_note_id: int, allow_offline: bool = False) -> Dict[str, Any]:
+        """Re-analyze an existing raw note and replace its synthesized entries
+        
+        The AI call runs outside any transaction; the old entries are then deleted and
+        the new ones inserted in a single transaction, so readers see either the old or
+        the new set. With ``allow_offline`` False a note no provider can analyze raises
+        RuntimeError and keeps its existing entries.
+        """
+        with self.db_manager.get_session() as session:
+            raw_note = session.query(RawNote).filter(RawNote.id == raw_note_id).first()
+            if not raw_note:
+                raise ValueError("Note not found")
+            contact_id = raw_note.contact_id
+            content = raw_note.content
+            contact_name = raw_note.contact.full_name
+        
+        # The note's stored vector is usually in the embedding cache already
+        embedding = self._embed_note(content, {})
+        retrieved_history = get_relevant_history(
+            contact_id, content, n_results=3, exclude_note_id=raw_note_id, query_embedding=embedding
+        )
+        analysis_result = self.ai_service.analyze_note(
+            content=content,
+            contact_name=contact_name,
+            context=retrieved_history,
+            allow_offline=allow_offline
+        )
+        if analysis_result.get('categories'):
+            categories = analysis_result['categories']
+        elif allow_offline:
+            categories = self._categories_or_fallback(analysis_result, content, contact_name)
+        else:
+            raise RuntimeError("AI analysis returned no categories")
+        
+        with self.db_manager.get_session() as session:
+            replaced = session.query(SynthesizedEntry).filter(
+                SynthesizedEntry.raw_note_id == raw_note_id
+            ).delete(synchronize_session=False)
+            synthesis_results = self._save_entries(session, contact_id, raw_note_id, self.normalize_categories(categories))
+            session.commit()
+        
+        return {
+            'raw_note_id': raw_note_id,
+            'contact_id': contact_id,
+            'replaced_count': replaced,
+            'synthesis': synthesis_results,
+            'categories_count': len(synthesis_results),
+            'rag_context_used': retrieved_history != "No relevant history found."
+        }
+    
+    def find_duplicate(self, session, contact_id: int, content: str) -> Tuple[Optional[RawNote], float]:
+        """Earlier note for this contact with the same (or, if enabled, nearly the same) content
+        
+        Exact duplicates match on the normalized content hash through the
+        (contact_id, content_hash) index. Near-duplicates are only looked for when
+        NOTE_NEAR_DUPLICATE_THRESHOLD is set, by comparing MinHash signatures with the
+        contact's NOTE_NEAR_DUPLICATE_WINDOW most recent notes.
+        
+        Returns:
+            tuple: (duplicate note or None, similarity - 1.0 for exact duplicates)
+        """
+        user_notes = session.query(RawNote).filter(
+            RawNote.contact_id == contact_id,
+            RawNote.source.notin_(AUDIT_SOURCES)
+        )
+        fingerprint = note_fingerprint(content)
+        exact = user_notes.filter(RawNote.content_hash == fingerprint).order_by(RawNote.id).first()
+        if exact is not None:
+            return exact, 1.0
+        if not self.near_duplicate_threshold:
+            return None, 0.0
+        
+        signature = minhash_signature(normalize_text(content))
+        if signature is None:
+            return None, 0.0
+        recent = user_notes.with_entities(RawNote.id, RawNote.content_hash).order_by(
+            RawNote.id.desc()
+        ).limit(self.near_duplicate_window).all()
+        signatures = _signature_cache.get_many([note_hash for _, note_hash in recent])
+        missing = {note_id: note_hash for note_id, note_hash in recent if note_hash not in signatures}
+        if missing:
+            for note_id, note_content in session.query(RawNote.id, RawNote.content).filter(RawNote.id.in_(list(missing))):
+                note_hash = missing[note_id]
+                signatures[note_hash] = minhash_signature(normalize_text(note_content))
+                _signature_cache.put(note_hash, signatures[note_hash])
+        
+        best_id, best_similarity = None, 0.0
+        for note_id, note_hash in recent:
+            similarity = estimate_similarity(signature, signatures.get(note_hash))
+            if similarity > best_similarity:
+                best_id, best_similarity = note_id, similarity
+        if best_id is not None and best_similarity >= self.near_duplicate_threshold:
+            return session.get(RawNote, best_id), best_similarity
+        return None, best_similarity
+    
+    def _reuse_analysis(self, session, contact: Contact, duplicate: RawNote, similarity: float,
+                        content: str) -> Optional[Dict[str, Any]]:
+        """Answer a duplicate note with the analysis already stored for ``duplicate``
+        
+        An exact duplicate is not stored again. A near-duplicate is kept as a raw note
+        (tagged with ``duplicate_of``) so its text is not lost, but it gets no entries
+        of its own and is not added to the vector store.
+        
+        Returns None when ``duplicate`` has no entries (its stream was dropped or its
+        analysis failed), so the caller analyzes the note instead of reusing nothing.
+        """
+        start = time.perf_counter()
+        entries = session.query(SynthesizedEntry).filter(
+            SynthesizedEntry.raw_note_id == duplicate.id
+        ).order_by(SynthesizedEntry.id).all()
+        if not entries:
+            return None
+        synthesis_results = [{
+            'category': entry.category,
+            'content': entry.content,
+            'confidence': entry.confidence_score
+        } for entry in entries]
+        
+        raw_note_id = duplicate.id
+        if similarity < 1.0:
+            raw_note = self._create_raw_note(session, contact.id, content)
+            raw_note.metadata_tags = {'duplicate_of': duplicate.id, 'similarity': round(similarity, 3)}
+            session.commit()
+            raw_note_id = raw_note.id
+        
+        kind = 'exact' if similarity >= 1.0 else 'near'
+        logger.info(f"♻️ Note for contact {contact.id} is an {kind} duplicate of note {duplicate.id} "
+                    f"(similarity {similarity:.2f}) - reusing its {len(synthesis_results)} categories")
+        return {
+            'success': True,
+            'raw_note_id': raw_note_id,
+            'contact_id': contact.id,
+            'contact_name': contact.full_name,
+            'synthesis': synthesis_results,
+            'categories_count': len(synthesis_results),
+            'rag_context_used': False,
+            'duplicate_of': duplicate.id,
+            'duplicate': kind,
+            'timings': {'dedupe_ms': round((time.perf_counter() - start) * 1000, 1)}
+        }
+    
+    def _reanalyze_duplicate(self, contact_id: int, contact_name: str, duplicate_id: int) -> Dict[str, Any]:
+        """Answer an exact duplicate of a note left without entries by analyzing that note"""
+        start = time.perf_counter()
+        result = self.reprocess_note(duplicate_id, allow_offline=True)
+        logger.info(f"♻️ Note for contact {contact_id} is an exact duplicate of note {duplicate_id}, "
+                    f"which had no entries - analyzed it: {result['categories_count']} categories")
+        return {
+            'success': True,
+            'raw_note_id': duplicate_id,
+            'contact_id': contact_id,
+            'contact_name': contact_name,
+            'synthesis': result['synthesis'],
+            'categories_count': result['categories_count'],
+            'rag_context_used': result['rag_context_used'],
+            'duplicate_of': duplicate_id,
+            'duplicate': 'exact',
+            'timings': {'analysis_ms': round((time.perf_counter() - start) * 1000, 1)}
+        }
+    
+    def _get_contact(self, session, contact_id: int, user_id: int) -> Contact:
+        contact = session.query(Contact).filter(
+            Contact.id == contact_id,
+            Contact.user_id == user_id
+        ).first()
+        
+        if not contact:
+            raise ValueError("Contact not found")
+        return contact
+    
+    def _create_raw_note(self, session, contact_id: int, content: str) -> RawNote:
+        raw_note = RawNote(
+            contact_id=contact_id,
+            content=content.strip(),
+            source='manual',
+            created_at=datetime.utcnow()
+        )
+        session.add(raw_note)
+        session.flush()
+        return raw_note
+    
+    def _start_vector_stages(self, contact_id: int, content: str, note_id: int, timings: Dict[str, float]):
+        """Submit the ChromaDB write and RAG retrieval to the pipeline executor
+        
+        The note is embedded once and that vector is both stored and used as the RAG
+        query (which excludes the note itself). If embedding fails, each stage falls
+        back to embedding its own text.
+        
+        Returns the store future (still running) and the retrieved history text.
+        """
+        executor = get_executor('pipeline')
+        
+        def timed(stage, func, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+        
+        embedding = self._embed_note(content, timings)
+        if embedding is not None:
+            # The RAG query used to be embedded separately; count the call saved
+            get_metrics().increment('note_embeddings_reused')
+        store_future = executor.submit(
+            timed, 'vector_store_ms', store_note_in_chromadb,
+            contact_id, content, note_id, embedding=embedding
+        )
+        
+        # The full note is the lexical query (names and dates can be anywhere in it)
+        retrieval_future = executor.submit(
+            timed, 'retrieval_ms', get_relevant_history,
+            contact_id, content, n_results=3, exclude_note_id=note_id, query_embedding=embedding
+        )
+        
+        retrieved_history = "No relevant history found."
+        try:
+            retrieved_history = retrieval_future.result()
+        except Exception as e:
+            logger.warning(f"RAG retrieval failed: {e}")
+        return store_future, retrieved_history
+    
+    def _embed_note(self, content: str, timings: Dict[str, float]) -> Optional[List[float]]:
+        """Embed a note for both storage and retrieval; None if embedding failed"""
+        start = time.perf_counter()
+        try:
+            embedding = embed_texts([content])[0]
+        except Exception as e:
+            logger.warning(f"Note embedding failed, stages will embed separately: {e}")
+            return None
+        embedding_ms = (time.perf_counter() - start) * 1000
+        timings['embedding_ms'] = round(embedding_ms, 1)
+        get_metrics().observe('note_embedding_ms', embedding_ms)
+        return embedding
+    
+    def _finish_vector_store(self, store_future):
+        try:
+            store_future.result()
+        except Exception as e:
+            logger.warning(f"Failed to store note in ChromaDB: {e}")
+    
+    def _categories_or_fallback(self, analysis_result: Dict[str, Any], content: str, contact_name: str) -> Dict[str, Any]:
+        categories = analysis_result.get('categories', {})
+        
+        # If AI returned no categories, use fallback
+        if not categories or len(categories) == 0:
+            logger.warning(f"No categories extracted by AI, using fallback analysis")
+            analysis_result = self.ai_service.offline_analysis(content, contact_name)
+            categories = analysis_result.get('categories', {})
+        return categories
+    
+    def normalize_category_name(self, category: str, data: Any) -> str:
+        """Map a category name returned by the model onto one of VALID_CATEGORIES"""
+        category_lower = category.strip()
+        if category_lower in CATEGORY_MAP:
+            normalized_name = CATEGORY_MAP[category_lower]
+            logger.info(f"Normalizing category '{category}' to '{normalized_name}'")
+        elif category in VALID_CATEGORIES:
+            normalized_name = category
+        else:
+            # Invalid category - map to Others or Professional_Background based on content
+            content_text = data.get('content', '') if isinstance(data, dict) else str(data)
+            if any(keyword in content_text.lower() for keyword in ['education', 'degree', 'university', 'school', 'college', 'work', 'job', 'career', 'experience']):
+                normalized_name = 'Professional_Background'
+                logger.info(f"Mapping invalid category '{category}' to 'Professional_Background' based on content")
+            else:
+                normalized_name = 'Others'
+                logger.info(f"Mapping invalid category '{category}' to 'Others'")
+        return normalized_name
+    
+    def normalize_categories(self, categories: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalize category names, merge duplicates and drop 'Others' when anything else matched"""
+        normalized_categories = {}
+        for category, data in categories.items():
+            normalized_name = self.normalize_category_name(category, data)
+            
+            # Merge if category already exists
+            if normalized_name in normalized_categories:
+                existing_content = normalized_categories[normalized_name].get('content', '')
+                new_content = data.get('content', '') if isinstance(data, dict) else str(data)
+                normalized_categories[normalized_name]['content'] = f"{existing_content}\n\n{new_content}".strip()
+                # Use higher confidence
+                existing_conf = normalized_categories[normalized_name].get('confidence', 0.0)
+                new_conf = data.get('confidence', 0.0) if isinstance(data, dict) else 0.0
+                normalized_categories[normalized_name]['confidence'] = max(existing_conf, new_conf)
+            else:
+                normalized_categories[normalized_name] = dict(data) if isinstance(data, dict) else {'content': str(data), 'confidence': 0.0}
+        
+        categories = normalized_categories
+        
+        # Post-process: Remove "Others" if any other category exists (safety check)
+        if 'Others' in categories:
+            other_categories = [k for k in categories.keys() if k != 'Others']
+            if other_categories:
+                logger.info(f"Removing 'Others' category because other categories exist: {other_categories}")
+                del categories['Others']
+        return categories
+    
+    def _save_entries(self, session, contact_id: int, raw_note_id: int, categories: Dict[str, Any]):
+        """Add a SynthesizedEntry per category (caller commits); returns the synthesis list"""
+        synthesis_results = []
+        for category, data in categories.items():
+            content_text = data.get('content', '')
+            confidence = float(data.get('confidence', 0.0))
+            
+            # Lower threshold to 5 characters to catch short notes like "likes fish"
+            if content_text and len(content_text.strip()) > 5:
+                entry = SynthesizedEntry(
+                    contact_id=contact_id,
+                    raw_note_id=raw_note_id,
+                    category=category,
+                    content=content_text.strip(),
+                    confidence_score=confidence,
+                    created_at=datetime.utcnow()
+                )
+                session.add(entry)
+                synthesis_results.append({
+                    'category': category,
+                    'content': content_text,
+                    'confidence': confidence
+                })
+        return synthesis_results
+    
     def get_notes_for_contact(self, contact_id: int, user_id: int) -> Dict[str, Any]:
         """Get all notes and synthesized entries for a contact"""
         with self.db_manager.get_session() as session:
@@ -206,3 +599,10 @@ class NoteService:
                 } for e in synthesized_entries]
             }
 
+
+def get_note_service() -> NoteService:
+    """Get the process-wide NoteService"""
+    global _note_service
+    if _note_service is None:
+        _note_service = NoteService()
+    return _note_service
@@ -0,0 +1,302 @@
+"""
+Prompt Builder
+Analysis prompts compiled once per process, with token counting and a token budget for RAG context
+"""
+
+import os
+import hashlib
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_prompt_builder = None
+_encoder = None
+_encoder_loaded = False
+
+NO_HISTORY = "No relevant history found."
+
+# Separator used by get_relevant_history between retrieved notes (most relevant first)
+CONTEXT_SEPARATOR = "\n---\n"
+
+CATEGORY_DEFINITIONS = """
+- Actionable: Immediate tasks, follow-ups, reminders, requests, or discussion topics requiring attention within days or weeks.
+- Goals: Clearly defined aspirations and objectives across all life domains, including short-term targets (3-12 months), medium-term goals (1-5 years), and long-term visions (5+ years).
+- Relationship_Strategy: Structured approaches to nurturing, deepening, or improving your relationship with specific tactics for connection and support.
+- Social: Comprehensive mapping of their social ecosystem including family dynamics, friendship networks, romantic relationships, professional connections, community involvement.
+- Professional_Background: Detailed career history and occupational profile including employment timeline, educational credentials, skill inventory, achievement record. **IMPORTANT: Education information (degrees, universities, schools) should be categorized under Professional_Background, NOT as a separate "Education" category.**
+- Financial_Situation: Comprehensive portrait of their economic circumstances, money management approach, and financial outlook.
+- Wellbeing: Holistic health status encompassing physical, mental, emotional, and spiritual dimensions.
+- Avocation: Comprehensive inventory of non-professional interests, passions, and recreational activities. This includes hobbies, leisure activities, creative pursuits, sports, games, collections, and any activities done for enjoyment outside of work (e.g., cooking, reading, gardening, music, art, travel, etc.).
+- Environment_And_Lifestyle: Detailed portrait of their daily living context and routine patterns.
+- Psychology_And_Values: In-depth profile of their mental frameworks, belief systems, and guiding principles.
+- Communication_Style: Comprehensive analysis of their interpersonal communication patterns and preferences across all contexts.
+- Challenges_And_Development: Nuanced exploration of their struggles, growth areas, and evolution across personal and professional domains.
+- Deeper_Insights: Profound observations about their core essence, philosophical outlook, and unique qualities that transcend conventional categorization.
+- Admin_matters: Administrative details including important dates, birthdays, anniversaries, and other key information to track.
+- Others: Any other important information that doesn't fit into the categories above.
+"""
+
+_HISTORY_HEADER = """**Retrieved Relevant History (FOR REFERENCE ONLY - DO NOT RE-CATEGORIZE):**
+"""
+
+_HISTORY_FOOTER = """
+
+IMPORTANT: The history above shows information that has ALREADY been categorized. Use it ONLY for:
+- Understanding context and maintaining consistency
+- Identifying if new information contradicts or updates old information
+- Building upon existing knowledge
+
+DO NOT extract or re-categorize any content from the history above. ONLY analyze the new note below.
+
+"""
+
+_NOTE_HEADER = """**New Note to Analyze (ONLY EXTRACT FROM THIS SECTION):**
+"""
+
+_GEMINI_INSTRUCTIONS = """Categorize the content into these categories (only include if relevant):
+
+CATEGORY_DEFINITIONS:
+{category_definitions}
+
+CRITICAL: UNDERSTAND HIERARCHICAL STRUCTURE
+- When a header/title is followed by bullet points or a list, ALL items in that list inherit the context of the header
+- Example: "Hobbies\n- Cooking\n- Doing work" means BOTH "Cooking" AND "Doing work" are hobbies (Avocation category)
+- Example: "Goals\n- Learn Spanish\n- Travel to Japan" means BOTH are goals
+- Example: "Interests\n- Reading\n- Music" means BOTH are interests (Avocation)
+- Do NOT categorize items under a header separately - they all belong to the same category as the header
+
+EXAMPLES FOR CLARITY:
+- "Hobbies\n- Cooking\n- Doing work" → ALL should be "Avocation" (both cooking and doing work are hobbies in this context)
+- "Hobbies: Cooking, Reading" → Should be categorized as "Avocation" (not "Others")
+- "Likes playing guitar and painting" → Should be categorized as "Avocation"
+- "Goals\n- Learn coding\n- Start business" → ALL should be "Goals"
+- "Interests\n- Photography\n- Travel" → ALL should be "Avocation"
+
+Return a JSON response with this structure:
+{{
+    "categories": {{
+        "Actionable": {{"content": "specific factual information extracted", "confidence": 0.85}},
+        "Goals": {{"content": "specific factual information extracted", "confidence": 0.80}}
+    }}
+}}
+
+IMPORTANT:
+- Only include categories that have relevant content from the note
+- Extract specific, factual information - not interpretations
+- Confidence should be between 0.0 and 1.0 based on clarity of information
+- Be precise and concise in your extraction
+- **CRITICAL FORMATTING RULES:**
+  - PRESERVE ALL BULLET POINTS: If the input has bullet points (using `- `, `•`, `*`, `+`, or any list format), you MUST preserve them exactly as `- ` (dash-space) format in your output
+  - PRESERVE LINE BREAKS: Maintain all line breaks (`\n`) from the original text
+  - PRESERVE STRUCTURE: If the input has indented bullets, sub-bullets, or hierarchical lists, maintain that structure using `- ` for each level
+  - PRESERVE SECTIONS: If the input has headers, sections, or categories, maintain that organization
+  - PRESERVE HEADERS: If the input has section headers (like "Experience:", "Education:", job titles, etc.), keep them as separate lines with the same formatting
+  - PRESERVE JOB TITLES AND DATES: If the input has job titles with dates (e.g., "Manager: Jan 2020 - Dec 2022 • 2 yrs"), preserve this exact format
+  - PRESERVE HIERARCHY: Maintain the exact hierarchical structure - headers, sub-headers, job titles, descriptions, bullet points
+  - Use markdown formatting: `- ` for bullet points, `**text**` for bold, `\n` for line breaks
+  - DO NOT convert bullet points to paragraphs - keep them as lists
+  - DO NOT flatten structured content - preserve lists, sections, headers, and formatting exactly as they appear
+  - DO NOT merge separate lines into one paragraph - keep each line as a separate line
+
+NEGATIVE CONSTRAINTS (What NOT to do):
+- Do NOT infer feelings, emotions, or internal states not explicitly stated
+- Do NOT add information that is not present in the note text
+- Do NOT make assumptions about relationships beyond what is stated
+- Do NOT extrapolate future plans or intentions unless explicitly mentioned
+- Do NOT categorize information into multiple categories if it clearly belongs to one
+- Do NOT include generic or vague statements that don't add value
+- Do NOT flatten structured content into a single paragraph - preserve lists, sections, and formatting
+- **CRITICAL: Do NOT include "Others" category if ANY other category is present. "Others" should ONLY be used when the note truly does not fit into any of the main categories above.**
+
+Return ONLY the JSON response."""
+
+_OPENAI_SYSTEM = """You are an AI assistant that analyzes personal notes and extracts structured information into specific categories.
+
+Available categories:
+{category_definitions}
+
+Return ONLY a JSON object with this structure:
+{{
+    "categories": {{
+        "category_name": {{"content": "specific factual information", "confidence": 0.85}}
+    }}
+}}
+
+CRITICAL INSTRUCTION:
+- **ONLY extract information from the "New Note to Analyze" section in the user message**
+- **DO NOT extract or re-categorize any content from the "Retrieved Relevant History" section - that information has already been categorized**
+- The history is provided ONLY for context and consistency, not for re-categorization
+
+IMPORTANT FORMATTING RULES:
+- **CRITICAL: ONLY extract from the NEW note, not from the history section**
+- **CRITICAL FORMATTING RULES:**
+  - PRESERVE ALL BULLET POINTS: If the input has bullet points (using `- `, `•`, `*`, `+`, or any list format), you MUST preserve them exactly as `- ` (dash-space) format in your output
+  - PRESERVE LINE BREAKS: Maintain all line breaks (`\n`) from the original text
+  - PRESERVE STRUCTURE: If the input has indented bullets, sub-bullets, or hierarchical lists, maintain that structure using `- ` for each level
+  - PRESERVE SECTIONS: If the input has headers, sections, or categories, maintain that organization
+  - PRESERVE HEADERS: If the input has section headers (like "Experience:", "Education:", job titles, etc.), keep them as separate lines with the same formatting
+  - PRESERVE JOB TITLES AND DATES: If the input has job titles with dates (e.g., "Manager: Jan 2020 - Dec 2022 • 2 yrs"), preserve this exact format
+  - PRESERVE HIERARCHY: Maintain the exact hierarchical structure - headers, sub-headers, job titles, descriptions, bullet points
+  - Use markdown formatting: `- ` for bullet points, `**text**` for bold, `\n` for line breaks
+  - DO NOT convert bullet points to paragraphs - keep them as lists
+  - DO NOT flatten structured content - preserve lists, sections, headers, and formatting exactly as they appear
+  - DO NOT merge separate lines into one paragraph - keep each line as a separate line
+
+CRITICAL: UNDERSTAND HIERARCHICAL STRUCTURE
+- When a header/title is followed by bullet points or a list, ALL items in that list inherit the context of the header
+- Example: "Hobbies\n- Cooking\n- Doing work" means BOTH "Cooking" AND "Doing work" are hobbies (Avocation category)
+- Example: "Goals\n- Learn Spanish\n- Travel" means BOTH are goals
+- Example: "Interests\n- Reading\n- Music" means BOTH are interests (Avocation)
+- Do NOT categorize items under a header separately - they all belong to the same category as the header
+
+CRITICAL CATEGORIZATION RULE:
+- **Do NOT include "Others" category if ANY other category is present. "Others" should ONLY be used when the note truly does not fit into any of the main categories above. If you categorize the note into any main category (Actionable, Goals, Social, etc.), you must NOT also include "Others".**
+
+Only include categories with relevant content. Be factual and precise."""
+
+_OPENAI_USER_INSTRUCTIONS = """
+
+Return ONLY the JSON response with categories extracted from the NEW note above. Do NOT include any information from the history section."""
+
+# Fingerprint of every template above; part of the analysis cache key, so editing a template
+# or CATEGORY_DEFINITIONS stops cached analyses from being reused without a manual bump
+PROMPT_VERSION = hashlib.sha256("\0".join([
+    NO_HISTORY, CONTEXT_SEPARATOR, CATEGORY_DEFINITIONS, _HISTORY_HEADER, _HISTORY_FOOTER,
+    _NOTE_HEADER, _GEMINI_INSTRUCTIONS, _OPENAI_SYSTEM, _OPENAI_USER_INSTRUCTIONS
+]).encode('utf-8')).hexdigest()[:16]
+
+
+def _get_encoder():
+    """tiktoken's cl100k_base encoder if tiktoken is installed, else None"""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding('cl100k_base')
+        except Exception:
+            logger.info("tiktoken not available - estimating tokens as characters / 4")
+            _encoder = None
+        _encoder_loaded = True
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """Token count of ``text`` (exact for OpenAI models with tiktoken, a close estimate otherwise)"""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+class PromptBuilder:
+    """Builds the Gemini prompt and OpenAI messages for a note
+    
+    The instruction blocks never change, so they are formatted and token-counted once;
+    each call only joins them with the note, contact name and (trimmed) history. Every
+    build returns stats with the prompt's token count so callers can size rate-limit
+    reservations and log usage.
+    """
+    
+    def __init__(self, context_token_budget: int = 1500):
+        self.context_token_budget = context_token_budget
+        self._gemini_instructions = _GEMINI_INSTRUCTIONS.format(category_definitions=CATEGORY_DEFINITIONS)
+        self._openai_system = _OPENAI_SYSTEM.format(category_definitions=CATEGORY_DEFINITIONS)
+        self._static_tokens = {
+            'history': count_tokens(_HISTORY_HEADER + _HISTORY_FOOTER),
+            'note_header': count_tokens(_NOTE_HEADER),
+            'gemini_instructions': count_tokens(self._gemini_instructions),
+            'openai_system': count_tokens(self._openai_system),
+            'openai_user_instructions': count_tokens(_OPENAI_USER_INSTRUCTIONS),
+        }
+    
+    def trim_context(self, context: Optional[str]) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Keep the most relevant retrieved notes that fit in the context token budget
+        
+        Notes arrive most relevant first. Whole notes are kept until the budget runs out;
+        the first note that does not fit is cut short if at least a quarter of the budget
+        is left for it, and the rest are dropped.
+        
+        Returns:
+            tuple: (trimmed context or None, stats dict)
+        """
+        if not context or context == NO_HISTORY:
+            return None, {'context_tokens': 0, 'context_chunks': 0, 'context_chunks_dropped': 0}
+        
+        chunks = [chunk for chunk in context.split(CONTEXT_SEPARATOR) if chunk.strip()]
+        kept = []
+        used = 0
+        truncated = False
+        for chunk in chunks:
+            tokens = count_tokens(chunk)
+            remaining = self.context_token_budget - used
+            if tokens <= remaining:
+                kept.append(chunk)
+                used += tokens
+                continue
+            if remaining >= self.context_token_budget // 4:
+                cut = self._truncate(chunk, remaining)
+                kept.append(cut)
+                used += count_tokens(cut)
+                truncated = True
+            break
+        
+        dropped = len(chunks) - len(kept)
+        if dropped or truncated:
+            logger.info(f"Trimmed RAG context to {used} tokens ({len(kept)}/{len(chunks)} notes, budget {self.context_token_budget})")
+        stats = {'context_tokens': used, 'context_chunks': len(kept), 'context_chunks_dropped': dropped}
+        return (CONTEXT_SEPARATOR.join(kept) if kept else None), stats
+    
+    def gemini_prompt(self, content: str, contact_name: str, context: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """Single-turn Gemini prompt plus token stats"""
+        context, stats = self.trim_context(context)
+        head = f"Analyze this note about {contact_name} and extract structured information.\n\n"
+        parts = [head]
+        tokens = count_tokens(head) + count_tokens(content) + self._static_tokens['note_header'] + self._static_tokens['gemini_instructions']
+        if context:
+            parts += ["\n", _HISTORY_HEADER, context, _HISTORY_FOOTER]
+            tokens += stats['context_tokens'] + self._static_tokens['history']
+        parts += [_NOTE_HEADER, content, "\n\n", self._gemini_instructions]
+        stats['prompt_tokens'] = tokens
+        return "".join(parts), stats
+    
+    def openai_messages(self, content: str, contact_name: str, context: Optional[str] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """OpenAI system/user chat messages plus token stats"""
+        context, stats = self.trim_context(context)
+        parts = []
+        tokens = (self._static_tokens['openai_system'] + self._static_tokens['note_header']
+                  + count_tokens(content) + self._static_tokens['openai_user_instructions'])
+        if context:
+            parts += [_HISTORY_HEADER, context, _HISTORY_FOOTER]
+            tokens += stats['context_tokens'] + self._static_tokens['history']
+        parts += [_NOTE_HEADER, content, _OPENAI_USER_INSTRUCTIONS]
+        stats['prompt_tokens'] = tokens
+        return [
+            {"role": "system", "content": self._openai_system},
+            {"role": "user", "content": "".join(parts)}
+        ], stats
+    
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> str:
+        """Cut ``text`` to about ``max_tokens`` tokens, preferring a line boundary"""
+        encoder = _get_encoder()
+        if encoder is not None:
+            cut = encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+        else:
+            cut = text[:max_tokens * 4]
+        newline = cut.rfind("\n")
+        if newline > len(cut) // 2:
+            cut = cut[:newline]
+        return cut.rstrip() + "\n[...]"
+
+
+def get_prompt_builder() -> PromptBuilder:
+    """Get the process-wide PromptBuilder (context budget from PROMPT_CONTEXT_TOKEN_BUDGET)"""
+    global _prompt_builder
+    if _prompt_builder is None:
+        _prompt_builder = PromptBuilder(
+            context_token_budget=int(os.getenv('PROMPT_CONTEXT_TOKEN_BUDGET', 1500))
+        )
+    return _prompt_builder
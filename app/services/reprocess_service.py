@@ -0,0 +1,201 @@
+"""
+Reprocess Service
+Resumable batch re-analysis of existing raw notes after the category taxonomy changes
+"""
+
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable
+from sqlalchemy import or_
+from app.models import Contact, RawNote
+from app.services.note_service import get_note_service, AUDIT_SOURCES
+from app.utils.database import DatabaseManager
+from app.utils.local_store import get_data_dir
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILENAME = 'reprocess_checkpoint.json'
+
+
+class ReprocessJob:
+    """Re-analyze raw notes in id order, replacing each note's synthesized entries
+    
+    Notes are fetched in batches; each batch is analyzed with at most ``concurrency``
+    AI calls in flight (the shared rate limiter still applies), and the checkpoint is
+    written after every batch. The checkpoint records the filters it was made with, so
+    a rerun with the same filters resumes after the last completed batch and a rerun
+    with different filters is refused rather than silently skipping notes.
+    
+    Audit-trail notes (AUDIT_SOURCES, e.g. "Manual edit: ...") are skipped unless
+    ``sources`` names them. Near-duplicate notes (tagged ``duplicate_of``) are always
+    skipped: they share the analysis of the note they duplicate.
+    """
+    
+    def __init__(self, contact_ids: Optional[List[int]] = None, user_id: Optional[int] = None,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 sources: Optional[List[str]] = None, concurrency: int = 4, batch_size: int = 50,
+                 allow_offline: bool = False, checkpoint_path: Optional[str] = None):
+        self.filters = {
+            'contact_ids': sorted(contact_ids) if contact_ids else None,
+            'user_id': user_id,
+            'since': since.isoformat() if since else None,
+            'until': until.isoformat() if until else None,
+            'sources': sorted(sources) if sources else None,
+        }
+        self.since = since
+        self.until = until
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.allow_offline = allow_offline
+        self.checkpoint_path = checkpoint_path or os.path.join(get_data_dir(), CHECKPOINT_FILENAME)
+        self.db_manager = DatabaseManager()
+        self.note_service = get_note_service()
+    
+    def _query(self, session):
+        query = session.query(RawNote.id).filter(RawNote.metadata_tags['duplicate_of'].as_integer().is_(None))
+        if self.filters['contact_ids']:
+            query = query.filter(RawNote.contact_id.in_(self.filters['contact_ids']))
+        if self.filters['user_id'] is not None:
+            query = query.join(Contact, Contact.id == RawNote.contact_id).filter(Contact.user_id == self.filters['user_id'])
+        if self.since:
+            query = query.filter(RawNote.created_at >= self.since)
+        if self.until:
+            query = query.filter(RawNote.created_at < self.until)
+        if self.filters['sources']:
+            query = query.filter(RawNote.source.in_(self.filters['sources']))
+        else:
+            query = query.filter(or_(RawNote.source.is_(None), RawNote.source.notin_(AUDIT_SOURCES)))
+        return query
+    
+    def count_remaining(self, after_id: int = 0) -> int:
+        with self.db_manager.get_session() as session:
+            return self._query(session).filter(RawNote.id > after_id).count()
+    
+    def _next_batch(self, after_id: int) -> List[int]:
+        with self.db_manager.get_session() as session:
+            rows = self._query(session).filter(RawNote.id > after_id).order_by(RawNote.id).limit(self.batch_size).all()
+            return [row.id for row in rows]
+    
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """The saved checkpoint, or None if there is none
+        
+        Raises:
+            ValueError: The checkpoint belongs to a run with different filters
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('filters') != self.filters:
+            raise ValueError(
+                f"Checkpoint {self.checkpoint_path} was made with different filters "
+                f"({checkpoint.get('filters')}); restart the job or delete the checkpoint"
+            )
+        return checkpoint
+    
+    def _save_checkpoint(self, checkpoint: Dict[str, Any]):
+        checkpoint['updated_at'] = datetime.utcnow().isoformat()
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(temp_path, self.checkpoint_path)
+    
+    def clear_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+    
+    def _reprocess_one(self, note_id: int) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            result = self.note_service.reprocess_note(note_id, allow_offline=self.allow_offline)
+            return {'note_id': note_id, 'ok': True, 'categories_count': result['categories_count'],
+                    'seconds': time.perf_counter() - start}
+        except Exception as e:
+            logger.warning(f"Reprocessing note {note_id} failed: {e}")
+            return {'note_id': note_id, 'ok': False, 'error': str(e), 'seconds': time.perf_counter() - start}
+    
+    def _record(self, checkpoint: Dict[str, Any], outcome: Dict[str, Any]):
+        key = str(outcome['note_id'])
+        if outcome['ok']:
+            checkpoint['processed'] += 1
+            checkpoint['entries_written'] += outcome['categories_count']
+            checkpoint['failed'].pop(key, None)
+        else:
+            checkpoint['failed'][key] = outcome['error']
+    
+    def run(self, restart: bool = False, limit: Optional[int] = None,
+            on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Process the remaining notes and return the final checkpoint
+        
+        Args:
+            restart: Ignore (and overwrite) any existing checkpoint
+            limit: Stop after this many notes in this run (the checkpoint allows resuming)
+            on_progress: Called after each batch with a progress dict
+        
+        Failed notes are recorded in the checkpoint's ``failed`` map and keep their old
+        entries; rerun them with ``retry_failed``.
+        """
+        checkpoint = None if restart else self.load_checkpoint()
+        if checkpoint is None:
+            checkpoint = {
+                'filters': self.filters,
+                'last_note_id': 0,
+                'processed': 0,
+                'entries_written': 0,
+                'failed': {},
+                'started_at': datetime.utcnow().isoformat(),
+            }
+        else:
+            logger.info(f"Resuming reprocess after note {checkpoint['last_note_id']} ({checkpoint['processed']} done)")
+        
+        total = self.count_remaining(checkpoint['last_note_id'])
+        if limit is not None:
+            total = min(total, limit)
+        done = 0
+        run_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='kith-reprocess') as executor:
+            while limit is None or done < limit:
+                note_ids = self._next_batch(checkpoint['last_note_id'])
+                if limit is not None:
+                    note_ids = note_ids[:limit - done]
+                if not note_ids:
+                    break
+                
+                for outcome in executor.map(self._reprocess_one, note_ids):
+                    self._record(checkpoint, outcome)
+                done += len(note_ids)
+                checkpoint['last_note_id'] = note_ids[-1]
+                self._save_checkpoint(checkpoint)
+                
+                if on_progress:
+                    elapsed = time.perf_counter() - run_start
+                    rate = done / elapsed if elapsed > 0 else 0.0
+                    on_progress({
+                        'done': done,
+                        'total': total,
+                        'failed': len(checkpoint['failed']),
+                        'last_note_id': checkpoint['last_note_id'],
+                        'notes_per_second': rate,
+                        'eta_seconds': (total - done) / rate if rate else None,
+                    })
+        
+        checkpoint['run_seconds'] = round(time.perf_counter() - run_start, 1)
+        checkpoint['run_notes'] = done
+        self._save_checkpoint(checkpoint)
+        return checkpoint
+    
+    def retry_failed(self) -> Dict[str, Any]:
+        """Reprocess the notes the checkpoint recorded as failed"""
+        checkpoint = self.load_checkpoint()
+        if not checkpoint or not checkpoint['failed']:
+            return checkpoint or {}
+        note_ids = sorted(int(note_id) for note_id in checkpoint['failed'])
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='kith-reprocess') as executor:
+            for outcome in executor.map(self._reprocess_one, note_ids):
+                self._record(checkpoint, outcome)
+        self._save_checkpoint(checkpoint)
+        return checkpoint
@@ -0,0 +1,252 @@
+"""
+Vector Rebuild Service
+Resumable rebuild of the ChromaDB note vectors from raw_notes
+"""
+
+import os
+import json
+import time
+import logging
+import multiprocessing
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable
+import numpy as np
+from sqlalchemy import select, func
+from app.models import Contact, RawNote
+from app.utils.database import DatabaseManager
+from app.utils.local_store import get_data_dir
+from app.utils.chromadb_client import (
+    get_chroma_client, get_contact_collection, get_collection_cache, get_collection_mode,
+    delete_contact_collection, embed_texts
+)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILENAME = 'vector_rebuild_checkpoint.json'
+
+
+def _init_embedding_worker(threads: int):
+    # Each process gets a slice of the cores rather than all of them
+    os.environ.setdefault('EMBEDDING_THREADS', str(threads))
+
+
+def _embed_batch(texts: List[str]) -> np.ndarray:
+    return np.asarray(embed_texts(texts), dtype=np.float32)
+
+
+def write_note_vectors(rows, embeddings):
+    """Upsert embedded notes into their collections under the active layout
+    
+    ``rows`` need ``id``, ``contact_id``, ``user_id``, ``content`` and ``created_at``.
+    """
+    groups = {}
+    for row, embedding in zip(rows, embeddings):
+        collection = get_contact_collection(row.contact_id, user_id=row.user_id)
+        groups.setdefault(collection.name, (collection, []))[1].append((row, embedding))
+    for collection, records in groups.values():
+        collection.upsert(
+            ids=[f"note_{row.id}" for row, _ in records],
+            embeddings=[np.asarray(embedding, dtype=np.float32).tolist() for _, embedding in records],
+            documents=[row.content for row, _ in records],
+            metadatas=[{
+                "contact_id": row.contact_id,
+                "note_id": row.id,
+                "timestamp": (row.created_at or datetime.utcnow()).isoformat()
+            } for row, _ in records]
+        )
+
+
+class VectorRebuildJob:
+    """Re-embed raw notes in id order and upsert them into the vector store
+    
+    Notes are streamed from SQL with a server-side cursor and cut into batches. With
+    ``workers`` > 1 each batch is embedded in a process pool (at most two batches
+    per worker in flight), while this process writes finished batches in order, so
+    the checkpoint written after each batch always marks a prefix of the notes as
+    done. Like ReprocessJob, the checkpoint records the filters, the collection
+    layout and the embedding model, and resuming with different ones is refused.
+    """
+    
+    def __init__(self, contact_ids: Optional[List[int]] = None, user_id: Optional[int] = None,
+                 workers: int = 1, batch_size: int = 64, checkpoint_path: Optional[str] = None):
+        self.filters = {
+            'contact_ids': sorted(contact_ids) if contact_ids else None,
+            'user_id': user_id,
+            'collection_mode': get_collection_mode(),
+            'embedding_model': os.getenv('EMBEDDING_MODEL_NAME') or os.getenv('EMBEDDING_FUNCTION') or 'all-MiniLM-L6-v2',
+        }
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.checkpoint_path = checkpoint_path or os.path.join(get_data_dir(), CHECKPOINT_FILENAME)
+        self.db_manager = DatabaseManager()
+    
+    def _statement(self, after_id: int):
+        statement = (
+            select(RawNote.id, RawNote.contact_id, Contact.user_id, RawNote.content, RawNote.created_at)
+            .join(Contact, Contact.id == RawNote.contact_id)
+            .where(RawNote.id > after_id)
+        )
+        if self.filters['contact_ids']:
+            statement = statement.where(RawNote.contact_id.in_(self.filters['contact_ids']))
+        if self.filters['user_id'] is not None:
+            statement = statement.where(Contact.user_id == self.filters['user_id'])
+        return statement.order_by(RawNote.id)
+    
+    def count_remaining(self, after_id: int = 0) -> int:
+        with self.db_manager.get_session() as session:
+            return session.execute(
+                select(func.count()).select_from(self._statement(after_id).order_by(None).subquery())
+            ).scalar()
+    
+    def _stream_batches(self, session, after_id: int, limit: Optional[int]):
+        """Yield lists of note rows from a server-side cursor"""
+        result = session.execute(
+            self._statement(after_id).execution_options(stream_results=True, yield_per=self.batch_size)
+        )
+        remaining = limit
+        for partition in result.partitions():
+            if remaining is not None and len(partition) >= remaining:
+                partition = partition[:remaining]
+            remaining = None if remaining is None else remaining - len(partition)
+            # Empty notes are skipped but still advance the checkpoint
+            rows = [row for row in partition if row.content and row.content.strip()]
+            yield rows, partition[-1].id, len(partition)
+            if remaining is not None and remaining <= 0:
+                return
+    
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """The saved checkpoint, or None if there is none
+        
+        Raises:
+            ValueError: The checkpoint belongs to a run with different filters, layout or model
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('filters') != self.filters:
+            raise ValueError(
+                f"Checkpoint {self.checkpoint_path} was made with different settings "
+                f"({checkpoint.get('filters')}); restart the rebuild or delete the checkpoint"
+            )
+        return checkpoint
+    
+    def _save_checkpoint(self, checkpoint: Dict[str, Any]):
+        checkpoint['updated_at'] = datetime.utcnow().isoformat()
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(temp_path, self.checkpoint_path)
+    
+    def drop_existing(self):
+        """Delete the vectors this rebuild will rewrite (every note collection when unfiltered)"""
+        if self.filters['contact_ids'] is None and self.filters['user_id'] is None:
+            client = get_chroma_client()
+            for collection in client.list_collections():
+                if collection.name.startswith(('contact_', 'user_')):
+                    client.delete_collection(name=collection.name)
+            get_collection_cache().clear()
+            return
+        with self.db_manager.get_session() as session:
+            query = session.query(Contact.id, Contact.user_id)
+            if self.filters['contact_ids']:
+                query = query.filter(Contact.id.in_(self.filters['contact_ids']))
+            if self.filters['user_id'] is not None:
+                query = query.filter(Contact.user_id == self.filters['user_id'])
+            contacts = query.all()
+        for contact_id, user_id in contacts:
+            delete_contact_collection(contact_id, user_id=user_id)
+    
+    def run(self, restart: bool = False, drop: bool = False, limit: Optional[int] = None,
+            on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Rebuild the remaining notes and return the final checkpoint
+        
+        Args:
+            restart: Ignore (and overwrite) any existing checkpoint
+            drop: On a fresh start, delete the existing vectors first
+            limit: Stop after this many notes in this run (the checkpoint allows resuming)
+            on_progress: Called after each batch with a progress dict (``done`` counts
+                notes scanned, including empty notes that are skipped)
+        """
+        checkpoint = None if restart else self.load_checkpoint()
+        if checkpoint is None:
+            if drop:
+                self.drop_existing()
+            checkpoint = {
+                'filters': self.filters,
+                'last_note_id': 0,
+                'processed': 0,
+                'started_at': datetime.utcnow().isoformat(),
+            }
+        else:
+            logger.info(f"Resuming vector rebuild after note {checkpoint['last_note_id']} ({checkpoint['processed']} done)")
+        
+        total = self.count_remaining(checkpoint['last_note_id'])
+        if limit is not None:
+            total = min(total, limit)
+        done = 0
+        embedded = 0
+        run_start = time.perf_counter()
+        
+        pool = None
+        if self.workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            pool = multiprocessing.get_context('spawn').Pool(
+                self.workers, initializer=_init_embedding_worker, initargs=(threads,)
+            )
+        try:
+            with self.db_manager.get_session() as session:
+                in_flight = deque()
+                batches = self._stream_batches(session, checkpoint['last_note_id'], limit)
+                exhausted = False
+                while not exhausted or in_flight:
+                    # Keep the pool busy without reading the whole table ahead
+                    while not exhausted and len(in_flight) < self.workers * 2:
+                        try:
+                            rows, last_id, scanned = next(batches)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        texts = [row.content for row in rows]
+                        if not texts:
+                            pending = None
+                        elif pool is not None:
+                            pending = pool.apply_async(_embed_batch, (texts,))
+                        else:
+                            pending = _embed_batch(texts)
+                        in_flight.append((rows, last_id, scanned, pending))
+                        if pool is None:
+                            break
+                    if not in_flight:
+                        break
+                    
+                    rows, last_id, scanned, pending = in_flight.popleft()
+                    if rows:
+                        embeddings = pending.get() if pool is not None else pending
+                        write_note_vectors(rows, embeddings)
+                    done += scanned
+                    embedded += len(rows)
+                    checkpoint['processed'] += len(rows)
+                    checkpoint['last_note_id'] = last_id
+                    self._save_checkpoint(checkpoint)
+                    
+                    if on_progress:
+                        elapsed = time.perf_counter() - run_start
+                        rate = done / elapsed if elapsed > 0 else 0.0
+                        on_progress({
+                            'done': done,
+                            'total': total,
+                            'last_note_id': checkpoint['last_note_id'],
+                            'notes_per_second': rate,
+                            'eta_seconds': (total - done) / rate if rate else None,
+                        })
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        
+        checkpoint['run_seconds'] = round(time.perf_counter() - run_start, 1)
+        checkpoint['run_notes'] = embedded
+        self._save_checkpoint(checkpoint)
+        return checkpoint
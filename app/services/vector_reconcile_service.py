@@ -0,0 +1,233 @@
+"""
+Vector Reconcile Service
+Diffs SQL contacts and notes against ChromaDB collections and ids, removing orphans and re-embedding missing notes
+"""
+
+import os
+import re
+import time
+import fcntl
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Set
+from sqlalchemy import select
+from app.models import Contact, RawNote
+from app.utils.database import DatabaseManager
+from app.utils.local_store import get_data_dir
+from app.utils.chromadb_client import (
+    get_chroma_client, get_collection_cache, get_collection_mode, get_collection_name, embed_texts
+)
+from app.services.vector_rebuild_service import write_note_vectors
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILENAME = 'vector_reconcile.lock'
+
+COLLECTION_PATTERN = re.compile(r'^(contact|user)_(\d+)$')
+
+
+class VectorReconcileJob:
+    """One pass of SQL <-> vector store reconciliation
+    
+    1. Collections of the active layout whose contact (or user) no longer exists
+       are deleted, after re-checking the owner in SQL and only if none of their
+       vectors is younger than ``grace_minutes`` (the owner may have been created
+       after the owners snapshot). Collections of the other layout are only
+       reported; use migrate_vector_store.py for those.
+    2. Each remaining collection is paged through ``page_size`` ids at a time;
+       vectors whose note is gone from raw_notes or filed under the wrong
+       collection are deleted, unless younger than ``grace_minutes`` (their note
+       may still be in an uncommitted transaction).
+    3. raw_notes is streamed with a server-side cursor and notes without a vector
+       are re-embedded in batches, at most ``max_reembed`` per run so a scheduled
+       job spreads a large backlog over several runs.
+    
+    A lock file keeps scheduled runs from overlapping. With ``dry_run`` nothing is
+    changed and the summary reports what would be.
+    """
+    
+    def __init__(self, dry_run: bool = False, page_size: int = 1000, batch_size: int = 64,
+                 max_reembed: Optional[int] = None, grace_minutes: float = 10.0):
+        self.dry_run = dry_run
+        self.page_size = max(1, page_size)
+        self.batch_size = max(1, batch_size)
+        self.max_reembed = max_reembed
+        self.grace = timedelta(minutes=grace_minutes)
+        self.mode = get_collection_mode()
+        self.db_manager = DatabaseManager()
+        self.summary = {
+            'dry_run': dry_run,
+            'collection_mode': self.mode,
+            'collections_checked': 0,
+            'orphan_collections': [],
+            'recent_orphan_collections': 0,
+            'other_layout_collections': 0,
+            'vectors_checked': 0,
+            'orphan_vectors': 0,
+            'missing_notes': 0,
+            'reembedded': 0,
+            'reembed_deferred': 0,
+        }
+    
+    def _lock(self):
+        lock_file = open(os.path.join(get_data_dir(), LOCK_FILENAME), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError("Another vector reconcile is already running")
+        return lock_file
+    
+    def _owners(self) -> Dict[int, int]:
+        """contact_id -> user_id for every contact"""
+        with self.db_manager.get_session() as session:
+            return dict(session.execute(select(Contact.id, Contact.user_id)).all())
+    
+    def _owner_exists(self, kind: str, owner_id: int) -> bool:
+        """Current (not snapshot) check that a collection's contact, or a contact of its user, exists"""
+        column = Contact.user_id if kind == 'user' else Contact.id
+        with self.db_manager.get_session() as session:
+            return session.execute(select(Contact.id).where(column == owner_id).limit(1)).first() is not None
+    
+    def _has_recent_vectors(self, collection, now: datetime) -> bool:
+        offset = 0
+        while True:
+            page = collection.get(limit=self.page_size, offset=offset, include=['metadatas'])
+            if not page['ids']:
+                return False
+            if any(self._is_recent(metadata, now) for metadata in page['metadatas']):
+                return True
+            offset += len(page['ids'])
+    
+    def _check_collections(self, owners: Dict[int, int]) -> List[Any]:
+        """Delete orphan collections; return the live collections of the active layout"""
+        client = get_chroma_client()
+        users = set(owners.values())
+        active_kind = 'user' if self.mode == 'per_user' else 'contact'
+        live = []
+        now = datetime.utcnow()
+        for collection in client.list_collections():
+            match = COLLECTION_PATTERN.match(collection.name)
+            if not match:
+                continue
+            kind, owner_id = match.group(1), int(match.group(2))
+            if kind != active_kind:
+                self.summary['other_layout_collections'] += 1
+                continue
+            self.summary['collections_checked'] += 1
+            exists = owner_id in users if kind == 'user' else owner_id in owners
+            if exists or self._owner_exists(kind, owner_id):
+                live.append(collection)
+                continue
+            if self._has_recent_vectors(collection, now):
+                # Possibly a contact created after the owners snapshot, still uncommitted
+                self.summary['recent_orphan_collections'] += 1
+                continue
+            self.summary['orphan_collections'].append(collection.name)
+            if not self.dry_run:
+                client.delete_collection(name=collection.name)
+                get_collection_cache().invalidate(collection.name)
+                logger.info(f"🗑️ Deleted orphan collection {collection.name}")
+        return live
+    
+    def _is_recent(self, metadata: Optional[Dict[str, Any]], now: datetime) -> bool:
+        try:
+            return now - datetime.fromisoformat(metadata['timestamp']) < self.grace
+        except (TypeError, KeyError, ValueError):
+            return False
+    
+    def _check_vectors(self, collection, owners: Dict[int, int]) -> Set[int]:
+        """Delete orphan vectors from one collection; return the note ids it holds"""
+        present = set()
+        orphan_ids = []
+        now = datetime.utcnow()
+        offset = 0
+        while True:
+            page = collection.get(limit=self.page_size, offset=offset, include=['metadatas'])
+            ids = page['ids']
+            if not ids:
+                break
+            offset += len(ids)
+            self.summary['vectors_checked'] += len(ids)
+            
+            note_ids = {}
+            for vector_id, metadata in zip(ids, page['metadatas']):
+                note_id = (metadata or {}).get('note_id')
+                if note_id is None and vector_id.startswith('note_') and vector_id[5:].isdigit():
+                    note_id = int(vector_id[5:])
+                if note_id is None:
+                    orphan_ids.append(vector_id)
+                    continue
+                note_ids[vector_id] = (int(note_id), metadata)
+            
+            with self.db_manager.get_session() as session:
+                notes = dict(session.execute(
+                    select(RawNote.id, RawNote.contact_id)
+                    .where(RawNote.id.in_([note_id for note_id, _ in note_ids.values()]))
+                ).all())
+            
+            for vector_id, (note_id, metadata) in note_ids.items():
+                contact_id = notes.get(note_id)
+                expected = None
+                if contact_id is not None and contact_id in owners:
+                    expected = get_collection_name(contact_id, user_id=owners[contact_id], mode=self.mode)
+                if expected == collection.name:
+                    present.add(note_id)
+                elif not self._is_recent(metadata, now):
+                    orphan_ids.append(vector_id)
+        
+        self.summary['orphan_vectors'] += len(orphan_ids)
+        if orphan_ids and not self.dry_run:
+            for start in range(0, len(orphan_ids), self.page_size):
+                collection.delete(ids=orphan_ids[start:start + self.page_size])
+            logger.info(f"🗑️ Deleted {len(orphan_ids)} orphan vectors from {collection.name}")
+        return present
+    
+    def _reembed_missing(self, present: Dict[str, Set[int]], owners: Dict[int, int]):
+        """Stream raw_notes and re-embed the notes with no vector"""
+        statement = (
+            select(RawNote.id, RawNote.contact_id, Contact.user_id, RawNote.content, RawNote.created_at)
+            .join(Contact, Contact.id == RawNote.contact_id)
+            .order_by(RawNote.id)
+            .execution_options(stream_results=True, yield_per=self.page_size)
+        )
+        batch = []
+        with self.db_manager.get_session() as session:
+            for row in session.execute(statement):
+                if not row.content or not row.content.strip():
+                    continue
+                name = get_collection_name(row.contact_id, user_id=row.user_id, mode=self.mode)
+                if row.id in present.get(name, ()):
+                    continue
+                self.summary['missing_notes'] += 1
+                if self.dry_run:
+                    continue
+                if self.max_reembed is not None and self.summary['reembedded'] + len(batch) >= self.max_reembed:
+                    self.summary['reembed_deferred'] += 1
+                    continue
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    batch = []
+        if batch:
+            self._write(batch)
+    
+    def _write(self, rows):
+        write_note_vectors(rows, embed_texts([row.content for row in rows]))
+        self.summary['reembedded'] += len(rows)
+    
+    def run(self) -> Dict[str, Any]:
+        """Reconcile once and return the summary"""
+        lock_file = self._lock()
+        start = time.perf_counter()
+        try:
+            owners = self._owners()
+            collections = self._check_collections(owners)
+            present = {collection.name: self._check_vectors(collection, owners) for collection in collections}
+            self._reembed_missing(present, owners)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        self.summary['seconds'] = round(time.perf_counter() - start, 1)
+        logger.info(f"Vector reconcile finished: {self.summary}")
+        return self.summary
@@ -0,0 +1,153 @@
+"""
+AI Clients
+Process-lifetime Gemini and OpenAI clients with pooled keep-alive connections
+"""
+
+import os
+import threading
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Global clients (created lazily, shared by all request threads in the worker)
+_gemini_configured_key = None
+_gemini_models = {}
+_openai_client = None
+_openai_client_key = None
+_openai_legacy_key = None
+_clients_lock = threading.Lock()
+
+
+def get_http_pool_size() -> int:
+    """Maximum pooled keep-alive connections per provider"""
+    return int(os.getenv('AI_HTTP_POOL_SIZE', 10))
+
+
+def get_http_timeout() -> float:
+    """Per-request timeout for provider calls, in seconds"""
+    return float(os.getenv('AI_HTTP_TIMEOUT', 60))
+
+
+def get_emulator_url() -> Optional[str]:
+    """Base URL of a local provider emulator (see ai_emulator.py), or None to call the real APIs"""
+    url = os.getenv('AI_EMULATOR_URL')
+    return url.rstrip('/') if url else None
+
+
+def get_gemini_model(api_key: str, model_name: str):
+    """Get a cached GenerativeModel, configuring the Gemini SDK once per process
+    
+    ``genai.configure`` resets the SDK's cached transport, so calling it per request
+    throws away the open channel. It is only called again if the API key changes.
+    """
+    global _gemini_configured_key
+    model = _gemini_models.get(model_name)
+    if model is not None and _gemini_configured_key == api_key:
+        return model
+    
+    import google.generativeai as genai
+    with _clients_lock:
+        if _gemini_configured_key != api_key:
+            transport = os.getenv('GEMINI_TRANSPORT') or None
+            emulator_url = get_emulator_url()
+            if emulator_url:
+                # The emulator speaks the REST API only
+                genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': emulator_url})
+                logger.warning(f"🧪 Gemini calls go to the emulator at {emulator_url}")
+            else:
+                genai.configure(api_key=api_key, transport=transport)
+            _gemini_configured_key = api_key
+            _gemini_models.clear()
+            logger.info(f"Configured Gemini client (transport={transport or 'default'})")
+        model = _gemini_models.get(model_name)
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            _gemini_models[model_name] = model
+    return model
+
+
+def get_openai_client(api_key: str):
+    """Get the shared OpenAI v1 client, or None when only the legacy (<1.0) SDK is installed"""
+    global _openai_client, _openai_client_key
+    if _openai_client is not None and _openai_client_key == api_key:
+        return _openai_client
+    
+    try:
+        from openai import OpenAI
+    except ImportError:
+        return None
+    
+    with _clients_lock:
+        if _openai_client is None or _openai_client_key != api_key:
+            import httpx
+            pool_size = get_http_pool_size()
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                timeout=get_http_timeout()
+            )
+            emulator_url = get_emulator_url()
+            base_url = f"{emulator_url}/v1" if emulator_url else None
+            _openai_client = OpenAI(api_key=api_key, http_client=http_client, base_url=base_url)
+            _openai_client_key = api_key
+            if emulator_url:
+                logger.warning(f"🧪 OpenAI calls go to the emulator at {emulator_url}")
+            logger.info(f"Created shared OpenAI client (pool size {pool_size})")
+    return _openai_client
+
+
+def _configure_openai_legacy(api_key: str):
+    """Point the legacy SDK's module-level state at a shared, pooled requests session"""
+    global _openai_legacy_key
+    if _openai_legacy_key == api_key:
+        return
+    
+    import openai
+    import requests
+    from requests.adapters import HTTPAdapter
+    with _clients_lock:
+        if _openai_legacy_key != api_key:
+            pool_size = get_http_pool_size()
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            openai.api_key = api_key
+            openai.requestssession = session
+            emulator_url = get_emulator_url()
+            if emulator_url:
+                openai.api_base = f"{emulator_url}/v1"
+                logger.warning(f"🧪 OpenAI calls go to the emulator at {emulator_url}")
+            _openai_legacy_key = api_key
+            logger.info(f"Configured legacy OpenAI SDK with shared session (pool size {pool_size})")
+
+
+def openai_chat_completion(api_key: str, **kwargs):
+    """Create a chat completion through whichever OpenAI SDK is installed
+    
+    Returns the SDK response object; both SDKs expose ``choices[0].message.content``.
+    """
+    client = get_openai_client(api_key)
+    if client is not None:
+        return client.chat.completions.create(**kwargs)
+    
+    import openai
+    _configure_openai_legacy(api_key)
+    return openai.ChatCompletion.create(request_timeout=get_http_timeout(), **kwargs)
+
+
+def openai_chat_completion_stream(api_key: str, **kwargs):
+    """Stream a chat completion, yielding text deltas as they arrive"""
+    client = get_openai_client(api_key)
+    if client is not None:
+        for chunk in client.chat.completions.create(stream=True, **kwargs):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        return
+    
+    import openai
+    _configure_openai_legacy(api_key)
+    for chunk in openai.ChatCompletion.create(stream=True, request_timeout=get_http_timeout(), **kwargs):
+        text = chunk['choices'][0]['delta'].get('content') if chunk['choices'] else None
+        if text:
+            yield text
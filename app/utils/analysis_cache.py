@@ -0,0 +1,241 @@
+"""
+Analysis Cache
+Content-addressed cache for LLM note analysis: in-process LRU in front of a shared SQLite tier
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from app.utils.hashing import normalize_text, content_hash
+from app.utils.local_store import get_local_db
+
+logger = logging.getLogger(__name__)
+
+_analysis_cache = None
+_analysis_cache_lock = threading.Lock()
+
+
+class AnalysisCache:
+    """Two-tier cache of analysis results keyed by normalized note content
+    
+    The memory tier is a bounded LRU per worker process. The disk tier is a SQLite
+    file in the data directory, so every gunicorn worker on the host shares hits.
+    Entries expire after ``ttl_seconds``; the disk tier is trimmed to
+    ``disk_max_bytes`` by evicting least-recently-used rows.
+    """
+    
+    DB_NAME = 'analysis_cache'
+    TRIM_EVERY_N_WRITES = 50
+    
+    def __init__(self, memory_entries: int = 256, ttl_seconds: int = 7 * 24 * 3600,
+                 disk_max_bytes: int = 64 * 1024 * 1024, disk_enabled: bool = True):
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_enabled = disk_enabled
+        
+        self._memory = OrderedDict()  # key -> (stored_at, json_text)
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'expired': 0,
+            'errors': 0,
+        }
+        
+        if self.disk_enabled:
+            try:
+                self._init_disk()
+            except Exception as e:
+                logger.warning(f"Analysis cache disk tier unavailable, using memory only: {e}")
+                self.disk_enabled = False
+    
+    @staticmethod
+    def make_key(content: str, context: Optional[str], model: str, prompt_version: str) -> str:
+        """Build the cache key from normalized content, retrieved context, model and prompt version
+        
+        History chunks identical to the note itself are left out of the key: when a note
+        is re-submitted, its first copy is retrieved as context and would otherwise
+        make every retry a miss.
+        """
+        normalized_content = normalize_text(content)
+        chunks = [normalize_text(chunk) for chunk in (context or '').split('\n---\n')]
+        normalized_context = '\n---\n'.join(chunk for chunk in chunks if chunk and chunk != normalized_content)
+        return content_hash(normalized_content, normalized_context, model, prompt_version)
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh copy of the cached analysis, or None on miss"""
+        now = time.time()
+        
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, payload = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return json.loads(payload)
+                del self._memory[key]
+                self._stats['expired'] += 1
+        
+        if self.disk_enabled:
+            try:
+                row = get_local_db(self.DB_NAME).execute(
+                    "SELECT value, created_at FROM analysis_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    payload, created_at = row
+                    if now - created_at <= self.ttl_seconds:
+                        get_local_db(self.DB_NAME).execute(
+                            "UPDATE analysis_cache SET accessed_at = ? WHERE key = ?", (now, key)
+                        )
+                        self._remember(key, created_at, payload)
+                        with self._lock:
+                            self._stats['disk_hits'] += 1
+                        return json.loads(payload)
+                    get_local_db(self.DB_NAME).execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                    with self._lock:
+                        self._stats['expired'] += 1
+            except Exception as e:
+                logger.warning(f"Analysis cache disk read failed: {e}")
+                with self._lock:
+                    self._stats['errors'] += 1
+        
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+    
+    def set(self, key: str, result: Dict[str, Any]):
+        """Store an analysis result in both tiers"""
+        now = time.time()
+        try:
+            payload = json.dumps(result, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            logger.debug(f"Analysis result not cacheable: {e}")
+            return
+        
+        self._remember(key, now, payload)
+        with self._lock:
+            self._stats['stores'] += 1
+        
+        if not self.disk_enabled:
+            return
+        try:
+            get_local_db(self.DB_NAME).execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode('utf-8')), now, now)
+            )
+            with self._lock:
+                self._writes_since_trim += 1
+                should_trim = self._writes_since_trim >= self.TRIM_EVERY_N_WRITES
+                if should_trim:
+                    self._writes_since_trim = 0
+            if should_trim:
+                self.trim()
+        except Exception as e:
+            logger.warning(f"Analysis cache disk write failed: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+    
+    def trim(self):
+        """Drop expired rows, then evict least-recently-used rows until under the size bound"""
+        if not self.disk_enabled:
+            return
+        conn = get_local_db(self.DB_NAME)
+        cutoff = time.time() - self.ttl_seconds
+        expired = conn.execute("DELETE FROM analysis_cache WHERE created_at < ?", (cutoff,)).rowcount
+        
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()[0]
+        evicted = 0
+        if total > self.disk_max_bytes:
+            # Walk rows oldest-access first and find the access-time cutoff that frees enough space
+            excess = total - self.disk_max_bytes
+            freed = 0
+            threshold = None
+            for accessed_at, size in conn.execute("SELECT accessed_at, size FROM analysis_cache ORDER BY accessed_at ASC"):
+                freed += size
+                threshold = accessed_at
+                if freed >= excess:
+                    break
+            if threshold is not None:
+                evicted = conn.execute("DELETE FROM analysis_cache WHERE accessed_at <= ?", (threshold,)).rowcount
+        
+        with self._lock:
+            self._stats['expired'] += max(expired, 0)
+            self._stats['disk_evictions'] += max(evicted, 0)
+        if expired or evicted:
+            logger.info(f"Analysis cache trimmed: {expired} expired, {evicted} evicted")
+    
+    def clear(self):
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+        if self.disk_enabled:
+            get_local_db(self.DB_NAME).execute("DELETE FROM analysis_cache")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this worker plus current tier sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 3) if lookups else None
+        stats['disk_enabled'] = self.disk_enabled
+        if self.disk_enabled:
+            try:
+                count, size = get_local_db(self.DB_NAME).execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache"
+                ).fetchone()
+                stats['disk_entries'] = count
+                stats['disk_bytes'] = size
+            except Exception as e:
+                stats['disk_error'] = str(e)
+        return stats
+    
+    def _remember(self, key: str, stored_at: float, payload: str):
+        with self._lock:
+            self._memory[key] = (stored_at, payload)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+                self._stats['memory_evictions'] += 1
+    
+    def _init_disk(self):
+        conn = get_local_db(self.DB_NAME)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_accessed ON analysis_cache (accessed_at)")
+
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """Get the process-wide analysis cache (None when disabled via ANALYSIS_CACHE_ENABLED=false)"""
+    global _analysis_cache
+    if os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return None
+    if _analysis_cache is None:
+        with _analysis_cache_lock:
+            if _analysis_cache is None:
+                _analysis_cache = AnalysisCache(
+                    memory_entries=int(os.getenv('ANALYSIS_CACHE_MEMORY_ENTRIES', 256)),
+                    ttl_seconds=int(os.getenv('ANALYSIS_CACHE_TTL_SECONDS', 7 * 24 * 3600)),
+                    disk_max_bytes=int(float(os.getenv('ANALYSIS_CACHE_DISK_MAX_MB', 64)) * 1024 * 1024),
+                    disk_enabled=os.getenv('ANALYSIS_CACHE_DISK', 'true').lower() not in ('0', 'false', 'no'),
+                )
+                logger.info("Analysis cache initialized")
+    return _analysis_cache
@@ -4,10 +4,16 @@ Manages vector database connections and collections for RAG pipeline
 """
 
 import os
+import time
+import importlib
 import logging
+import threading
+from collections import OrderedDict
+import numpy as np
 import chromadb
 from chromadb.config import Settings
-from typing import Optional
+from typing import Optional, Dict, Any, List
+from app.utils.metrics import get_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +21,99 @@ logger = logging.getLogger(__name__)
 _chroma_client = None
 _chroma_dir = None
 
+# Serializes collection creation when pipeline stages hit a new contact concurrently
+_collection_lock = threading.Lock()
+_client_lock = threading.Lock()
+_embedding_function_lock = threading.Lock()
+
+# Collection layouts: one collection per contact, or one per user filtered by contact_id metadata
+COLLECTION_MODES = ('per_contact', 'per_user')
+
+# contact_id -> user_id (contacts never change owner)
+_contact_owners: Dict[int, int] = {}
+
+_collection_cache = None
+_embedding_function = None
+
+
+class CollectionHandleCache:
+    """Bounded, thread-safe LRU of collection handles keyed by collection name
+    
+    A hit skips the get_or_create_collection round trip to Chroma's SQLite metadata
+    store. Lookup latency is tracked as a moving average of misses; each hit credits
+    that average to the ``chroma_lookup_ms_saved`` counter.
+    
+    Handles of collections deleted by another process go stale; callers invalidate
+    the name when an operation on a cached handle fails.
+    """
+    
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+        self._avg_lookup_ms = None
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, name: str) -> Optional[chromadb.Collection]:
+        with self._lock:
+            handle = self._handles.get(name)
+            if handle is None:
+                return None
+            self._handles.move_to_end(name)
+            self.hits += 1
+            saved = self._avg_lookup_ms
+        metrics = get_metrics()
+        metrics.increment('chroma_collection_cache', result='hit')
+        if saved is not None:
+            metrics.increment('chroma_lookup_ms_saved', saved)
+        return handle
+    
+    def put(self, name: str, handle: chromadb.Collection, lookup_ms: float):
+        with self._lock:
+            self._handles[name] = handle
+            self._handles.move_to_end(name)
+            while len(self._handles) > self.max_size:
+                self._handles.popitem(last=False)
+            self.misses += 1
+            if self._avg_lookup_ms is None:
+                self._avg_lookup_ms = lookup_ms
+            else:
+                self._avg_lookup_ms = 0.9 * self._avg_lookup_ms + 0.1 * lookup_ms
+        metrics = get_metrics()
+        metrics.increment('chroma_collection_cache', result='miss')
+        metrics.observe('chroma_collection_lookup_ms', lookup_ms)
+    
+    def invalidate(self, name: str):
+        with self._lock:
+            self._handles.pop(name, None)
+    
+    def clear(self):
+        with self._lock:
+            self._handles.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._handles),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'avg_lookup_ms': round(self._avg_lookup_ms, 2) if self._avg_lookup_ms is not None else None,
+            }
+
+
+def get_collection_cache() -> CollectionHandleCache:
+    """Get the process-wide collection handle cache (CHROMA_COLLECTION_CACHE_SIZE bounds it)"""
+    global _collection_cache
+    if _collection_cache is None:
+        with _collection_lock:
+            if _collection_cache is None:
+                _collection_cache = CollectionHandleCache(int(os.getenv('CHROMA_COLLECTION_CACHE_SIZE', 256)))
+    return _collection_cache
+
 
 def get_chroma_dir():
     """Get ChromaDB directory from environment or use default"""
@@ -34,38 +133,226 @@ def get_chroma_client():
     """Get or create ChromaDB client"""
     global _chroma_client
     if _chroma_client is None:
+        # Store and retrieval stages can race to create the client on the first note
+        with _client_lock:
+            if _chroma_client is None:
+                try:
+                    chroma_dir = get_chroma_dir()
+                    _chroma_client = chromadb.PersistentClient(
+                        path=chroma_dir,
+                        settings=Settings(anonymized_telemetry=False, allow_reset=True)
+                    )
+                    logger.info("ChromaDB client initialized")
+                except Exception as e:
+                    logger.error(f"Failed to initialize ChromaDB client: {e}")
+                    raise
+    return _chroma_client
+
+
+def _load_embedding_function():
+    """Base embedding function: EMBEDDING_FUNCTION ('package.module:factory') or Chroma's default model"""
+    spec = os.getenv('EMBEDDING_FUNCTION')
+    if spec:
+        module_name, _, factory_name = spec.partition(':')
+        factory = getattr(importlib.import_module(module_name), factory_name)
+        logger.info(f"Using embedding function {spec}")
+        return factory()
+    from app.utils.embedding_model import LocalEmbeddingModel
+    threads = os.getenv('EMBEDDING_THREADS')
+    return LocalEmbeddingModel(
+        threads=int(threads) if threads else None,
+        model_dir=os.getenv('EMBEDDING_MODEL_DIR')
+    )
+
+
+def get_embedding_function():
+    """Embedding function shared by every collection and the batching writer
+    
+    The local ONNX model (app.utils.embedding_model) unless EMBEDDING_FUNCTION names
+    another factory. Wrapped in a persistent EmbeddingCache unless EMBEDDING_CACHE_ENABLED is false;
+    EMBEDDING_CACHE_SIZE bounds the number of cached vectors. The cache is namespaced
+    by EMBEDDING_MODEL_NAME so switching models never serves stale vectors.
+    """
+    global _embedding_function
+    if _embedding_function is None:
+        with _embedding_function_lock:
+            if _embedding_function is None:
+                embedding_function = _load_embedding_function()
+                if os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no'):
+                    from app.utils.embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+                    namespace = os.getenv('EMBEDDING_MODEL_NAME') or os.getenv('EMBEDDING_FUNCTION') or 'all-MiniLM-L6-v2'
+                    cache = EmbeddingCache(namespace, capacity=int(os.getenv('EMBEDDING_CACHE_SIZE', 20000)))
+                    embedding_function = CachedEmbeddingFunction(embedding_function, cache)
+                _embedding_function = embedding_function
+    return _embedding_function
+
+
+def get_embedding_cache():
+    """The EmbeddingCache in front of the embedding function, or None when disabled"""
+    return getattr(get_embedding_function(), 'cache', None)
+
+
+def get_embedding_model():
+    """The local embedding model behind the cache, or None when EMBEDDING_FUNCTION replaces it"""
+    from app.utils.embedding_model import LocalEmbeddingModel
+    embedding_function = get_embedding_function()
+    model = getattr(embedding_function, 'base', embedding_function)
+    return model if isinstance(model, LocalEmbeddingModel) else None
+
+
+def start_embedding_model(mode: Optional[str] = None):
+    """Load and warm up the local embedding model at worker start
+    
+    EMBEDDING_PRELOAD selects the mode: 'background' (default) loads in a daemon
+    thread so boot is not delayed, 'eager' loads before returning, 'off' leaves it
+    to the first note. Failures are logged; the model is then loaded on first use.
+    """
+    mode = (mode or os.getenv('EMBEDDING_PRELOAD', 'background')).lower()
+    if mode in ('off', 'lazy', '0', 'false', 'no'):
+        return
+    model = get_embedding_model()
+    if model is None:
+        return
+    
+    def load():
         try:
-            chroma_dir = get_chroma_dir()
-            _chroma_client = chromadb.PersistentClient(
-                path=chroma_dir,
-                settings=Settings(anonymized_telemetry=False, allow_reset=True)
-            )
-            logger.info("ChromaDB client initialized")
+            model.warm_up()
         except Exception as e:
-            logger.error(f"Failed to initialize ChromaDB client: {e}")
-            raise
-    return _chroma_client
+            logger.warning(f"⚠️ Embedding model preload failed, will load on first use: {e}")
+    
+    if mode == 'eager':
+        load()
+    else:
+        threading.Thread(target=load, name='kith-embedding-preload', daemon=True).start()
+
 
+def get_collection_mode() -> str:
+    """Collection layout from CHROMA_COLLECTION_MODE (per_contact or per_user, default per_contact)"""
+    mode = os.getenv('CHROMA_COLLECTION_MODE', 'per_contact').strip().lower()
+    if mode not in COLLECTION_MODES:
+        logger.warning(f"⚠️ Unknown CHROMA_COLLECTION_MODE '{mode}', using per_contact")
+        return 'per_contact'
+    return mode
 
-def get_contact_collection(contact_id: int, prefix: str = "contact_") -> chromadb.Collection:
-    """Get or create ChromaDB collection for a specific contact"""
+
+def get_contact_owner(contact_id: int) -> int:
+    """User ID owning a contact, cached for the life of the process"""
+    owner = _contact_owners.get(contact_id)
+    if owner is None:
+        from app.models import Contact
+        from app.utils.database import DatabaseManager
+        with DatabaseManager().get_session() as session:
+            contact = session.get(Contact, contact_id)
+            if contact is None:
+                raise ValueError(f"Contact {contact_id} not found")
+            owner = contact.user_id
+        _contact_owners[contact_id] = owner
+    return owner
+
+
+def get_collection_name(contact_id: int, user_id: Optional[int] = None, mode: Optional[str] = None) -> str:
+    """Name of the collection holding a contact's notes under the given (or configured) layout"""
+    mode = mode or get_collection_mode()
+    if mode == 'per_user':
+        if user_id is None:
+            user_id = get_contact_owner(contact_id)
+        return f"user_{user_id}"
+    return f"contact_{contact_id}"
+
+
+def contact_filter(contact_id: int, where: Optional[Dict[str, Any]] = None,
+                   mode: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Metadata filter restricting a query to one contact's notes
+    
+    Per-contact collections need no contact clause; shared per-user collections do.
+    ``where`` is an extra condition to combine with it.
+    """
+    mode = mode or get_collection_mode()
+    clauses = []
+    if mode == 'per_user':
+        clauses.append({"contact_id": contact_id})
+    if where:
+        clauses.append(where)
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def get_contact_collection(contact_id: int, prefix: str = "contact_",
+                           user_id: Optional[int] = None) -> chromadb.Collection:
+    """Get or create the ChromaDB collection holding a contact's notes
+    
+    In per_user mode this is the owner's shared collection; queries against it must
+    be filtered with ``contact_filter``.
+    
+    Handles are cached by collection name (see CollectionHandleCache).
+    """
     try:
-        client = get_chroma_client()
-        collection_name = f"{prefix}{contact_id}"
-        collection = client.get_or_create_collection(
-            name=collection_name,
-            metadata={"contact_id": contact_id}
-        )
-        return collection
+        if get_collection_mode() == 'per_user':
+            collection_name = get_collection_name(contact_id, user_id=user_id, mode='per_user')
+            metadata = {"user_id": int(collection_name[len("user_"):])}
+        else:
+            collection_name = f"{prefix}{contact_id}"
+            metadata = {"contact_id": contact_id}
+        
+        return _get_or_create_collection(collection_name, metadata)
     except Exception as e:
         logger.error(f"Failed to get contact collection for contact {contact_id}: {e}")
         raise
 
 
-def store_note_in_chromadb(contact_id: int, note_content: str, note_id: int):
-    """Store a note in ChromaDB for RAG retrieval"""
+def get_user_collection(user_id: int) -> chromadb.Collection:
+    """Get or create a user's shared collection (per_user layout)"""
+    return _get_or_create_collection(f"user_{user_id}", {"user_id": user_id})
+
+
+def _get_or_create_collection(collection_name: str, metadata: Dict[str, Any]) -> chromadb.Collection:
+    cache = get_collection_cache()
+    collection = cache.get(collection_name)
+    if collection is not None:
+        return collection
+    
+    client = get_chroma_client()
+    # Resolved before taking _collection_lock: the first call loads the model
+    embedding_function = get_embedding_function()
+    start = time.perf_counter()
+    with _collection_lock:
+        collection = client.get_or_create_collection(
+            name=collection_name,
+            metadata=metadata,
+            embedding_function=embedding_function
+        )
+    cache.put(collection_name, collection, (time.perf_counter() - start) * 1000)
+    return collection
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed texts with the shared embedding function, in one call"""
+    return get_embedding_function()(list(texts))
+
+
+def store_note_in_chromadb(contact_id: int, note_content: str, note_id: int,
+                           embedding: Optional[List[float]] = None):
+    """Store a note in ChromaDB for RAG retrieval
+    
+    Pass ``embedding`` when the note has already been embedded (e.g. for its RAG
+    query) so it is not embedded again. With VECTOR_WRITE_BEHIND enabled the note is
+    journaled and written by the batching writer (app.utils.vector_writer) instead.
+    """
+    from app.utils.vector_writer import write_behind_enabled, get_vector_writer
+    if write_behind_enabled():
+        try:
+            get_vector_writer().enqueue(contact_id, note_content, note_id, embedding=embedding)
+        except Exception as e:
+            logger.warning(f"Failed to queue note for ChromaDB: {e}")
+        return
+    
+    collection = None
     try:
         collection = get_contact_collection(contact_id)
+        add_kwargs = {'embeddings': [embedding]} if embedding is not None else {}
         collection.add(
             documents=[note_content],
             ids=[f"note_{note_id}"],
@@ -73,20 +360,60 @@ def store_note_in_chromadb(contact_id: int, note_content: str, note_id: int):
                 "contact_id": contact_id,
                 "note_id": note_id,
                 "timestamp": __import__('datetime').datetime.utcnow().isoformat()
-            }]
+            }],
+            **add_kwargs
         )
         logger.debug(f"Stored note {note_id} in ChromaDB for contact {contact_id}")
     except Exception as e:
+        if collection is not None:
+            # The cached handle may point at a collection deleted elsewhere
+            get_collection_cache().invalidate(collection.name)
         logger.warning(f"Failed to store note in ChromaDB: {e}")
 
 
-def get_relevant_history(contact_id: int, query_text: str, n_results: int = 3) -> str:
-    """Retrieve relevant history from ChromaDB for RAG context"""
+def get_relevant_history(contact_id: int, query_text: Optional[str] = None, n_results: int = 3,
+                         exclude_note_id: Optional[int] = None,
+                         query_embedding: Optional[List[float]] = None) -> str:
+    """Retrieve relevant history from ChromaDB for RAG context
+    
+    Unless RAG_HYBRID is disabled, vector results are fused with a BM25 search of
+    the contact's notes (see app.utils.hybrid_retriever).
+    
+    Args:
+        contact_id: ID of contact whose notes are searched
+        query_text: Text to find similar notes for (embedded here, and the lexical query)
+        n_results: Maximum number of notes to return
+        exclude_note_id: Note ID to leave out of the results (e.g. the note being stored concurrently)
+        query_embedding: Precomputed query vector, used instead of embedding ``query_text``
+    """
+    from app.utils.hybrid_retriever import get_hybrid_retriever
+    collection = None
     try:
         collection = get_contact_collection(contact_id)
+        retriever = get_hybrid_retriever()
+        if retriever is not None:
+            notes = retriever.retrieve(
+                collection, contact_id, query_text=query_text, query_embedding=query_embedding,
+                n_results=n_results, where=contact_filter(contact_id), exclude_note_id=exclude_note_id
+            )
+            if notes:
+                logger.debug(f"Retrieved {len(notes)} relevant notes for contact {contact_id} (hybrid)")
+                return "\n---\n".join(note['document'] for note in notes)
+            logger.debug(f"No relevant history found for contact {contact_id}")
+            return "No relevant history found."
+        
+        query_kwargs = {}
+        exclude = {"note_id": {"$ne": exclude_note_id}} if exclude_note_id is not None else None
+        where = contact_filter(contact_id, exclude)
+        if where:
+            query_kwargs['where'] = where
+        if query_embedding is not None:
+            query_kwargs['query_embeddings'] = [query_embedding]
+        else:
+            query_kwargs['query_texts'] = [query_text]
         results = collection.query(
-            query_texts=[query_text],
-            n_results=n_results
+            n_results=n_results,
+            **query_kwargs
         )
         if results['documents'] and len(results['documents'][0]) > 0:
             retrieved_docs = results['documents'][0]
@@ -97,23 +424,112 @@ def get_relevant_history(contact_id: int, query_text: str, n_results: int = 3) -
             logger.debug(f"No relevant history found for contact {contact_id}")
             return "No relevant history found."
     except Exception as e:
+        if collection is not None:
+            get_collection_cache().invalidate(collection.name)
         logger.warning(f"RAG retrieval failed for contact {contact_id}: {e}")
         return "No relevant history found."
 
 
-def delete_contact_collection(contact_id: int, prefix: str = "contact_"):
+def search_user_notes(user_id: int, query_text: str, contact_ids: List[int],
+                      n_results: int = 20) -> List[Dict[str, Any]]:
+    """Notes of any of a user's contacts closest to ``query_text``, best first
+    
+    The query is embedded once. In per_user mode that is a single ANN query on the
+    user's collection; in per_contact mode each existing collection of ``contact_ids``
+    is queried on the 'retrieval' executor and the hits are merged by score. The score
+    is computed from the returned embeddings rather than the distance, which is only a
+    cosine on unit vectors in Chroma's default (squared L2) space.
+    
+    Returns:
+        list: dicts with note_id, contact_id, document and score (cosine similarity)
+    """
+    from app.utils.executor import get_executor
+    start = time.perf_counter()
+    query_embedding = embed_texts([query_text])[0]
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+    mode = get_collection_mode()
+    
+    def query(collection, where=None):
+        try:
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                include=['documents', 'metadatas', 'embeddings'],
+                **({'where': where} if where else {})
+            )
+        except Exception as e:
+            get_collection_cache().invalidate(collection.name)
+            logger.warning(f"Semantic search failed on {collection.name}: {e}")
+            return []
+        if not results['ids'][0]:
+            return []
+        vectors = np.asarray(results['embeddings'][0], dtype=np.float32)
+        scores = vectors @ query_vector / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+        return [
+            {
+                'note_id': (metadata or {}).get('note_id'),
+                'contact_id': (metadata or {}).get('contact_id'),
+                'document': document,
+                'score': round(float(score), 4),
+            }
+            for document, metadata, score in zip(
+                results['documents'][0], results['metadatas'][0], scores
+            )
+        ]
+    
+    wanted = set(contact_ids)
+    if mode == 'per_user':
+        collection = get_user_collection(user_id)
+        hits = query(collection) if collection.count() else []
+    else:
+        existing = {c.name for c in get_chroma_client().list_collections()}
+        collections = [get_contact_collection(contact_id) for contact_id in contact_ids
+                       if f"contact_{contact_id}" in existing]
+        executor = get_executor('retrieval')
+        hits = [hit for batch in executor.map(query, collections) for hit in batch]
+    hits = [hit for hit in hits if hit['contact_id'] in wanted]
+    hits.sort(key=lambda hit: hit['score'], reverse=True)
+    get_metrics().observe('semantic_search_ms', (time.perf_counter() - start) * 1000, mode=mode)
+    return hits[:n_results]
+
+
+def delete_contact_collection(contact_id: int, prefix: str = "contact_", user_id: Optional[int] = None):
     """Delete ChromaDB collection for a contact (cleanup on contact deletion)
     
+    In per_user mode the contact's notes are deleted from the owner's shared
+    collection instead; pass ``user_id`` since the contact row is usually gone by now.
+    
     Args:
         contact_id: ID of contact whose collection should be deleted
         prefix: Collection name prefix (default: "contact_")
+        user_id: Owner of the contact (per_user mode)
         
     Returns:
         bool: True if deleted successfully, False if collection doesn't exist or deletion failed
     """
     try:
         client = get_chroma_client()
+        
+        if get_collection_mode() == 'per_user':
+            if user_id is None:
+                user_id = _contact_owners.get(contact_id)
+            if user_id is not None:
+                collection_names = [f"user_{user_id}"]
+            else:
+                collection_names = [c.name for c in client.list_collections() if c.name.startswith("user_")]
+            for collection_name in collection_names:
+                try:
+                    collection = client.get_collection(name=collection_name)
+                except ValueError:
+                    continue
+                collection.delete(where={"contact_id": contact_id})
+            _contact_owners.pop(contact_id, None)
+            logger.info(f"✅ Deleted ChromaDB vectors for contact {contact_id} from {', '.join(collection_names) or 'no collections'}")
+            return True
+        
         collection_name = f"{prefix}{contact_id}"
+        get_collection_cache().invalidate(collection_name)
         
         try:
             # Try to get the collection first
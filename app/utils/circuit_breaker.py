@@ -0,0 +1,167 @@
+"""
+Circuit Breaker
+Per-provider health tracking so unhealthy AI providers are skipped instead of waited on
+"""
+
+import os
+import time
+import threading
+import logging
+from collections import deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a rolling window of call outcomes
+    
+    The breaker opens after ``consecutive_failures`` failures in a row, or when the
+    failure rate over the last ``window_size`` calls reaches ``failure_rate_threshold``
+    (once at least ``min_calls`` were seen). While open, calls are rejected without
+    touching the provider. After ``open_seconds`` one probe call is let through
+    (half-open); its success closes the breaker, its failure re-opens it.
+    """
+    
+    def __init__(self, name: str, consecutive_failures: int = 3, failure_rate_threshold: float = 0.5,
+                 window_size: int = 20, min_calls: int = 5, open_seconds: float = 30,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.consecutive_failures_threshold = consecutive_failures
+        self.failure_rate_threshold = failure_rate_threshold
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._outcomes = deque(maxlen=window_size)  # (succeeded, latency_ms)
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._half_open_in_flight = 0
+        self._times_opened = 0
+        self._rejected = 0
+        self._last_error = None
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+    
+    def allow_request(self) -> bool:
+        """Whether a call may go to the provider now (reserves the probe slot when half-open)"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            self._rejected += 1
+            return False
+    
+    def record_success(self, latency_ms: float):
+        with self._lock:
+            self._outcomes.append((True, latency_ms))
+            self._consecutive_failures = 0
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+                self._state = CLOSED
+                self._outcomes.clear()
+                self._outcomes.append((True, latency_ms))
+                logger.info(f"🟢 Circuit for {self.name} closed after successful probe")
+    
+    def record_failure(self, latency_ms: float, error: Optional[Exception] = None):
+        with self._lock:
+            self._outcomes.append((False, latency_ms))
+            self._consecutive_failures += 1
+            self._last_error = str(error)[:200] if error else None
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+                self._trip()
+            elif self._state == CLOSED and self._should_trip():
+                self._trip()
+    
+    def record_ignored(self):
+        """Release a probe slot for a call that says nothing about provider health (e.g. local rate limit)"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """State and rolling health statistics"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            outcomes = list(self._outcomes)
+            snapshot = {
+                'state': state,
+                'calls_in_window': len(outcomes),
+                'success_rate': round(sum(1 for ok, _ in outcomes if ok) / len(outcomes), 3) if outcomes else None,
+                'consecutive_failures': self._consecutive_failures,
+                'times_opened': self._times_opened,
+                'rejected_calls': self._rejected,
+                'last_error': self._last_error,
+            }
+            latencies = sorted(latency for ok, latency in outcomes if ok)
+            if latencies:
+                snapshot['latency_ms_p50'] = round(latencies[len(latencies) // 2], 1)
+                snapshot['latency_ms_max'] = round(latencies[-1], 1)
+            if state == OPEN:
+                snapshot['retry_in_seconds'] = round(self._opened_at + self.open_seconds - now, 1)
+            return snapshot
+    
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_in_flight = 0
+            logger.info(f"🟡 Circuit for {self.name} half-open - allowing a probe call")
+        return self._state
+    
+    def _should_trip(self) -> bool:
+        if self._consecutive_failures >= self.consecutive_failures_threshold:
+            return True
+        if len(self._outcomes) >= self.min_calls:
+            failures = sum(1 for ok, _ in self._outcomes if not ok)
+            return failures / len(self._outcomes) >= self.failure_rate_threshold
+        return False
+    
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._times_opened += 1
+        logger.warning(f"🔴 Circuit for {self.name} opened - skipping it for {self.open_seconds:.0f}s")
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Get the process-wide breaker for a provider, configured from AI_BREAKER_* settings"""
+    breaker = _circuit_breakers.get(name)
+    if breaker is not None:
+        return breaker
+    
+    with _circuit_breakers_lock:
+        breaker = _circuit_breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name,
+                consecutive_failures=int(os.getenv('AI_BREAKER_CONSECUTIVE_FAILURES', 3)),
+                failure_rate_threshold=float(os.getenv('AI_BREAKER_FAILURE_RATE', 0.5)),
+                window_size=int(os.getenv('AI_BREAKER_WINDOW', 20)),
+                min_calls=int(os.getenv('AI_BREAKER_MIN_CALLS', 5)),
+                open_seconds=float(os.getenv('AI_BREAKER_OPEN_SECONDS', 30)),
+            )
+            _circuit_breakers[name] = breaker
+    return breaker
+
+
+def get_all_circuit_breakers() -> Dict[str, CircuitBreaker]:
+    """All breakers created so far in this process"""
+    return dict(_circuit_breakers)
@@ -98,3 +98,41 @@ class DatabaseManager:
             logger.error(f"❌ Failed to create database tables: {e}", exc_info=True)
             raise
 
+    def upgrade_schema(self, backfill_batch_size: int = 500):
+        """Add columns introduced after a database was created, then backfill them
+        
+        create_all() only creates missing tables, so existing databases get new
+        columns here. Safe to run on every startup and from several workers at once:
+        each step is skipped when already done, and the backfill only touches rows
+        that still lack a value.
+        """
+        from sqlalchemy import inspect, text
+        from app.models import RawNote
+        from app.utils.hashing import note_fingerprint
+        
+        columns = {column['name'] for column in inspect(self.engine).get_columns('raw_notes')}
+        if 'content_hash' not in columns:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(text("ALTER TABLE raw_notes ADD COLUMN content_hash VARCHAR(64)"))
+                logger.info("✅ Added raw_notes.content_hash column")
+            except Exception as e:
+                # Another worker may have added it first
+                logger.warning(f"Could not add raw_notes.content_hash (may already exist): {e}")
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_raw_notes_contact_content_hash "
+                "ON raw_notes (contact_id, content_hash)"
+            ))
+        
+        backfilled = 0
+        while True:
+            with self.get_session() as session:
+                notes = session.query(RawNote).filter(RawNote.content_hash.is_(None)).limit(backfill_batch_size).all()
+                for note in notes:
+                    note.content_hash = note_fingerprint(note.content)
+                backfilled += len(notes)
+            if len(notes) < backfill_batch_size:
+                break
+        if backfilled:
+            logger.info(f"✅ Backfilled content_hash for {backfilled} raw notes")
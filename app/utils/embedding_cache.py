@@ -0,0 +1,230 @@
+"""
+Embedding Cache
+Persistent text -> embedding cache in a memory-mapped float32 file, shared by every worker on the host
+"""
+
+import os
+import re
+import time
+import hashlib
+import threading
+import logging
+from typing import List, Optional, Dict, Any, Tuple
+import numpy as np
+from app.utils.local_store import get_data_dir, get_local_db
+from app.utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Keys per SQL statement (stays under SQLite's bound-parameter limit)
+_CHUNK = 500
+
+
+def _chunks(items: List, size: int = _CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class EmbeddingCache:
+    """Fixed-capacity cache of embeddings keyed by a hash of (model, text)
+    
+    Vectors live in ``<name>.f32``, a float32 memmap with one row per slot; the
+    key -> slot map and last-use times live in a SQLite file next to it. When every
+    slot is taken the least recently used entry is evicted.
+    
+    Each slot also carries a 64-bit tag derived from its key. Writers clear the tag,
+    write the vector, then set the tag; readers accept a row only if the tag matches
+    before and after the copy, so a slot being rewritten by another worker reads as
+    a miss rather than as the wrong vector.
+    """
+    
+    def __init__(self, namespace: str, capacity: int = 20000):
+        self.namespace = namespace
+        self.capacity = capacity
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', namespace)[:64]
+        self.db_name = f"embedding_cache_{safe_name}"
+        self.vectors_path = os.path.join(get_data_dir(), f"{self.db_name}.f32")
+        self.tags_path = os.path.join(get_data_dir(), f"{self.db_name}.tags")
+        self.dimensions = None
+        self._vectors = None
+        self._tags = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._init_db()
+    
+    def _init_db(self):
+        conn = get_local_db(self.db_name)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_slots ("
+            "key TEXT PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_embedding_slots_last_used ON embedding_slots (last_used)")
+        conn.execute("CREATE TABLE IF NOT EXISTS embedding_meta (name TEXT PRIMARY KEY, value TEXT)")
+        row = conn.execute("SELECT value FROM embedding_meta WHERE name = 'dimensions'").fetchone()
+        if row:
+            self._open(int(row[0]))
+    
+    def _key(self, text: str) -> Tuple[str, int]:
+        digest = hashlib.sha256(f"{self.namespace}\0{text}".encode('utf-8')).digest()
+        tag = int.from_bytes(digest[:8], 'little', signed=True) or 1
+        return digest.hex(), tag
+    
+    def _open(self, dimensions: int):
+        """Map the vector and tag files, (re)creating them for a new dimension"""
+        with self._lock:
+            if self.dimensions == dimensions:
+                return
+            conn = get_local_db(self.db_name)
+            row = conn.execute("SELECT value FROM embedding_meta WHERE name = 'dimensions'").fetchone()
+            if row and int(row[0]) != dimensions:
+                logger.warning(f"⚠️ Embedding dimension changed ({row[0]} -> {dimensions}); clearing embedding cache")
+                conn.execute("DELETE FROM embedding_slots")
+            # Drop entries beyond a reduced EMBEDDING_CACHE_SIZE
+            conn.execute("DELETE FROM embedding_slots WHERE slot >= ?", (self.capacity,))
+            conn.execute(
+                "INSERT OR REPLACE INTO embedding_meta (name, value) VALUES ('dimensions', ?)",
+                (str(dimensions),)
+            )
+            for path, size in ((self.vectors_path, self.capacity * dimensions * 4),
+                               (self.tags_path, self.capacity * 8)):
+                with open(path, 'ab') as f:
+                    if f.tell() != size:
+                        f.truncate(size)
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+',
+                                      shape=(self.capacity, dimensions))
+            self._tags = np.memmap(self.tags_path, dtype=np.int64, mode='r+', shape=(self.capacity,))
+            self.dimensions = dimensions
+    
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached vectors for ``texts`` (None where missing)"""
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        if self._vectors is None:
+            # Another worker may have stored the first vectors since we started
+            row = get_local_db(self.db_name).execute(
+                "SELECT value FROM embedding_meta WHERE name = 'dimensions'"
+            ).fetchone()
+            if row:
+                self._open(int(row[0]))
+        if self._vectors is None or not texts:
+            self.misses += len(texts)
+            return results
+        
+        keys = [self._key(text) for text in texts]
+        conn = get_local_db(self.db_name)
+        slots = {}
+        for chunk in _chunks(list({key for key, _ in keys})):
+            rows = conn.execute(
+                f"SELECT key, slot FROM embedding_slots WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            slots.update(rows)
+        
+        used = []
+        for index, (key, tag) in enumerate(keys):
+            slot = slots.get(key)
+            if slot is None or self._tags[slot] != tag:
+                continue
+            vector = np.array(self._vectors[slot])
+            if self._tags[slot] != tag:
+                continue
+            results[index] = vector
+            used.append(key)
+        
+        if used:
+            now = time.time()
+            conn.executemany("UPDATE embedding_slots SET last_used = ? WHERE key = ?", [(now, key) for key in used])
+        hits = sum(1 for vector in results if vector is not None)
+        self.hits += hits
+        self.misses += len(texts) - hits
+        return results
+    
+    def put_many(self, texts: List[str], vectors: List[Any]):
+        """Store vectors for ``texts``, evicting least recently used entries when full"""
+        if not texts:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._open(vectors.shape[1])
+        conn = get_local_db(self.db_name)
+        now = time.time()
+        evicted = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for text, vector in zip(texts, vectors):
+                key, tag = self._key(text)
+                row = conn.execute("SELECT slot FROM embedding_slots WHERE key = ?", (key,)).fetchone()
+                if row:
+                    slot = row[0]
+                else:
+                    slot = conn.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM embedding_slots").fetchone()[0]
+                    if slot >= self.capacity:
+                        slot = conn.execute(
+                            "SELECT slot FROM embedding_slots ORDER BY last_used LIMIT 1"
+                        ).fetchone()[0]
+                        conn.execute("DELETE FROM embedding_slots WHERE slot = ?", (slot,))
+                        evicted += 1
+                self._tags[slot] = 0
+                self._vectors[slot] = vector
+                self._tags[slot] = tag
+                conn.execute(
+                    "INSERT OR REPLACE INTO embedding_slots (key, slot, last_used) VALUES (?, ?, ?)",
+                    (key, slot, now)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if evicted:
+            self.evictions += evicted
+            get_metrics().increment('embedding_cache_evictions', evicted)
+    
+    def size(self) -> int:
+        return get_local_db(self.db_name).execute("SELECT COUNT(*) FROM embedding_slots").fetchone()[0]
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'namespace': self.namespace,
+            'entries': self.size(),
+            'capacity': self.capacity,
+            'dimensions': self.dimensions,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+        }
+
+
+class CachedEmbeddingFunction:
+    """Chroma embedding function that consults an EmbeddingCache before the wrapped one
+    
+    Texts missing from the cache are embedded together in a single call to ``base``.
+    """
+    
+    def __init__(self, base, cache: EmbeddingCache):
+        self.base = base
+        self.cache = cache
+    
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        texts = list(input)
+        vectors = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        
+        metrics = get_metrics()
+        miss_count = sum(1 for vector in vectors if vector is None)
+        if len(texts) > miss_count:
+            metrics.increment('embedding_cache', len(texts) - miss_count, result='hit')
+        if missing:
+            metrics.increment('embedding_cache', miss_count, result='miss')
+            start = time.perf_counter()
+            computed = self.base(missing)
+            metrics.observe('embedding_compute_ms', (time.perf_counter() - start) * 1000)
+            try:
+                self.cache.put_many(missing, computed)
+            except Exception as e:
+                logger.warning(f"Could not store embeddings in cache: {e}")
+            by_text = dict(zip(missing, computed))
+            vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+        
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in vectors]
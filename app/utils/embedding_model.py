@@ -0,0 +1,116 @@
+"""
+Embedding Model
+Local ONNX embedding model (Chroma's all-MiniLM-L6-v2) with explicit loading, warm-up and thread sizing
+"""
+
+import os
+import time
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+from app.utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TEXTS = [
+    "Met for coffee and talked about the new project.",
+    "Remind me to follow up next week about the proposal.",
+    "Loves hiking and has been training for a marathon.",
+    "Her daughter just started university in Boston.",
+]
+
+
+def default_thread_count() -> int:
+    """Intra-op threads per worker: the host's cores split across gunicorn workers (WEB_CONCURRENCY)"""
+    workers = max(1, int(os.getenv('WEB_CONCURRENCY', 2)))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+class LocalEmbeddingModel(ONNXMiniLM_L6_V2):
+    """Chroma's default embedding model, loaded on demand or ahead of time
+    
+    Compared with Chroma's class this one sizes ONNX Runtime's thread pools (so the
+    model does not fight gunicorn's threads for every core), loads under a lock (so
+    concurrent first calls build one session, not several), can keep the model files
+    outside the home directory, and reports load, warm-up and per-batch latency.
+    """
+    
+    def __init__(self, threads: Optional[int] = None, model_dir: Optional[str] = None):
+        super().__init__()
+        self.threads = threads or default_thread_count()
+        if model_dir:
+            self.DOWNLOAD_PATH = Path(model_dir) / self.MODEL_NAME
+        self._load_lock = threading.Lock()
+        self.state = 'not_loaded'
+        self.load_ms = None
+        self.warmup_ms = None
+        self.error = None
+    
+    def _init_model_and_tokenizer(self) -> None:
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is not None:
+                return
+            self.state = 'loading'
+            start = time.perf_counter()
+            try:
+                self._download_model_if_not_exists()
+                model_path = os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME)
+                tokenizer = self.Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+                tokenizer.enable_truncation(max_length=256)
+                tokenizer.enable_padding(pad_id=0, pad_token="[PAD]", length=256)
+                
+                options = self.ort.SessionOptions()
+                options.intra_op_num_threads = self.threads
+                options.inter_op_num_threads = 1
+                providers = self._preferred_providers or self.ort.get_available_providers()
+                model = self.ort.InferenceSession(
+                    os.path.join(model_path, "model.onnx"),
+                    sess_options=options,
+                    providers=providers
+                )
+            except Exception as e:
+                self.state = 'failed'
+                self.error = str(e)
+                raise
+            self.tokenizer = tokenizer
+            self.model = model
+            self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+            self.state = 'ready'
+            self.error = None
+            get_metrics().observe('embedding_model_load_ms', self.load_ms)
+            logger.info(f"✅ Embedding model {self.MODEL_NAME} loaded in {self.load_ms}ms ({self.threads} threads)")
+    
+    def load(self):
+        """Download (if needed) and load the model now"""
+        self._init_model_and_tokenizer()
+    
+    def warm_up(self):
+        """Run a dummy batch so the first real note does not pay for graph optimization"""
+        self.load()
+        start = time.perf_counter()
+        self(WARMUP_TEXTS)
+        self.warmup_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"🔥 Embedding model warmed up in {self.warmup_ms}ms")
+    
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        self._init_model_and_tokenizer()
+        start = time.perf_counter()
+        embeddings = self._forward(texts).tolist()
+        metrics = get_metrics()
+        metrics.observe('embedding_batch_ms', (time.perf_counter() - start) * 1000)
+        metrics.observe('embedding_batch_size', len(texts))
+        return embeddings
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'model': self.MODEL_NAME,
+            'state': self.state,
+            'threads': self.threads,
+            'load_ms': self.load_ms,
+            'warmup_ms': self.warmup_ms,
+            'error': self.error,
+        }
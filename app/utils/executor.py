@@ -0,0 +1,47 @@
+"""
+Shared Executors
+Process-wide bounded thread pools for running independent pipeline stages concurrently
+"""
+
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Global executors, keyed by pool name
+_executors = {}
+_executors_lock = threading.Lock()
+
+# Default pool sizes (override with <NAME>_EXECUTOR_WORKERS, e.g. PIPELINE_EXECUTOR_WORKERS=8)
+DEFAULT_POOL_SIZES = {
+    'pipeline': 4,
+    'ai': 8,
+    'retrieval': 4,
+}
+
+
+def get_executor(name: str = 'pipeline') -> ThreadPoolExecutor:
+    """Get or create a named, bounded thread pool shared by the whole process"""
+    executor = _executors.get(name)
+    if executor is not None:
+        return executor
+
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            max_workers = int(os.getenv(f'{name.upper()}_EXECUTOR_WORKERS', DEFAULT_POOL_SIZES.get(name, 4)))
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'kith-{name}')
+            _executors[name] = executor
+            logger.info(f"Created '{name}' executor with {max_workers} workers")
+    return executor
+
+
+def shutdown_executors(wait: bool = True):
+    """Shut down all shared executors (used on worker exit)"""
+    with _executors_lock:
+        for name, executor in list(_executors.items()):
+            executor.shutdown(wait=wait)
+            logger.debug(f"Shut down '{name}' executor")
+        _executors.clear()
@@ -0,0 +1,87 @@
+"""
+Content Hashing
+Normalization and fingerprints for note text
+"""
+
+import re
+import zlib
+import hashlib
+import unicodedata
+from typing import Optional
+import numpy as np
+
+_HORIZONTAL_WS = re.compile(r'[ \t\u00a0]+')
+_BLANK_LINES = re.compile(r'\n{3,}')
+_WORD = re.compile(r'\w+')
+
+# MinHash permutations: h(x) = (a * x + b) mod p, with fixed seeds so signatures are
+# comparable across processes and restarts
+_MERSENNE_PRIME = (1 << 61) - 1
+_MINHASH_PERMUTATIONS = 64
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 1 << 32, size=_MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 32, size=_MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize note text so whitespace-only edits produce the same string
+    
+    Unicode is NFC-normalized, line endings unified, runs of spaces/tabs collapsed,
+    trailing whitespace stripped per line and runs of blank lines collapsed to one.
+    Case and line structure are preserved because they carry meaning for analysis.
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFC', text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = [_HORIZONTAL_WS.sub(' ', line).strip() for line in text.split('\n')]
+    text = '\n'.join(lines)
+    text = _BLANK_LINES.sub('\n\n', text)
+    return text.strip()
+
+
+def content_hash(*parts: str) -> str:
+    """SHA-256 hex digest over one or more strings (separated unambiguously)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = (part or '').encode('utf-8')
+        digest.update(str(len(data)).encode('ascii'))
+        digest.update(b':')
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def note_fingerprint(text: str) -> str:
+    """Content hash of a note after normalize_text (stored as RawNote.content_hash)"""
+    return content_hash(normalize_text(text))
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Lowercased word ``size``-grams; texts shorter than ``size`` words give a single shingle"""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash_signature(text: str) -> Optional[np.ndarray]:
+    """MinHash signature of the text's word shingles, or None for text without words
+    
+    The fraction of equal positions in two signatures estimates the Jaccard
+    similarity of the shingle sets (see ``estimate_similarity``).
+    """
+    shingle_set = shingles(text)
+    if not shingle_set:
+        return None
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingle_set),
+                         dtype=np.uint64, count=len(shingle_set))
+    # a < 2^32 and x < 2^32, so a * x + b stays well inside uint64
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME
+    return permuted.min(axis=0)
+
+
+def estimate_similarity(signature_a: Optional[np.ndarray], signature_b: Optional[np.ndarray]) -> float:
+    """Estimated Jaccard similarity (0-1) of the texts behind two MinHash signatures"""
+    if signature_a is None or signature_b is None:
+        return 0.0
+    return float(np.mean(signature_a == signature_b))
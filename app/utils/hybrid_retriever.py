@@ -0,0 +1,373 @@
+"""
+Hybrid Retriever
+RAG retrieval combining a BM25 index over a contact's notes with vector search, fused by reciprocal rank
+"""
+
+import os
+import re
+import math
+import time
+import heapq
+import logging
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from app.utils.metrics import get_metrics
+from app.utils.executor import get_executor
+
+logger = logging.getLogger(__name__)
+
+_hybrid_retriever = None
+_hybrid_retriever_lock = threading.Lock()
+
+TOKEN_PATTERN = re.compile(r"\w+(?:'\w+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from had has have he her his i if in into is it its me my
+of on or our she so that the their them they this to was we were will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens, without stopwords and single characters (digits are kept)"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower())
+            if token not in STOPWORDS and (len(token) > 1 or token.isdigit())]
+
+
+class BM25Index:
+    """Okapi BM25 over a contact's notes, extended in place as notes are added
+    
+    Built from the documents already in the vector store, so both retrievers see the
+    same notes. Postings hold (document index, term frequency); idf is worked out per
+    query term from the posting counts, so ``add`` only touches the new notes' terms.
+    """
+    
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]],
+                 k1: float = 1.2, b: float = 0.75):
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+        self.total_length = 0
+        # Highest note_id indexed, so the retriever can fetch only newer notes
+        self.max_note_id: Optional[int] = None
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.add(ids, documents, metadatas)
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> int:
+        """Index notes not indexed yet; returns how many were added"""
+        added = 0
+        with self._lock:
+            for note_id, document, metadata in zip(ids, documents, metadatas):
+                if note_id in self._positions:
+                    continue
+                index = len(self.ids)
+                self._positions[note_id] = index
+                self.ids.append(note_id)
+                self.documents.append(document)
+                self.metadatas.append(metadata)
+                terms = Counter(tokenize(document or ''))
+                length = sum(terms.values())
+                self.lengths.append(length)
+                self.total_length += length
+                for term, frequency in terms.items():
+                    self.postings.setdefault(term, []).append((index, frequency))
+                number = (metadata or {}).get('note_id')
+                if isinstance(number, int) and (self.max_note_id is None or number > self.max_note_id):
+                    self.max_note_id = number
+                added += 1
+        return added
+    
+    def search(self, query: str, k: int, exclude_id: Optional[str] = None,
+               min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """Top ``k`` (document index, score) pairs for ``query`` scoring at least ``min_score``, best first"""
+        scores: Dict[int, float] = {}
+        with self._lock:
+            count = len(self.ids)
+            avg_length = (self.total_length / count if count else 0.0) or 1.0
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                # Robertson-Sparck Jones idf floored at zero: terms in over half the notes
+                # (e.g. "coffee" for a coffee-meeting contact) do not make a note a lexical hit
+                idf = math.log((count - len(postings) + 0.5) / (len(postings) + 0.5))
+                if idf <= 0:
+                    continue
+                for index, frequency in postings:
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / avg_length)
+                    scores[index] = scores.get(index, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+            scores = {index: score for index, score in scores.items()
+                      if score >= min_score and self.ids[index] != exclude_id}
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class HybridRetriever:
+    """Vector + BM25 retrieval with reciprocal rank fusion, recency weighting and MMR
+    
+    For each query the vector store and the contact's BM25 index each return
+    ``candidates`` notes. Fused scores are sum(1 / (rrf_k + rank)) over the two
+    lists, scaled by a recency factor that decays with ``recency_half_life_days``
+    (at most ``recency_weight`` off). Maximal marginal relevance then picks the
+    final notes, trading relevance against similarity to notes already picked
+    (``mmr_lambda`` = 1 is pure relevance), so near-duplicates do not fill the context.
+    
+    Lexical hits scoring under ``min_lexical_score`` are dropped: a note sharing only
+    common words with the query would otherwise outrank vector hits in the fusion,
+    since appearing in both lists beats a top rank in one. The default of 1.0 takes
+    roughly one shared term found in under a quarter of the contact's notes.
+    
+    BM25 indexes are cached per contact. When the collection's count grows, only
+    notes with a higher note_id are fetched and appended, so a new note costs one
+    small filtered read rather than re-reading and re-tokenizing every note. A
+    shrinking count (deleted notes), a per-contact collection whose count still
+    does not match, or an index older than ``index_ttl_seconds`` is rebuilt in
+    full. The lexical search runs on the
+    'retrieval' executor while the vector query runs in the caller; if it has not
+    finished within ``budget_ms`` the vector results are used alone (the index build
+    carries on and serves the next query), and MMR is skipped once over budget.
+    """
+    
+    def __init__(self, candidates: int = 20, rrf_k: int = 60, mmr_lambda: float = 0.7,
+                 recency_weight: float = 0.2, recency_half_life_days: float = 180.0,
+                 budget_ms: float = 150.0, index_cache_size: int = 128,
+                 index_ttl_seconds: float = 300.0, min_lexical_score: float = 1.0,
+                 lexical: bool = True):
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.mmr_lambda = mmr_lambda
+        self.recency_weight = recency_weight
+        self.recency_half_life_days = recency_half_life_days
+        self.budget_ms = budget_ms
+        self.index_cache_size = index_cache_size
+        self.index_ttl_seconds = index_ttl_seconds
+        self.min_lexical_score = min_lexical_score
+        self.lexical = lexical
+        self._indexes: "OrderedDict[Tuple[str, int], Tuple[BM25Index, int, float]]" = OrderedDict()
+        self._indexes_lock = threading.Lock()
+        self.index_builds = 0
+        self.index_updates = 0
+        self.degraded = 0
+    
+    def _lexical_index(self, collection, contact_id: int, where: Optional[Dict[str, Any]]) -> BM25Index:
+        key = (collection.name, contact_id)
+        count = collection.count()
+        now = time.monotonic()
+        with self._indexes_lock:
+            entry = self._indexes.get(key)
+            if entry is not None:
+                self._indexes.move_to_end(key)
+        if entry is not None and now - entry[2] < self.index_ttl_seconds:
+            index, indexed_count, built_at = entry
+            if count == indexed_count:
+                return index
+            if count > indexed_count and self._extend_index(collection, index, where, count):
+                with self._indexes_lock:
+                    if key in self._indexes:
+                        self._indexes[key] = (index, count, built_at)
+                return index
+        
+        start = time.perf_counter()
+        get_kwargs = {'where': where} if where else {}
+        notes = collection.get(include=['documents', 'metadatas'], **get_kwargs)
+        index = BM25Index(notes['ids'], notes['documents'], notes['metadatas'])
+        get_metrics().observe('rag_lexical_index_ms', (time.perf_counter() - start) * 1000, kind='build')
+        with self._indexes_lock:
+            self.index_builds += 1
+            self._indexes[key] = (index, count, now)
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.index_cache_size:
+                self._indexes.popitem(last=False)
+        return index
+    
+    def _extend_index(self, collection, index: BM25Index, where: Optional[Dict[str, Any]], count: int) -> bool:
+        """Append notes newer than the index; False when only a full rebuild can catch up"""
+        if index.max_note_id is None:
+            return False
+        start = time.perf_counter()
+        newer = {"note_id": {"$gt": index.max_note_id}}
+        try:
+            notes = collection.get(where={"$and": [where, newer]} if where else newer,
+                                   include=['documents', 'metadatas'])
+        except Exception as e:
+            logger.warning(f"Could not fetch new notes for the lexical index of {collection.name}: {e}")
+            return False
+        index.add(notes['ids'], notes['documents'], notes['metadatas'])
+        get_metrics().observe('rag_lexical_index_ms', (time.perf_counter() - start) * 1000, kind='append')
+        with self._indexes_lock:
+            self.index_updates += 1
+        # A per-contact collection (no ``where``) holds exactly the indexed notes; a
+        # mismatch means a note with an older id arrived (e.g. re-embedded by the
+        # reconcile job), which only a rebuild picks up
+        return where is not None or len(index) == count
+    
+    def _lexical_candidates(self, collection, contact_id: int, where: Optional[Dict[str, Any]],
+                            query_text: str, exclude_id: Optional[str]) -> List[Dict[str, Any]]:
+        index = self._lexical_index(collection, contact_id, where)
+        return [
+            {'id': index.ids[position], 'document': index.documents[position],
+             'metadata': index.metadatas[position] or {}, 'embedding': None}
+            for position, _ in index.search(query_text, self.candidates, exclude_id=exclude_id,
+                                            min_score=self.min_lexical_score)
+        ]
+    
+    def _recency(self, metadata: Dict[str, Any], now: datetime) -> float:
+        if not self.recency_weight:
+            return 1.0
+        try:
+            age_days = max(0.0, (now - datetime.fromisoformat(metadata['timestamp'])).total_seconds() / 86400)
+        except (TypeError, KeyError, ValueError):
+            return 1.0 - self.recency_weight
+        return 1.0 - self.recency_weight + self.recency_weight * 0.5 ** (age_days / self.recency_half_life_days)
+    
+    def _mmr(self, collection, ranked: List[Dict[str, Any]], n_results: int) -> List[Dict[str, Any]]:
+        missing = [candidate['id'] for candidate in ranked if candidate['embedding'] is None]
+        if missing:
+            fetched = collection.get(ids=missing, include=['embeddings'])
+            by_id = dict(zip(fetched['ids'], fetched['embeddings']))
+            for candidate in ranked:
+                if candidate['embedding'] is None:
+                    candidate['embedding'] = by_id.get(candidate['id'])
+        ranked = [candidate for candidate in ranked if candidate['embedding'] is not None]
+        if len(ranked) <= n_results:
+            return ranked
+        
+        vectors = np.asarray([candidate['embedding'] for candidate in ranked], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        relevance = np.asarray([candidate['score'] for candidate in ranked], dtype=np.float32)
+        relevance /= relevance.max() or 1.0
+        similarity = vectors @ vectors.T
+        
+        selected = [0]
+        max_similarity = similarity[0].copy()
+        while len(selected) < n_results:
+            mmr = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * max_similarity
+            mmr[selected] = -np.inf
+            best = int(np.argmax(mmr))
+            selected.append(best)
+            max_similarity = np.maximum(max_similarity, similarity[best])
+        return [ranked[index] for index in selected]
+    
+    def retrieve(self, collection, contact_id: int, query_text: Optional[str] = None,
+                 query_embedding: Optional[List[float]] = None, n_results: int = 3,
+                 where: Optional[Dict[str, Any]] = None,
+                 exclude_note_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """The ``n_results`` best notes of a contact as dicts (id, document, metadata, score, sources)
+        
+        ``where`` is the contact filter for the collection (see contact_filter);
+        ``query_text`` feeds BM25 and, without ``query_embedding``, the vector query.
+        """
+        start = time.perf_counter()
+        deadline = start + self.budget_ms / 1000
+        metrics = get_metrics()
+        exclude_id = f"note_{exclude_note_id}" if exclude_note_id is not None else None
+        
+        lexical_future = None
+        if self.lexical and query_text and query_text.strip():
+            lexical_future = get_executor('retrieval').submit(
+                self._lexical_candidates, collection, contact_id, where, query_text, exclude_id
+            )
+        
+        vector_where = where
+        if exclude_note_id is not None:
+            exclude = {"note_id": {"$ne": exclude_note_id}}
+            vector_where = {"$and": [where, exclude]} if where else exclude
+        query_kwargs = {'where': vector_where} if vector_where else {}
+        if query_embedding is not None:
+            query_kwargs['query_embeddings'] = [query_embedding]
+        else:
+            query_kwargs['query_texts'] = [query_text]
+        include = ['documents', 'metadatas'] + (['embeddings'] if self.mmr_lambda < 1 else [])
+        results = collection.query(n_results=self.candidates, include=include, **query_kwargs)
+        ids = results['ids'][0]
+        embeddings = results['embeddings'][0] if results.get('embeddings') else [None] * len(ids)
+        vector_candidates = [
+            {'id': note_id, 'document': document, 'metadata': metadata or {}, 'embedding': embedding}
+            for note_id, document, metadata, embedding in zip(
+                ids, results['documents'][0], results['metadatas'][0], embeddings
+            )
+        ]
+        
+        lexical_candidates = []
+        if lexical_future is not None:
+            try:
+                lexical_candidates = lexical_future.result(timeout=max(0.0, deadline - time.perf_counter()))
+            except FutureTimeoutError:
+                self.degraded += 1
+                metrics.increment('rag_retrieval_degraded', stage='lexical')
+            except Exception as e:
+                logger.warning(f"Lexical retrieval failed for contact {contact_id}: {e}")
+        
+        fused: Dict[str, Dict[str, Any]] = {}
+        for source, candidates in (('vector', vector_candidates), ('lexical', lexical_candidates)):
+            for rank, candidate in enumerate(candidates, start=1):
+                entry = fused.setdefault(candidate['id'], dict(candidate, score=0.0, sources=[]))
+                if entry['embedding'] is None:
+                    entry['embedding'] = candidate['embedding']
+                entry['score'] += 1.0 / (self.rrf_k + rank)
+                entry['sources'].append(source)
+        now = datetime.utcnow()
+        for entry in fused.values():
+            entry['score'] *= self._recency(entry['metadata'], now)
+        ranked = sorted(fused.values(), key=lambda entry: entry['score'], reverse=True)
+        
+        if self.mmr_lambda < 1 and len(ranked) > n_results:
+            if time.perf_counter() < deadline:
+                ranked = self._mmr(collection, ranked, n_results)
+            else:
+                self.degraded += 1
+                metrics.increment('rag_retrieval_degraded', stage='mmr')
+        selected = ranked[:n_results]
+        for entry in selected:
+            entry.pop('embedding', None)
+        
+        metrics.increment('rag_retrievals', mode='hybrid')
+        metrics.observe('rag_retrieval_ms', (time.perf_counter() - start) * 1000, mode='hybrid')
+        return selected
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'candidates': self.candidates,
+            'rrf_k': self.rrf_k,
+            'mmr_lambda': self.mmr_lambda,
+            'recency_weight': self.recency_weight,
+            'recency_half_life_days': self.recency_half_life_days,
+            'min_lexical_score': self.min_lexical_score,
+            'budget_ms': self.budget_ms,
+            'cached_indexes': len(self._indexes),
+            'index_builds': self.index_builds,
+            'index_updates': self.index_updates,
+            'degraded': self.degraded,
+        }
+
+
+def get_hybrid_retriever() -> Optional[HybridRetriever]:
+    """Get the process-wide hybrid retriever (None when disabled via RAG_HYBRID=false)"""
+    global _hybrid_retriever
+    if os.getenv('RAG_HYBRID', 'true').lower() in ('0', 'false', 'no'):
+        return None
+    if _hybrid_retriever is None:
+        with _hybrid_retriever_lock:
+            if _hybrid_retriever is None:
+                _hybrid_retriever = HybridRetriever(
+                    candidates=int(os.getenv('RAG_CANDIDATES', 20)),
+                    rrf_k=int(os.getenv('RAG_RRF_K', 60)),
+                    mmr_lambda=float(os.getenv('RAG_MMR_LAMBDA', 0.7)),
+                    recency_weight=float(os.getenv('RAG_RECENCY_WEIGHT', 0.2)),
+                    recency_half_life_days=float(os.getenv('RAG_RECENCY_HALF_LIFE_DAYS', 180)),
+                    budget_ms=float(os.getenv('RAG_LATENCY_BUDGET_MS', 150)),
+                    index_cache_size=int(os.getenv('RAG_LEXICAL_CACHE_SIZE', 128)),
+                    index_ttl_seconds=float(os.getenv('RAG_LEXICAL_TTL_SECONDS', 300)),
+                    min_lexical_score=float(os.getenv('RAG_MIN_LEXICAL_SCORE', 1.0)),
+                )
+    return _hybrid_retriever
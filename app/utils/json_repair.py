@@ -0,0 +1,139 @@
+"""
+JSON Repair
+Tolerant, single-pass parsing of JSON returned by LLMs
+"""
+
+import re
+import json
+import logging
+from typing import Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# One token per match: a JSON string (raw newlines allowed, possibly unterminated) or a bracket
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(?:"|\Z)|"[\s\S]*|[{}\[\]]')
+_DANGLING_KEY = re.compile(r'([{,])\s*"[^"\\]*(?:\\.[^"\\]*)*"\s*:?\s*$')
+# Bare number / true / false / null at the very end of a truncated response
+_TRAILING_LITERAL = re.compile(r'[^\s,:\[\]{}"]+$')
+_CONTROL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Control characters are illegal inside JSON strings; escape rather than drop them
+_STRING_ESCAPES = {code: f'\\u{code:04x}' for code in range(0x20)}
+_STRING_ESCAPES.update({ord('\n'): '\\n', ord('\r'): '\\r', ord('\t'): '\\t'})
+
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+def repair_json(text: str) -> str:
+    """Extract and repair the first JSON object (or array) in ``text``
+    
+    One left-to-right pass over the strings and brackets: leading prose and code
+    fences are skipped, raw control characters inside strings are escaped, trailing
+    commas are dropped, anything after the top-level value closes is ignored, and a
+    truncated value is closed off.
+    
+    Raises:
+        ValueError: No JSON object or array in the text
+    """
+    start = text.find('{')
+    if start == -1:
+        start = text.find('[')
+    if start == -1:
+        raise ValueError("No JSON object found in response")
+    
+    out = []
+    stack = []
+    last = start
+    for match in _TOKEN.finditer(text, start):
+        token = match.group()
+        gap = text[last:match.start()]
+        last = match.end()
+        
+        if token[0] == '"':
+            out.append(gap)
+            if len(token) == 1 or token[-1] != '"' or _odd_backslashes(token):
+                # Unterminated string (truncated response)
+                token = token.rstrip('\\') + '"'
+            # isprintable() is a cheap C check that is False whenever a control character is present
+            out.append(token if token.isprintable() else token.translate(_STRING_ESCAPES))
+            continue
+        
+        if token in _CLOSERS:
+            stack.append(_CLOSERS[token])
+            out.append(gap)
+            out.append(token)
+            continue
+        
+        if not stack or stack[-1] != token:
+            # Stray closer (e.g. in prose after a fence) - keep scanning
+            out.append(gap)
+            continue
+        if ',' in gap:
+            gap = gap.rstrip()
+            if gap.endswith(','):
+                gap = gap[:-1]
+        out.append(gap)
+        out.append(token)
+        stack.pop()
+        if not stack:
+            break
+    
+    repaired = ''.join(out)
+    if stack:
+        # Truncated: keep the values after the last string or bracket, drop a cut-off
+        # literal and a dangling comma / key, then close what is still open
+        repaired += text[last:]
+        literal = _TRAILING_LITERAL.search(repaired)
+        if literal and not _is_literal(literal.group()):
+            repaired = repaired[:literal.start()]
+        if stack[-1] == '}':
+            repaired = _DANGLING_KEY.sub(lambda m: m.group(1).replace(',', ''), repaired)
+        repaired = repaired.rstrip()
+        if repaired.endswith((',', ':')):
+            repaired = repaired[:-1]
+        repaired += ''.join(reversed(stack))
+    # Strings are already escaped, so only stray control characters between tokens remain
+    return _CONTROL.sub('', repaired)
+
+
+def _is_literal(value: str) -> bool:
+    try:
+        json.loads(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _odd_backslashes(string: str) -> bool:
+    """Whether the final quote of ``string`` is escaped (odd run of backslashes before it)"""
+    count = 0
+    index = len(string) - 2
+    while index >= 0 and string[index] == '\\':
+        count += 1
+        index -= 1
+    return count % 2 == 1
+
+
+def parse_llm_json(text: str) -> Tuple[Any, bool]:
+    """Parse JSON from an LLM response, repairing it if needed
+    
+    Returns:
+        tuple: (parsed value, whether repair was needed)
+    
+    Raises:
+        ValueError: The response could not be parsed even after repair
+    """
+    try:
+        return json.loads(text), False
+    except (ValueError, TypeError):
+        pass
+    
+    repaired = repair_json(text or '')
+    try:
+        value = json.loads(repaired)
+    except ValueError as e:
+        logger.error(f"JSON repair failed: {e}")
+        logger.error(f"Response text (first 1000 chars): {text[:1000]}")
+        raise
+    logger.debug("Parsed LLM response after JSON repair")
+    return value, True
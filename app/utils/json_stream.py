@@ -0,0 +1,120 @@
+"""
+Streaming Category Parser
+Incrementally scans a streamed LLM JSON response and yields each category as soon as it closes
+"""
+
+import json
+import logging
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+
+class CategoryStreamParser:
+    """Feed text chunks; get back ``(category_name, value)`` pairs as category objects complete
+
+    Understands both ``{"categories": {"Goals": {...}, ...}}`` and the bare
+    ``{"Goals": {...}, ...}`` shape. Leading prose and code fences are skipped, and
+    raw newlines/tabs inside strings are escaped as they are copied, so each category
+    value parses on its own. Each character is scanned once across all chunks.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._stack = []            # frames: {'type', 'key', 'expect_key'}
+        self._string_buffer = []    # current string (key candidates)
+        self._pending_key = None    # last key read at the current object level
+        self._capture = None        # list of chars for the category value being captured
+        self._capture_key = None
+        self._capture_depth = None
+        self.categories = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """Consume a chunk of response text and return categories completed by it"""
+        completed = []
+        for char in chunk:
+            if not self._started:
+                if char != '{':
+                    continue
+                self._started = True
+
+            if self._capture is not None:
+                self._capture.append(_ESCAPES.get(char, char) if self._in_string else char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._string_buffer.append(char)
+                elif char == '\\':
+                    self._escape = True
+                    self._string_buffer.append(char)
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string()
+                else:
+                    self._string_buffer.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_buffer = []
+            elif char == '{' or char == '[':
+                key = self._pending_key if self._stack and self._stack[-1]['type'] == 'object' else None
+                if char == '{' and self._capture is None and key is not None and self._is_category_level(key):
+                    self._capture = ['{']
+                    self._capture_key = key
+                    self._capture_depth = len(self._stack) + 1
+                self._pending_key = None
+                self._stack.append({'type': 'object' if char == '{' else 'array', 'key': key, 'expect_key': char == '{'})
+            elif char == '}' or char == ']':
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if self._capture is not None and len(self._stack) + 1 == self._capture_depth:
+                    item = self._finish_capture()
+                    if item is not None:
+                        completed.append(item)
+            elif char == ':':
+                if self._stack and self._stack[-1]['type'] == 'object':
+                    self._stack[-1]['expect_key'] = False
+            elif char == ',':
+                if self._stack and self._stack[-1]['type'] == 'object':
+                    self._stack[-1]['expect_key'] = True
+                    self._pending_key = None
+        return completed
+
+    def _end_string(self):
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame['type'] == 'object' and frame['expect_key']:
+            try:
+                self._pending_key = json.loads('"' + ''.join(self._string_buffer) + '"')
+            except ValueError:
+                self._pending_key = ''.join(self._string_buffer)
+
+    def _is_category_level(self, key: str) -> bool:
+        """Whether an object opened now under ``key`` would be a category value"""
+        depth = len(self._stack)
+        if depth == 1:
+            # Bare shape: top-level keys are categories, except the wrapper itself
+            return key != 'categories'
+        if depth == 2:
+            return self._stack[1]['key'] == 'categories'
+        return False
+
+    def _finish_capture(self):
+        text = ''.join(self._capture)
+        key = self._capture_key
+        self._capture = None
+        self._capture_key = None
+        self._capture_depth = None
+        try:
+            value = json.loads(text)
+        except ValueError as e:
+            logger.warning(f"Could not parse streamed category '{key}': {e}")
+            return None
+        self.categories[key] = value
+        return key, value
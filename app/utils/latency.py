@@ -0,0 +1,122 @@
+"""
+Latency Histograms
+Fixed log-scale bucket histograms for cheap percentile estimates of call latencies
+"""
+
+import math
+import bisect
+import threading
+from typing import Dict, Any, List, Optional
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def _default_bounds() -> List[float]:
+    """Bucket upper bounds in ms: 1ms to ~5 minutes, each bucket 25% wider than the last"""
+    bounds = []
+    bound = 1.0
+    while bound < 300000:
+        bounds.append(round(bound, 3))
+        bound *= 1.25
+    return bounds
+
+
+BUCKET_BOUNDS_MS = _default_bounds()
+
+
+class LatencyHistogram:
+    """Thread-safe histogram of latencies in milliseconds
+    
+    Recording is a bisect plus an increment under a lock. Percentiles are estimated
+    from bucket upper bounds, so they are accurate to within one bucket (25%).
+    Histograms with the same bounds can be merged, e.g. across worker processes.
+    """
+    
+    def __init__(self, bounds: Optional[List[float]] = None):
+        self.bounds = bounds or BUCKET_BOUNDS_MS
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, value_ms: float):
+        index = bisect.bisect_left(self.bounds, value_ms)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value_ms
+            if value_ms > self._max:
+                self._max = value_ms
+    
+    @property
+    def count(self) -> int:
+        return self._count
+    
+    def percentile(self, p: float) -> Optional[float]:
+        """Estimated p-th percentile (0-100), or None when empty"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            maximum = self._max
+        return self._percentile_from(counts, total, maximum, p)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Summary statistics plus raw bucket counts (for merging)"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            total_sum = self._sum
+            maximum = self._max
+        return {
+            'count': total,
+            'mean_ms': round(total_sum / total, 1) if total else None,
+            'p50_ms': self._round(self._percentile_from(counts, total, maximum, 50)),
+            'p95_ms': self._round(self._percentile_from(counts, total, maximum, 95)),
+            'p99_ms': self._round(self._percentile_from(counts, total, maximum, 99)),
+            'max_ms': round(maximum, 1) if total else None,
+            'sum_ms': total_sum,
+            'buckets': counts,
+        }
+    
+    def merge_snapshot(self, snapshot: Dict[str, Any]):
+        """Add counts from another histogram's snapshot (same bounds)"""
+        buckets = snapshot.get('buckets') or []
+        if len(buckets) != len(self._counts):
+            raise ValueError("Cannot merge histograms with different bucket bounds")
+        with self._lock:
+            for index, value in enumerate(buckets):
+                self._counts[index] += value
+            self._count += snapshot.get('count', 0)
+            self._sum += snapshot.get('sum_ms', 0.0)
+            self._max = max(self._max, snapshot.get('max_ms') or 0.0)
+    
+    def _percentile_from(self, counts, total, maximum, p) -> Optional[float]:
+        if not total:
+            return None
+        rank = max(1, math.ceil(total * p / 100.0))
+        seen = 0
+        for index, value in enumerate(counts):
+            seen += value
+            if seen >= rank:
+                if index >= len(self.bounds):
+                    return maximum
+                return min(self.bounds[index], maximum)
+        return maximum
+    
+    @staticmethod
+    def _round(value):
+        return round(value, 1) if value is not None else None
+
+
+def get_latency_histogram(name: str) -> LatencyHistogram:
+    """Get or create the process-wide histogram for a named operation (e.g. 'gemini')"""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.get(name)
+            if histogram is None:
+                histogram = LatencyHistogram()
+                _histograms[name] = histogram
+    return histogram
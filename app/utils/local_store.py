@@ -0,0 +1,51 @@
+"""
+Local Store
+Shared on-disk state (SQLite files) visible to every gunicorn worker on the host
+"""
+
+import os
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_data_dir = None
+_local = threading.local()
+
+
+def get_data_dir():
+    """Get local data directory from environment or use default"""
+    global _data_dir
+    if _data_dir is None:
+        data_dir = os.getenv('KITH_DATA_DIR')
+        if not data_dir:
+            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            data_dir = os.path.join(project_root, 'data')
+        os.makedirs(data_dir, exist_ok=True)
+        _data_dir = data_dir
+        logger.info(f"Local data directory: {data_dir}")
+    return _data_dir
+
+
+def get_local_db(name: str) -> sqlite3.Connection:
+    """Get this thread's connection to a shared SQLite file in the data directory
+    
+    Connections use WAL mode and a busy timeout so several worker processes can
+    read and write the same file concurrently.
+    
+    Args:
+        name: File name without extension (e.g. 'analysis_cache')
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    
+    conn = connections.get(name)
+    if conn is None:
+        path = os.path.join(get_data_dir(), f"{name}.sqlite3")
+        conn = sqlite3.connect(path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[name] = conn
+    return conn
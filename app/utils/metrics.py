@@ -0,0 +1,177 @@
+"""
+Metrics
+In-process counters and histograms, aggregated across gunicorn workers through a shared SQLite file
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from typing import Dict, Any, Tuple
+from app.utils.latency import LatencyHistogram
+from app.utils.local_store import get_local_db
+
+logger = logging.getLogger(__name__)
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+DB_NAME = 'metrics'
+
+
+def _label_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def _series_key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((key, _label_value(value)) for key, value in labels.items()))
+
+
+class MetricsRegistry:
+    """Counters and histograms for this worker, published for the other workers to read
+    
+    Recording only touches in-memory state. At most every ``flush_seconds`` the
+    recording thread writes this worker's cumulative snapshot as one row of a shared
+    SQLite table (one row per worker, replaced in place); ``aggregate`` sums the rows
+    of every worker on the host. Rows of workers that stopped publishing more than
+    ``retention_seconds`` ago are pruned.
+    
+    Histograms use the log-scale buckets of LatencyHistogram, which suit token counts
+    as well as milliseconds.
+    """
+    
+    def __init__(self, flush_seconds: float = 5.0, retention_seconds: float = 86400.0):
+        self.flush_seconds = flush_seconds
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._reset()
+        self._init_db()
+    
+    def _reset(self):
+        self._pid = os.getpid()
+        self._worker_id = f"{self._pid}:{int(time.time() * 1000)}"
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = time.monotonic()
+    
+    def _init_db(self):
+        get_local_db(DB_NAME).execute(
+            "CREATE TABLE IF NOT EXISTS worker_metrics ("
+            "worker_id TEXT PRIMARY KEY, pid INTEGER, updated_at REAL, data TEXT)"
+        )
+    
+    def _check_fork(self):
+        # After a fork the parent's numbers would be reported twice; start over
+        if os.getpid() != self._pid:
+            with self._lock:
+                if os.getpid() != self._pid:
+                    self._reset()
+    
+    def increment(self, name: str, value: float = 1, **labels):
+        """Add ``value`` to the counter ``name`` for this label set"""
+        self._check_fork()
+        key = _series_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._maybe_flush()
+    
+    def observe(self, name: str, value: float, **labels):
+        """Record one observation (e.g. a latency in ms or a token count) in histogram ``name``"""
+        self._check_fork()
+        key = _series_key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram())
+        histogram.record(value)
+        self._maybe_flush()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """This worker's cumulative counters and histogram snapshots (with buckets, for merging)"""
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = list(self._histograms.items())
+        return {
+            'counters': [[name, dict(labels), value] for (name, labels), value in counters],
+            'histograms': [[name, dict(labels), histogram.snapshot()] for (name, labels), histogram in histograms],
+        }
+    
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+    
+    def flush(self):
+        """Publish this worker's snapshot to the shared table"""
+        self._last_flush = time.monotonic()
+        try:
+            conn = get_local_db(DB_NAME)
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO worker_metrics (worker_id, pid, updated_at, data) VALUES (?, ?, ?, ?)",
+                (self._worker_id, self._pid, now, json.dumps(self.snapshot()))
+            )
+            conn.execute("DELETE FROM worker_metrics WHERE updated_at < ?", (now - self.retention_seconds,))
+        except Exception as e:
+            logger.warning(f"Could not publish metrics: {e}")
+    
+    def aggregate(self) -> Dict[str, Any]:
+        """Counters and histogram summaries summed over every worker on this host
+        
+        Returns:
+            dict: {'workers', 'counters': {name: [{'labels', 'value'}]},
+                   'histograms': {name: [{'labels', 'count', 'mean', 'p50', 'p95', 'p99', 'max'}]}}
+        """
+        self.flush()
+        rows = get_local_db(DB_NAME).execute("SELECT data FROM worker_metrics").fetchall()
+        
+        counters = {}
+        histograms = {}
+        for (data,) in rows:
+            snapshot = json.loads(data)
+            for name, labels, value in snapshot['counters']:
+                key = _series_key(name, labels)
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, histogram_snapshot in snapshot['histograms']:
+                key = _series_key(name, labels)
+                histograms.setdefault(key, LatencyHistogram()).merge_snapshot(histogram_snapshot)
+        
+        result = {'workers': len(rows), 'counters': {}, 'histograms': {}}
+        for (name, labels), value in sorted(counters.items()):
+            result['counters'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), histogram in sorted(histograms.items(), key=lambda item: item[0]):
+            summary = histogram.snapshot()
+            result['histograms'].setdefault(name, []).append({
+                'labels': dict(labels),
+                'count': summary['count'],
+                'mean': summary['mean_ms'],
+                'p50': summary['p50_ms'],
+                'p95': summary['p95_ms'],
+                'p99': summary['p99_ms'],
+                'max': summary['max_ms'],
+            })
+        return result
+
+
+def counter_total(aggregated: Dict[str, Any], name: str, **labels) -> float:
+    """Sum of an aggregated counter over the series matching ``labels``"""
+    wanted = {key: _label_value(value) for key, value in labels.items()}
+    return sum(
+        series['value'] for series in aggregated['counters'].get(name, [])
+        if all(series['labels'].get(key) == value for key, value in wanted.items())
+    )
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get the process-wide metrics registry (METRICS_FLUSH_SECONDS sets the publish interval)"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry(
+                    flush_seconds=float(os.getenv('METRICS_FLUSH_SECONDS', 5)),
+                    retention_seconds=float(os.getenv('METRICS_RETENTION_HOURS', 24)) * 3600
+                )
+    return _metrics
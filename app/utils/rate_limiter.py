@@ -0,0 +1,238 @@
+"""
+Rate Limiter
+Token-bucket limits for AI providers, shared by every gunicorn worker through a SQLite file
+"""
+
+import os
+import time
+import threading
+import logging
+from typing import Dict, Any, Optional
+from app.utils.local_store import get_local_db
+
+logger = logging.getLogger(__name__)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+DB_NAME = 'rate_limits'
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a provider call would exceed its budget for longer than the queue allows"""
+    
+    def __init__(self, provider: str, retry_after: float, reason: str = 'budget exhausted'):
+        self.provider = provider
+        self.retry_after = retry_after
+        super().__init__(f"{provider} rate limit: {reason}, retry after {retry_after:.1f}s")
+
+
+class ProviderRateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for one provider
+    
+    Each bucket is a row in a shared SQLite table, updated inside a write transaction,
+    so all workers on the host draw from the same budget. Callers reserve capacity up
+    front: if the bucket is short but would refill within ``max_queue_seconds``, the
+    reservation is taken (the balance goes negative, keeping FIFO order across workers)
+    and the caller waits out the returned delay; otherwise RateLimitExceeded is raised.
+    
+    When the provider itself answers 429, ``penalize`` blocks the provider for every
+    worker, doubling the backoff on consecutive 429s until a call succeeds.
+    """
+    
+    def __init__(self, provider: str, rpm: float = 0, tpm: float = 0, max_queue_seconds: float = 0,
+                 base_penalty_seconds: float = 5, max_penalty_seconds: float = 60):
+        self.provider = provider
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_queue_seconds = max_queue_seconds
+        self.base_penalty_seconds = base_penalty_seconds
+        self.max_penalty_seconds = max_penalty_seconds
+        self._init_db()
+    
+    def acquire(self, estimated_tokens: int = 0, max_wait: Optional[float] = None) -> float:
+        """Reserve one request and ``estimated_tokens`` tokens
+        
+        Args:
+            max_wait: Tighter cap than max_queue_seconds on how long this caller can wait
+        
+        Returns:
+            float: Seconds the caller must wait before sending (0 when budget is available)
+        
+        Raises:
+            RateLimitExceeded: The provider is penalized or the wait exceeds max_queue_seconds (or max_wait)
+        """
+        max_queue_seconds = self.max_queue_seconds if max_wait is None else min(self.max_queue_seconds, max_wait)
+        now = time.time()
+        conn = get_local_db(DB_NAME)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            blocked_until = self._get_blocked_until(conn)
+            if blocked_until > now:
+                raise RateLimitExceeded(self.provider, blocked_until - now, 'provider returned 429')
+            
+            buckets = []
+            if self.rpm:
+                buckets.append((f"{self.provider}:requests", self.rpm, 1))
+            if self.tpm and estimated_tokens:
+                buckets.append((f"{self.provider}:tokens", self.tpm, estimated_tokens))
+            
+            levels = {}
+            wait = 0.0
+            for name, per_minute, cost in buckets:
+                level = self._refilled_level(conn, name, per_minute, now)
+                levels[name] = level
+                if level < cost:
+                    wait = max(wait, (cost - level) / (per_minute / 60.0))
+            
+            if wait > max_queue_seconds:
+                raise RateLimitExceeded(self.provider, wait)
+            
+            for name, per_minute, cost in buckets:
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                    (name, levels[name] - cost, now)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        
+        if wait > 0:
+            logger.info(f"{self.provider} budget short - queued for {wait:.2f}s")
+        return wait
+    
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Correct the token bucket once the provider reports real usage"""
+        if not self.tpm or actual_tokens is None:
+            return
+        delta = actual_tokens - estimated_tokens
+        if delta == 0:
+            return
+        name = f"{self.provider}:tokens"
+        conn = get_local_db(DB_NAME)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            level = self._refilled_level(conn, name, self.tpm, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                (name, level - delta, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def penalize(self):
+        """Back off every worker after the provider reports a quota/429 error"""
+        conn = get_local_db(DB_NAME)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT consecutive FROM penalties WHERE provider = ?", (self.provider,)
+            ).fetchone()
+            consecutive = (row[0] if row else 0) + 1
+            penalty = min(self.base_penalty_seconds * (2 ** (consecutive - 1)), self.max_penalty_seconds)
+            conn.execute(
+                "INSERT OR REPLACE INTO penalties (provider, blocked_until, consecutive) VALUES (?, ?, ?)",
+                (self.provider, time.time() + penalty, consecutive)
+            )
+            # Drain the request bucket so queued reservations do not fire the moment the block lifts
+            if self.rpm:
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                    (f"{self.provider}:requests", 0, time.time())
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logger.warning(f"{self.provider} returned a rate-limit error - blocking all workers for {penalty:.0f}s")
+    
+    def record_success(self):
+        """Reset the consecutive-429 backoff after a successful call"""
+        get_local_db(DB_NAME).execute(
+            "UPDATE penalties SET consecutive = 0 WHERE provider = ? AND consecutive > 0", (self.provider,)
+        )
+    
+    def status(self) -> Dict[str, Any]:
+        """Current budget (read-only snapshot)"""
+        now = time.time()
+        conn = get_local_db(DB_NAME)
+        status = {
+            'rpm_limit': self.rpm or None,
+            'tpm_limit': self.tpm or None,
+            'max_queue_seconds': self.max_queue_seconds,
+        }
+        if self.rpm:
+            status['requests_available'] = round(self._refilled_level(conn, f"{self.provider}:requests", self.rpm, now), 2)
+        if self.tpm:
+            status['tokens_available'] = round(self._refilled_level(conn, f"{self.provider}:tokens", self.tpm, now))
+        blocked_until = self._get_blocked_until(conn)
+        status['blocked_for_seconds'] = round(max(blocked_until - now, 0), 1)
+        return status
+    
+    def _refilled_level(self, conn, name: str, per_minute: float, now: float) -> float:
+        row = conn.execute("SELECT level, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return float(per_minute)
+        level, updated_at = row
+        return min(float(per_minute), level + (now - updated_at) * per_minute / 60.0)
+    
+    def _get_blocked_until(self, conn) -> float:
+        row = conn.execute("SELECT blocked_until FROM penalties WHERE provider = ?", (self.provider,)).fetchone()
+        return row[0] if row else 0.0
+    
+    def _init_db(self):
+        conn = get_local_db(DB_NAME)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                level REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS penalties (
+                provider TEXT PRIMARY KEY,
+                blocked_until REAL NOT NULL,
+                consecutive INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
+
+def get_rate_limiter(provider: str) -> ProviderRateLimiter:
+    """Get the limiter for a provider ('gemini' or 'openai'), sized from <PROVIDER>_RPM / <PROVIDER>_TPM
+    
+    A limit of 0 (the default) leaves that dimension unlimited; 429 backoff still applies.
+    """
+    limiter = _rate_limiters.get(provider)
+    if limiter is not None:
+        return limiter
+    
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(provider)
+        if limiter is None:
+            prefix = provider.upper()
+            limiter = ProviderRateLimiter(
+                provider,
+                rpm=float(os.getenv(f'{prefix}_RPM', 0)),
+                tpm=float(os.getenv(f'{prefix}_TPM', 0)),
+                max_queue_seconds=float(os.getenv('AI_RATE_LIMIT_MAX_QUEUE_SECONDS', 0)),
+                base_penalty_seconds=float(os.getenv('AI_RATE_LIMIT_PENALTY_SECONDS', 5)),
+            )
+            _rate_limiters[provider] = limiter
+            logger.info(f"Rate limiter for {provider}: rpm={limiter.rpm or 'unlimited'}, tpm={limiter.tpm or 'unlimited'}")
+    return limiter
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether a provider exception is a quota / HTTP 429 error"""
+    text = str(error).lower()
+    return (
+        'quota' in text
+        or '429' in text
+        or 'rate limit' in text
+        or type(error).__name__ in ('ResourceExhausted', 'RateLimitError', 'TooManyRequests')
+    )
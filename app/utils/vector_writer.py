@@ -0,0 +1,466 @@
+"""
+Vector Writer
+Write-behind batching of note ingestion into ChromaDB
+"""
+
+import os
+import time
+import atexit
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from app.utils.local_store import get_local_db
+from app.utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+DB_NAME = 'vector_journal'
+
+# A note that fails this many times stays in the journal for the next process start
+MAX_ATTEMPTS = 3
+
+# Delay before retrying a failed note, doubled per attempt
+RETRY_BACKOFF_SECONDS = 1.0
+RETRY_BACKOFF_MAX_SECONDS = 60.0
+
+# A note that has failed this many times in total (across restarts) moves to dead_vectors
+DEAD_LETTER_ATTEMPTS = 10
+
+
+def write_behind_enabled() -> bool:
+    """Whether store_note_in_chromadb should go through the batching writer (VECTOR_WRITE_BEHIND)"""
+    return os.getenv('VECTOR_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class VectorWriteBuffer:
+    """Buffers note writes and flushes them to ChromaDB in batches
+    
+    ``enqueue`` records the note in a journal table shared by the workers on the host
+    and returns. A background thread flushes once ``batch_size`` notes are pending or
+    the oldest has waited ``max_wait_seconds``: the batch's documents are embedded in
+    one call to the embedding function and upserted per collection, then removed from
+    the journal. With ``max_pending`` notes waiting, ``enqueue`` blocks until a flush
+    makes room (backpressure).
+    
+    Notes whose contact was deleted meanwhile are dropped rather than written (which
+    would re-create a per-contact collection). A collection that fails only sends its
+    own notes back, after an exponential backoff; a note that keeps failing across
+    restarts is moved to the ``dead_vectors`` table, and the reconcile job
+    (reconcile_vector_store.py) re-embeds it once the cause is fixed.
+    
+    The buffer is drained at interpreter exit. Journal rows of a process that died
+    before flushing are picked up and written when the next writer starts.
+    """
+    
+    def __init__(self, batch_size: int = 32, max_wait_seconds: float = 0.5, max_pending: int = 1000):
+        self.batch_size = batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._reset()
+        self._init_db()
+        # Chroma registers its own exit handler when the client is created; creating it
+        # first makes ours run before it (atexit is LIFO), while the store is still open
+        from app.utils.chromadb_client import get_chroma_client
+        get_chroma_client()
+        atexit.register(self.close)
+    
+    def _reset(self):
+        self._pid = os.getpid()
+        self._pending: List[Dict[str, Any]] = []
+        # Failed notes waiting out their backoff, each with a 'retry_at' monotonic time
+        self._retry: List[Dict[str, Any]] = []
+        self._in_flight = 0
+        self._flush_requested = False
+        self._closed = False
+        self._thread = None
+        self.stats_counts = {'queued': 0, 'written': 0, 'failed': 0, 'batches': 0, 'recovered': 0,
+                             'dropped': 0, 'dead_lettered': 0}
+    
+    def _init_db(self):
+        conn = get_local_db(DB_NAME)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_vectors ("
+            "note_id INTEGER PRIMARY KEY, contact_id INTEGER, content TEXT, "
+            "timestamp TEXT, pid INTEGER, queued_at REAL, attempts INTEGER DEFAULT 0)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(pending_vectors)")}
+        if 'attempts' not in columns:
+            try:
+                conn.execute("ALTER TABLE pending_vectors ADD COLUMN attempts INTEGER DEFAULT 0")
+            except sqlite3.OperationalError:
+                # Another worker added it first
+                pass
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_vectors ("
+            "note_id INTEGER PRIMARY KEY, contact_id INTEGER, content TEXT, "
+            "timestamp TEXT, attempts INTEGER, error TEXT, failed_at REAL)"
+        )
+    
+    def _check_fork(self):
+        # A forked child has no flush thread and must not write the parent's notes twice
+        if os.getpid() != self._pid:
+            with self._cond:
+                if os.getpid() != self._pid:
+                    self._reset()
+    
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._recover_orphans()
+            self._thread = threading.Thread(target=self._run, name='kith-vector-writer', daemon=True)
+            self._thread.start()
+    
+    def _recover_orphans(self):
+        """Claim journal rows left by dead processes (or an earlier process with our PID)"""
+        conn = get_local_db(DB_NAME)
+        rows = conn.execute(
+            "SELECT note_id, contact_id, content, timestamp, pid, attempts FROM pending_vectors"
+        ).fetchall()
+        recovered = 0
+        dead = []
+        for note_id, contact_id, content, timestamp, pid, attempts in rows:
+            if pid != self._pid and _pid_alive(pid):
+                continue
+            claimed = conn.execute(
+                "UPDATE pending_vectors SET pid = ? WHERE note_id = ? AND pid = ?",
+                (self._pid, note_id, pid)
+            ).rowcount
+            if not claimed:
+                continue
+            item = self._item(contact_id, content, note_id, timestamp, failures=attempts or 0)
+            if item['failures'] >= DEAD_LETTER_ATTEMPTS:
+                dead.append(item)
+                continue
+            self._pending.append(item)
+            recovered += 1
+        if dead:
+            self._dead_letter(dead, "failed in earlier runs")
+        if recovered:
+            self.stats_counts['recovered'] += recovered
+            logger.info(f"♻️ Recovered {recovered} journaled vector writes from a previous process")
+    
+    def _item(self, contact_id: int, content: str, note_id: int, timestamp: str,
+              embedding: Optional[List[float]] = None, failures: int = 0) -> Dict[str, Any]:
+        return {
+            'contact_id': contact_id,
+            'note_id': note_id,
+            'content': content,
+            'timestamp': timestamp,
+            'embedding': embedding,
+            'queued_at': time.monotonic(),
+            # Attempts in this process, and failures recorded in the journal (all processes)
+            'attempts': 0,
+            'failures': failures,
+        }
+    
+    def enqueue(self, contact_id: int, note_content: str, note_id: int,
+                embedding: Optional[List[float]] = None):
+        """Journal a note and queue it for the next batch (blocks while the buffer is full)
+        
+        A precomputed ``embedding`` is written as is; it is not journaled, so a note
+        recovered after a crash is embedded again.
+        """
+        self._check_fork()
+        self._ensure_thread()
+        metrics = get_metrics()
+        timestamp = datetime.utcnow().isoformat()
+        
+        wait_start = time.perf_counter()
+        with self._cond:
+            while len(self._pending) + len(self._retry) >= self.max_pending and not self._closed:
+                self._cond.wait(timeout=1.0)
+            waited_ms = (time.perf_counter() - wait_start) * 1000
+            if self._closed:
+                raise RuntimeError("Vector writer is closed")
+            get_local_db(DB_NAME).execute(
+                "INSERT OR REPLACE INTO pending_vectors (note_id, contact_id, content, timestamp, pid, queued_at, attempts) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (note_id, contact_id, note_content, timestamp, self._pid, time.time())
+            )
+            self._pending.append(self._item(contact_id, note_content, note_id, timestamp, embedding))
+            depth = len(self._pending)
+            self.stats_counts['queued'] += 1
+            if depth >= self.batch_size:
+                self._cond.notify_all()
+        
+        metrics.increment('vector_writes', outcome='queued')
+        metrics.observe('vector_write_queue_depth', depth)
+        if waited_ms >= 1:
+            metrics.increment('vector_write_backpressure')
+            metrics.observe('vector_write_wait_ms', waited_ms)
+    
+    def flush(self, timeout: float = 60.0) -> bool:
+        """Write everything queued so far; returns False if it did not finish within ``timeout``"""
+        self._check_fork()
+        self._ensure_thread()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            try:
+                while self._pending or self._in_flight or self._retry:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(timeout=remaining)
+            finally:
+                self._flush_requested = False
+        return True
+    
+    def close(self, timeout: float = 30.0):
+        """Drain the buffer and stop the flush thread (registered with atexit)"""
+        if os.getpid() != self._pid or self._thread is None:
+            return
+        with self._cond:
+            self._closed = True
+            pending = len(self._pending)
+            self._cond.notify_all()
+        if pending:
+            logger.info(f"🏁 Flushing {pending} queued vector writes before exit")
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"⚠️ Vector writer did not drain within {timeout}s; "
+                           f"{len(self._pending)} notes stay journaled for the next start")
+    
+    def _release_retries(self) -> Optional[float]:
+        """Move notes whose backoff is over to the front of the queue (caller holds _cond)
+        
+        Returns the seconds until the next retry is due, or None if none is waiting.
+        """
+        if not self._retry:
+            return None
+        now = time.monotonic()
+        due = [item for item in self._retry if item['retry_at'] <= now]
+        if due:
+            self._retry = [item for item in self._retry if item['retry_at'] > now]
+            self._pending[:0] = due
+        if not self._retry:
+            return None
+        return max(0.0, min(item['retry_at'] for item in self._retry) - now)
+    
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        """Wait until a batch is due; returns [] once closed and drained
+        
+        Notes still waiting out a retry backoff at close stay in the journal.
+        """
+        with self._cond:
+            while True:
+                retry_wait = self._release_retries()
+                if self._pending or self._closed:
+                    break
+                self._cond.wait(timeout=retry_wait)
+            if not self._pending:
+                return []
+            deadline = self._pending[0]['queued_at'] + self.max_wait_seconds
+            while (len(self._pending) < self.batch_size
+                   and not self._closed and not self._flush_requested):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(timeout=remaining)
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            self._in_flight = len(batch)
+            # Room in the buffer for blocked producers
+            self._cond.notify_all()
+            return batch
+    
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            try:
+                self._write_batch(batch)
+            finally:
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+    
+    def _contact_owners(self, contact_ids) -> Dict[int, int]:
+        """contact_id -> user_id for those of ``contact_ids`` that still exist"""
+        from sqlalchemy import select
+        from app.models import Contact
+        from app.utils.database import DatabaseManager
+        with DatabaseManager().get_session() as session:
+            return dict(session.execute(
+                select(Contact.id, Contact.user_id).where(Contact.id.in_(list(contact_ids)))
+            ).all())
+    
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        from app.utils.chromadb_client import get_contact_collection, get_embedding_function, get_collection_cache
+        start = time.perf_counter()
+        try:
+            owners = self._contact_owners({item['contact_id'] for item in batch})
+            live = [item for item in batch if item['contact_id'] in owners]
+            to_embed = [item for item in live if item['embedding'] is None]
+            if to_embed:
+                computed = get_embedding_function()([item['content'] for item in to_embed])
+                for item, embedding in zip(to_embed, computed):
+                    item['embedding'] = embedding
+        except Exception as e:
+            self._requeue(batch, e)
+            return
+        
+        if len(live) < len(batch):
+            self._drop([item for item in batch if item['contact_id'] not in owners])
+        
+        # Resolve each note's collection on its own, so one bad contact or collection
+        # only sends its own notes back
+        groups = {}
+        for item in live:
+            try:
+                collection = get_contact_collection(item['contact_id'], user_id=owners[item['contact_id']])
+            except Exception as e:
+                self._requeue([item], e)
+                continue
+            groups.setdefault(collection.name, (collection, []))[1].append(item)
+        
+        written = []
+        for name, (collection, items) in groups.items():
+            try:
+                collection.upsert(
+                    ids=[f"note_{item['note_id']}" for item in items],
+                    embeddings=[item['embedding'] for item in items],
+                    documents=[item['content'] for item in items],
+                    metadatas=[{
+                        "contact_id": item['contact_id'],
+                        "note_id": item['note_id'],
+                        "timestamp": item['timestamp']
+                    } for item in items]
+                )
+            except Exception as e:
+                get_collection_cache().invalidate(name)
+                self._requeue(items, e)
+                continue
+            written.extend(items)
+        if written:
+            self._complete(written, start)
+    
+    def _complete(self, items: List[Dict[str, Any]], start: float):
+        metrics = get_metrics()
+        self._delete_journal_rows(items)
+        self.stats_counts['written'] += len(items)
+        self.stats_counts['batches'] += 1
+        metrics.increment('vector_writes', len(items), outcome='written')
+        metrics.observe('vector_batch_size', len(items))
+        metrics.observe('vector_flush_ms', (time.perf_counter() - start) * 1000)
+        now = time.monotonic()
+        for item in items:
+            metrics.observe('vector_write_delay_ms', (now - item['queued_at']) * 1000)
+        logger.debug(f"Wrote {len(items)} notes to ChromaDB in {(time.perf_counter() - start) * 1000:.0f}ms")
+    
+    def _delete_journal_rows(self, items: List[Dict[str, Any]]):
+        note_ids = [item['note_id'] for item in items]
+        get_local_db(DB_NAME).execute(
+            f"DELETE FROM pending_vectors WHERE note_id IN ({','.join('?' * len(note_ids))})",
+            note_ids
+        )
+    
+    def _drop(self, items: List[Dict[str, Any]]):
+        """Forget notes whose contact was deleted after they were queued"""
+        self._delete_journal_rows(items)
+        self.stats_counts['dropped'] += len(items)
+        get_metrics().increment('vector_writes', len(items), outcome='dropped')
+        logger.info(f"🗑️ Dropped {len(items)} queued vector writes for deleted contacts")
+    
+    def _dead_letter(self, items: List[Dict[str, Any]], error):
+        """Move notes that keep failing from the journal to dead_vectors"""
+        conn = get_local_db(DB_NAME)
+        note_ids = [item['note_id'] for item in items]
+        placeholders = ','.join('?' * len(note_ids))
+        conn.execute(
+            "INSERT OR REPLACE INTO dead_vectors (note_id, contact_id, content, timestamp, attempts, error, failed_at) "
+            f"SELECT note_id, contact_id, content, timestamp, attempts, ?, ? FROM pending_vectors WHERE note_id IN ({placeholders})",
+            [str(error), time.time(), *note_ids]
+        )
+        conn.execute(f"DELETE FROM pending_vectors WHERE note_id IN ({placeholders})", note_ids)
+        self.stats_counts['dead_lettered'] += len(items)
+        get_metrics().increment('vector_writes', len(items), outcome='dead_lettered')
+        logger.error(f"❌ Moved {len(items)} vector writes to dead_vectors after {DEAD_LETTER_ATTEMPTS} failures ({error})")
+    
+    def _requeue(self, items: List[Dict[str, Any]], error: Exception):
+        note_ids = [item['note_id'] for item in items]
+        get_local_db(DB_NAME).execute(
+            f"UPDATE pending_vectors SET attempts = attempts + 1 WHERE note_id IN ({','.join('?' * len(note_ids))})",
+            note_ids
+        )
+        retry, dead = [], []
+        for item in items:
+            item['attempts'] += 1
+            item['failures'] += 1
+            if item['failures'] >= DEAD_LETTER_ATTEMPTS:
+                dead.append(item)
+            elif item['attempts'] < MAX_ATTEMPTS and not self._closed:
+                retry.append(item)
+        if dead:
+            self._dead_letter(dead, error)
+        left = len(items) - len(retry) - len(dead)
+        self.stats_counts['failed'] += left
+        metrics = get_metrics()
+        if retry:
+            metrics.increment('vector_writes', len(retry), outcome='retried')
+        if left:
+            metrics.increment('vector_writes', left, outcome='failed')
+        logger.warning(f"⚠️ Vector write of {len(items)} notes failed ({error}); "
+                       f"retrying {len(retry)}, {left} left in the journal for the next start")
+        if retry:
+            now = time.monotonic()
+            for item in retry:
+                delay = RETRY_BACKOFF_SECONDS * 2 ** (item['attempts'] - 1)
+                item['retry_at'] = now + min(delay, RETRY_BACKOFF_MAX_SECONDS)
+            with self._cond:
+                self._retry.extend(retry)
+                self._cond.notify_all()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = len(self._pending)
+            retrying = len(self._retry)
+            in_flight = self._in_flight
+        return {
+            'pending': pending,
+            'retrying': retrying,
+            'in_flight': in_flight,
+            'batch_size': self.batch_size,
+            'max_wait_ms': round(self.max_wait_seconds * 1000),
+            'max_pending': self.max_pending,
+            **self.stats_counts,
+        }
+
+
+def get_vector_writer() -> VectorWriteBuffer:
+    """Get the process-wide vector writer
+    
+    VECTOR_BATCH_SIZE, VECTOR_BATCH_MAX_WAIT_MS and VECTOR_QUEUE_MAX tune batching and
+    the backpressure limit.
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = VectorWriteBuffer(
+                    batch_size=int(os.getenv('VECTOR_BATCH_SIZE', 32)),
+                    max_wait_seconds=float(os.getenv('VECTOR_BATCH_MAX_WAIT_MS', 500)) / 1000,
+                    max_pending=int(os.getenv('VECTOR_QUEUE_MAX', 1000))
+                )
+    return _writer
@@ -0,0 +1,127 @@
+"""
+AI Client Reuse Benchmark
+Measures per-call latency of a fresh OpenAI client per call (old behaviour) versus the
+shared, pooled client from app.utils.ai_clients, against a local stand-in server.
+
+Usage:
+    python benchmarks/bench_ai_clients.py --calls 200
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHAT_RESPONSE = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-3.5-turbo",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": "{\"categories\": {\"Avocation\": {\"content\": \"Likes fish\", \"confidence\": 0.9}}}"},
+        "finish_reason": "stop"
+    }],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI chat-completions stand-in with HTTP/1.1 keep-alive"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    connections = set()
+    
+    def do_POST(self):
+        StandInHandler.connections.add(self.client_address)
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        body = json.dumps(CHAT_RESPONSE).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def summarize(label, samples, connections):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<28} mean {statistics.mean(samples):7.2f} ms   p50 {statistics.median(samples):7.2f} ms   "
+          f"p95 {p95:7.2f} ms   connections {connections}")
+
+
+def make_fresh_call(api_key, base_url):
+    """Old behaviour: build a new client (and connection) for every note"""
+    try:
+        from openai import OpenAI
+    except ImportError:
+        import openai
+        from openai import api_requestor
+        
+        def call():
+            # Legacy SDK: drop the thread's cached session to mirror a cold request thread
+            openai.api_key = api_key
+            openai.requestssession = None
+            if hasattr(api_requestor._thread_context, 'session'):
+                api_requestor._thread_context.session.close()
+                del api_requestor._thread_context.session
+            return openai.ChatCompletion.create(model='gpt-3.5-turbo', messages=[{"role": "user", "content": "hi"}])
+        return call
+    
+    def call():
+        client = OpenAI(api_key=api_key, base_url=base_url)
+        return client.chat.completions.create(model='gpt-3.5-turbo', messages=[{"role": "user", "content": "hi"}])
+    return call
+
+
+def run(label, call, calls):
+    StandInHandler.connections = set()
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        response = call()
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.choices[0].message.content
+    summarize(label, samples, len(StandInHandler.connections))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark shared vs per-call AI clients')
+    parser.add_argument('--calls', type=int, default=200, help='Calls per variant (default: 200)')
+    args = parser.parse_args()
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    api_key = 'bench-key'
+    
+    # Both SDKs read their base URL from the environment when the client is created
+    os.environ['OPENAI_BASE_URL'] = base_url
+    os.environ['OPENAI_API_BASE'] = base_url
+    
+    from app.utils.ai_clients import openai_chat_completion
+    import openai
+    if not hasattr(openai, 'OpenAI'):
+        openai.api_base = base_url
+    
+    print(f"Stand-in server at {base_url}, {args.calls} calls per variant")
+    run('per-call client (before)', make_fresh_call(api_key, base_url), args.calls)
+    run('shared pooled client (after)', lambda: openai_chat_completion(
+        api_key, model='gpt-3.5-turbo', messages=[{"role": "user", "content": "hi"}]
+    ), args.calls)
+    
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+JSON Repair Benchmark
+Checks app.utils.json_repair against a corpus of malformed LLM outputs and compares its
+speed with the per-provider repair cascade it replaced (fence stripping, character loop,
+control-character regex, regex re-escape, brace-matching extraction).
+
+Usage:
+    python benchmarks/bench_json_repair.py --iterations 200
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.json_repair import parse_llm_json
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'malformed_llm_outputs.jsonl')
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def legacy_parse(response_text):
+    """The previous AIService repair cascade, kept here as the baseline"""
+    response_text = response_text.strip()
+    if response_text.startswith('```json'):
+        response_text = response_text[7:]
+    if response_text.startswith('```'):
+        response_text = response_text[3:]
+    if response_text.endswith('```'):
+        response_text = response_text[:-3]
+    response_text = response_text.strip()
+    
+    def fix_json_newlines(text):
+        result = []
+        in_string = False
+        escape_next = False
+        i = 0
+        while i < len(text):
+            char = text[i]
+            if escape_next:
+                result.append(char)
+                escape_next = False
+            elif char == '\\':
+                result.append(char)
+                escape_next = True
+            elif char == '"' and not escape_next:
+                result.append(char)
+                in_string = not in_string
+            elif in_string and char == '\n':
+                result.append('\\n')
+            elif in_string and char == '\r':
+                result.append('\\r')
+            elif in_string and char == '\t':
+                result.append('\\t')
+            else:
+                result.append(char)
+            i += 1
+        return ''.join(result)
+    
+    try:
+        cleaned = fix_json_newlines(response_text)
+        cleaned = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', cleaned)
+        return json.loads(cleaned)
+    except json.JSONDecodeError as json_error:
+        try:
+            fixed_text = re.sub(r'(?<!\\)"(?:[^"\\]|\\.)*"', lambda m: m.group(0).replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t'), response_text, flags=re.DOTALL)
+            return json.loads(fixed_text)
+        except Exception:
+            json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response_text, re.DOTALL)
+            if json_match:
+                try:
+                    return json.loads(fix_json_newlines(json_match.group(0)))
+                except Exception:
+                    raise json_error
+            raise json_error
+
+
+def new_parse(text):
+    return parse_llm_json(text)[0]
+
+
+def check(label, parse, corpus):
+    passed = 0
+    for case in corpus:
+        try:
+            ok = parse(case['raw']) == case['expected']
+        except Exception:
+            ok = False
+        passed += ok
+        if not ok:
+            print(f"  {label}: ✗ {case['name']}")
+    print(f"{label:<8} parsed {passed}/{len(corpus)} corpus cases correctly")
+
+
+def time_parse(parse, corpus, iterations):
+    samples = {}
+    for case in corpus:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            try:
+                parse(case['raw'])
+            except Exception:
+                pass
+        samples[case['name']] = (time.perf_counter() - start) / iterations * 1e6
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the shared LLM JSON repair parser')
+    parser.add_argument('--iterations', type=int, default=200, help='Parses per corpus case (default: 200)')
+    parser.add_argument('--corpus', default=CORPUS_PATH, help='JSONL corpus of {name, raw, expected}')
+    args = parser.parse_args()
+    
+    corpus = load_corpus(args.corpus)
+    print(f"Corpus: {len(corpus)} responses from {args.corpus}\n")
+    check('legacy', legacy_parse, corpus)
+    check('new', new_parse, corpus)
+    
+    legacy = time_parse(legacy_parse, corpus, args.iterations)
+    new = time_parse(new_parse, corpus, args.iterations)
+    
+    print(f"\n{'case':<32} {'chars':>7} {'legacy µs':>10} {'new µs':>10} {'speedup':>8}")
+    for case in corpus:
+        name = case['name']
+        print(f"{name:<32} {len(case['raw']):>7} {legacy[name]:>10.1f} {new[name]:>10.1f} {legacy[name] / new[name]:>7.1f}x")
+    total_legacy = sum(legacy.values())
+    total_new = sum(new.values())
+    print(f"{'total':<32} {'':>7} {total_legacy:>10.1f} {total_new:>10.1f} {total_legacy / total_new:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Fallback Keyword Matcher Benchmark
+Compares the compiled word-boundary matcher (app.utils.keyword_matcher) with the substring
+``any(word in text ...)`` checks it replaced, over a large generated note corpus, and counts
+notes the old checks mis-categorized (e.g. "art" inside "started").
+
+Usage:
+    python benchmarks/bench_keyword_matcher.py --notes 20000
+    python benchmarks/bench_keyword_matcher.py --corpus notes.txt   # notes separated by lines of ---
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.keyword_matcher import KeywordMatcher, DEFAULT_TAXONOMY_PATH
+
+LEGACY_GOALS = ['goal', 'goals', 'want', 'wants', 'plan', 'plans', 'aspire', 'aspires', 'hope', 'hopes', 'aim', 'aims', 'objective', 'objectives']
+LEGACY_ACTIONABLE = ['task', 'tasks', 'todo', 'todos', 'remind', 'reminder', 'follow', 'follow-up', 'call', 'meet', 'meeting', 'schedule']
+LEGACY_AVOCATION = [
+    'hobby', 'hobbies', 'interest', 'interests', 'interested', 'like', 'likes', 'love', 'loves',
+    'enjoy', 'enjoys', 'passion', 'passions', 'favorite', 'favourite', 'favorites', 'favourites',
+    'cooking', 'baking', 'reading', 'writing', 'music', 'art', 'painting', 'drawing', 'photography',
+    'gardening', 'travel', 'sports', 'fitness', 'exercise', 'gaming', 'games', 'collecting', 'collection',
+    'craft', 'crafts', 'sewing', 'knitting', 'woodworking', 'dancing', 'singing', 'playing', 'instrument',
+    'recreational', 'leisure', 'pastime', 'pastimes', 'activity', 'activities'
+]
+
+SENTENCES = [
+    "{name} started a new role at {company} as a {title} last {month}.",
+    "Met {name} for coffee; we talked about the {topic} project and her department restructuring.",
+    "{name} wants to {goal} within the next year.",
+    "Remind me to follow up with {name} about the {topic} proposal next week.",
+    "Loves {hobby} and has been {hobby} every weekend since {month}.",
+    "Her partner works in {company} finance and they recently moved to a smarter apartment downtown.",
+    "Quarterly planning meeting scheduled; {name} will present the {topic} roadmap.",
+    "Apparently {name} is a big fan of {hobby}, and is thinking about a trip to {city}.",
+    "Experience: {title} at {company}, {month} 2019 - present. Focus on {topic} and partnerships.",
+    "Kids are at the local school; weekends are busy with soccer practice and errands.",
+    "Mentioned feeling overwhelmed lately; the apartment renovation has been dragging on.",
+    "Call {name} on Tuesday to schedule the intro with the {company} team.",
+]
+FILL = {
+    'name': ['Ana', 'Ben', 'Chen', 'Dara', 'Eli', 'Farah', 'Gus'],
+    'company': ['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Stark Industries'],
+    'title': ['product manager', 'staff engineer', 'designer', 'partner', 'analyst'],
+    'month': ['January', 'March', 'June', 'September', 'November'],
+    'topic': ['pricing', 'apartment search', 'data platform', 'hiring', 'marketing', 'charter'],
+    'goal': ['run a marathon', 'learn Spanish', 'start a company', 'buy a house', 'get promoted'],
+    'hobby': ['painting', 'baking', 'photography', 'gardening', 'climbing', 'chess'],
+    'city': ['Lisbon', 'Kyoto', 'Denver', 'Cape Town', 'Oslo'],
+}
+
+
+def generate_corpus(count, seed=42):
+    rng = random.Random(seed)
+    notes = []
+    for _ in range(count):
+        sentences = rng.sample(SENTENCES, rng.randint(2, 6))
+        notes.append(" ".join(
+            sentence.format(**{key: rng.choice(values) for key, values in FILL.items()})
+            for sentence in sentences
+        ))
+    return notes
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return [note.strip() for note in f.read().split('\n---\n') if note.strip()]
+
+
+def legacy_match(text):
+    text = text.lower()
+    categories = []
+    if any(word in text for word in LEGACY_GOALS):
+        categories.append('Goals')
+    if any(word in text for word in LEGACY_ACTIONABLE):
+        categories.append('Actionable')
+    if any(word in text for word in LEGACY_AVOCATION):
+        categories.append('Avocation')
+    return categories
+
+
+def run(label, func, notes, repeat):
+    elapsed = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [func(note) for note in notes]
+        elapsed = min(elapsed, time.perf_counter() - start)
+    megabytes = sum(len(note) for note in notes) / 1e6
+    print(f"{label:<26} {len(notes) / elapsed:>10,.0f} notes/s   {megabytes / elapsed:6.1f} MB/s   {elapsed * 1000:8.1f} ms total")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the fallback keyword matcher')
+    parser.add_argument('--notes', type=int, default=20000, help='Generated notes (default: 20000)')
+    parser.add_argument('--corpus', help='Text file of notes separated by lines containing ---')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per variant; the fastest is reported (default: 5)')
+    parser.add_argument('--taxonomy', default=DEFAULT_TAXONOMY_PATH, help='Taxonomy JSON file')
+    args = parser.parse_args()
+    
+    notes = load_corpus(args.corpus) if args.corpus else generate_corpus(args.notes)
+    print(f"Corpus: {len(notes):,} notes, {sum(len(note) for note in notes) / 1e6:.1f} MB\n")
+    
+    start = time.perf_counter()
+    matcher = KeywordMatcher.from_file(args.taxonomy)
+    print(f"Compiled taxonomy in {(time.perf_counter() - start) * 1000:.1f} ms\n")
+    
+    legacy = run('substring any() (old)', legacy_match, notes, args.repeat)
+    compiled = run('compiled matcher', lambda note: list(matcher.match(note)), notes, args.repeat)
+    
+    differing = [(note, old, new) for note, old, new in zip(notes, legacy, compiled) if set(old) != set(new)]
+    print(f"\nNotes categorized differently: {len(differing):,} of {len(notes):,}")
+    for note, old, new in differing[:3]:
+        print(f"  old={old} new={new}\n    {note[:140]}...")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Note Embedding Reuse Benchmark
+Times the vector stages of note processing the old way (the store embeds the full note
+while retrieval embeds the first 30 words, concurrently) against embedding the note
+once and reusing the vector for both (NoteService._start_vector_stages).
+
+The embedding cache is disabled so every embedding is computed. Without network access
+for Chroma's default model, pass --simulate for a CPU-bound stand-in whose cost grows
+with note length.
+
+Usage:
+    python benchmarks/bench_note_embedding.py --notes 200
+    python benchmarks/bench_note_embedding.py --notes 200 --simulate
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = ("met coffee project launch daughter marathon training budget review promotion "
+         "moved apartment downtown hiking trip japan quarterly planning roadmap guitar").split()
+
+
+class SimulatedEmbedding:
+    """Stand-in for a small transformer: a few dense layers per token, mean-pooled"""
+    
+    def __init__(self, dimensions: int = 384, layers: int = 6):
+        rng = np.random.default_rng(0)
+        self.weights = [rng.standard_normal((dimensions, dimensions)).astype(np.float32) / dimensions ** 0.5
+                        for _ in range(layers)]
+        self.dimensions = dimensions
+    
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            tokens = max(1, min(256, len(text.split())))
+            x = np.ones((tokens, self.dimensions), dtype=np.float32)
+            for weights in self.weights:
+                x = np.tanh(x @ weights)
+            vector = x.mean(axis=0)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+
+
+def make_note(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 160)))
+
+
+def run(label, stages, notes, contacts):
+    samples = []
+    for note_id, content in enumerate(notes, start=1):
+        contact_id = 1 + note_id % contacts
+        start = time.perf_counter()
+        stages(contact_id, content, note_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<26} mean {statistics.mean(samples):7.2f} ms   p50 {statistics.median(samples):7.2f} ms   "
+          f"max {max(samples):7.2f} ms")
+    return statistics.mean(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark embedding each note once vs twice')
+    parser.add_argument('--notes', type=int, default=200, help='Notes per variant (default: 200)')
+    parser.add_argument('--contacts', type=int, default=10, help='Contacts to spread notes over (default: 10)')
+    parser.add_argument('--simulate', action='store_true', help='Use a CPU-bound stand-in embedding model')
+    args = parser.parse_args()
+    
+    chroma_dir = tempfile.mkdtemp(prefix='bench_note_embedding_')
+    os.environ['CHROMA_DB_DIR'] = chroma_dir
+    os.environ['EMBEDDING_CACHE_ENABLED'] = 'false'
+    if args.simulate:
+        os.environ['EMBEDDING_FUNCTION'] = '__main__:SimulatedEmbedding'
+    
+    from app.utils.chromadb_client import store_note_in_chromadb, get_relevant_history, embed_texts, get_chroma_client
+    from app.utils.executor import get_executor
+    executor = get_executor('pipeline')
+    
+    def two_embeddings(contact_id, content, note_id):
+        store = executor.submit(store_note_in_chromadb, contact_id, content, note_id)
+        query_text = " ".join(content.split()[:30])
+        retrieval = executor.submit(get_relevant_history, contact_id, query_text, n_results=3, exclude_note_id=note_id)
+        retrieval.result()
+        store.result()
+    
+    def one_embedding(contact_id, content, note_id):
+        embedding = embed_texts([content])[0]
+        store = executor.submit(store_note_in_chromadb, contact_id, content, note_id, embedding=embedding)
+        retrieval = executor.submit(get_relevant_history, contact_id, n_results=3, exclude_note_id=note_id,
+                                    query_embedding=embedding)
+        retrieval.result()
+        store.result()
+    
+    rng = random.Random(7)
+    try:
+        get_chroma_client()
+        embed_texts(["warm up"])
+        print(f"{args.notes} notes, {'simulated' if args.simulate else 'default'} embedding model\n")
+        before = run('embed twice (before)', two_embeddings, [make_note(rng) for _ in range(args.notes)], args.contacts)
+        after = run('embed once (after)', one_embedding, [make_note(rng) for _ in range(args.notes)], args.contacts)
+        print(f"\nSaved {before - after:.2f} ms per note ({(before - after) / before * 100:.0f}%)")
+    finally:
+        shutil.rmtree(chroma_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Vector Store Layout Benchmark
+Compares ChromaDB with one collection per contact (CHROMA_COLLECTION_MODE=per_contact)
+against one collection per user filtered by contact_id metadata (per_user): build time,
+disk size, cold start (new process opening the store and answering one query) and warm
+query latency.
+
+Vectors are random 384-dimension unit vectors (the size of the default embedding model),
+so the numbers measure the store layout rather than the embedding model.
+
+Usage:
+    python benchmarks/bench_vector_layout.py --users 5 --contacts 200 --notes 20
+    python benchmarks/bench_vector_layout.py --keep /tmp/layouts   # Keep the generated stores
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from chromadb.config import Settings
+
+DIMENSIONS = 384
+
+COLD_START_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import chromadb
+from chromadb.config import Settings
+client = chromadb.PersistentClient(path=sys.argv[1], settings=Settings(anonymized_telemetry=False))
+collection = client.get_collection(sys.argv[2])
+where = {"contact_id": int(sys.argv[3])} if sys.argv[4] == 'per_user' else None
+collection.query(query_embeddings=[[0.05] * %d], n_results=3, where=where)
+print((time.perf_counter() - start) * 1000)
+""" % DIMENSIONS
+
+
+def unit_vectors(rng, count):
+    vectors = rng.standard_normal((count, DIMENSIONS)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.tolist()
+
+
+def collection_for(mode, user_id, contact_id):
+    return f"user_{user_id}" if mode == 'per_user' else f"contact_{contact_id}"
+
+
+def build(path, mode, owners, notes_per_contact, seed):
+    """Write the same notes into a fresh store using ``mode``; returns seconds taken"""
+    rng = np.random.default_rng(seed)
+    client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+    start = time.perf_counter()
+    note_id = 0
+    for contact_id, user_id in owners.items():
+        collection = client.get_or_create_collection(name=collection_for(mode, user_id, contact_id))
+        ids = []
+        metadatas = []
+        for _ in range(notes_per_contact):
+            note_id += 1
+            ids.append(f"note_{note_id}")
+            metadatas.append({"contact_id": contact_id, "note_id": note_id})
+        collection.add(
+            ids=ids,
+            embeddings=unit_vectors(rng, notes_per_contact),
+            documents=[f"note {i} for contact {contact_id}" for i in ids],
+            metadatas=metadatas
+        )
+    return time.perf_counter() - start
+
+
+def disk_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def cold_start_ms(path, mode, owners, runs):
+    samples = []
+    contact_ids = list(owners)
+    for _ in range(runs):
+        contact_id = random.choice(contact_ids)
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START_SCRIPT, path,
+             collection_for(mode, owners[contact_id], contact_id), str(contact_id), mode],
+            capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return samples
+
+
+def query_latencies_ms(path, mode, owners, queries, seed):
+    rng = np.random.default_rng(seed + 1)
+    client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+    contact_ids = list(owners)
+    query_vectors = unit_vectors(rng, queries)
+    samples = []
+    for vector in query_vectors:
+        contact_id = random.choice(contact_ids)
+        where = {"contact_id": contact_id} if mode == 'per_user' else None
+        start = time.perf_counter()
+        collection = client.get_collection(collection_for(mode, owners[contact_id], contact_id))
+        collection.query(query_embeddings=[vector], n_results=3, where=where)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-contact vs per-user ChromaDB collections')
+    parser.add_argument('--users', type=int, default=5, help='Users (default: 5)')
+    parser.add_argument('--contacts', type=int, default=200, help='Contacts in total (default: 200)')
+    parser.add_argument('--notes', type=int, default=20, help='Notes per contact (default: 20)')
+    parser.add_argument('--queries', type=int, default=500, help='Warm queries per layout (default: 500)')
+    parser.add_argument('--cold-runs', type=int, default=5, help='Cold-start processes per layout (default: 5)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--keep', help='Build the stores under this directory and keep them')
+    args = parser.parse_args()
+    
+    random.seed(args.seed)
+    owners = {contact_id: 1 + contact_id % args.users for contact_id in range(1, args.contacts + 1)}
+    base_dir = args.keep or tempfile.mkdtemp(prefix='bench_vector_layout_')
+    
+    print(f"{args.contacts} contacts across {args.users} users, {args.notes} notes each "
+          f"({args.contacts * args.notes} vectors)\n")
+    try:
+        for mode in ('per_contact', 'per_user'):
+            path = os.path.join(base_dir, mode)
+            shutil.rmtree(path, ignore_errors=True)
+            build_seconds = build(path, mode, owners, args.notes, args.seed)
+            size_mb = disk_size(path) / 1024 / 1024
+            cold = cold_start_ms(path, mode, owners, args.cold_runs)
+            warm = query_latencies_ms(path, mode, owners, args.queries, args.seed)
+            print(f"{mode:<12} build {build_seconds:6.1f} s   disk {size_mb:7.1f} MB   "
+                  f"cold start {statistics.median(cold):7.1f} ms   "
+                  f"query p50 {statistics.median(warm):6.2f} ms   p95 {percentile(warm, 0.95):6.2f} ms")
+    finally:
+        if not args.keep:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
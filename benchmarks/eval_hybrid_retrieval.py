@@ -0,0 +1,237 @@
+"""
+Hybrid Retrieval Evaluation
+Measures recall, MRR, duplicate rate and latency of RAG retrieval over a synthetic set of
+contacts: vector search alone (the old get_relevant_history), vector + BM25 fused by
+reciprocal rank, and fusion followed by MMR.
+
+Each contact gets filler notes, near-duplicate notes (the same note re-entered with small
+edits) and "needle" notes carrying a rare name, date or place. Queries are of two kinds:
+  - needle: mention the rare term in new wording (what lexical search is for)
+  - paraphrase: describe a two-topic note with synonyms and no shared rare terms (what
+    vector search is for); the near-duplicate notes get such queries too
+A query hits when a note from its target group is in the top k. "duplicates" is the share
+of result slots taken by a second copy of a note already returned. Latencies are measured
+with the lexical indexes already built; the last lines time how the cached index catches
+up after a new note (appending it vs rebuilding the index).
+
+Without network access for Chroma's default model, pass --simulate: a stand-in embedding
+that averages word vectors of a fixed vocabulary (synonyms share a vector) and ignores
+out-of-vocabulary words, like a small sentence model that under-weights names and codes.
+
+Usage:
+    python benchmarks/eval_hybrid_retrieval.py --simulate
+    python benchmarks/eval_hybrid_retrieval.py --contacts 20 --k 3
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Synonym groups share a simulated word vector
+TOPICS = {
+    'running': [['marathon', 'race'], ['training', 'practicing'], ['running', 'jogging'], ['miles', 'distance']],
+    'career': [['promotion', 'raise'], ['manager', 'boss'], ['job', 'role'], ['company', 'employer']],
+    'family': [['daughter', 'kid'], ['school', 'university'], ['moved', 'relocated'], ['parents', 'folks']],
+    'travel': [['trip', 'vacation'], ['flight', 'plane'], ['hotel', 'stay'], ['beach', 'coast']],
+    'health': [['doctor', 'physician'], ['surgery', 'operation'], ['recovery', 'healing'], ['knee', 'joint']],
+    'money': [['mortgage', 'loan'], ['savings', 'nest'], ['budget', 'spending'], ['house', 'home']],
+}
+FILLER = "talked about over coffee and said things are going well lately with".split()
+RARE_NAMES = ["Anneliese", "Tomasz", "Ngozi", "Ragnhild", "Eitan", "Saoirse", "Kwabena", "Ifeoma", "Leopoldo", "Yevgenia"]
+RARE_PLACES = ["Porto", "Tromso", "Oaxaca", "Zanzibar", "Ljubljana", "Hokkaido", "Cusco", "Tbilisi"]
+MONTHS = ["January", "March", "June", "September", "November"]
+
+
+class SimulatedEmbedding:
+    """Mean of per-word vectors over a fixed vocabulary; unknown words contribute nothing"""
+    
+    def __init__(self, dimensions: int = 128):
+        rng = np.random.default_rng(0)
+        self.vectors = {}
+        for groups in TOPICS.values():
+            topic_vector = rng.standard_normal(dimensions)
+            for group in groups:
+                vector = topic_vector * 0.5 + rng.standard_normal(dimensions)
+                for word in group:
+                    self.vectors[word] = vector
+        for word in FILLER:
+            self.vectors[word] = rng.standard_normal(dimensions) * 0.3
+        self.dimensions = dimensions
+    
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            words = [self.vectors[word] for word in text.lower().replace("'s", "").split() if word in self.vectors]
+            vector = np.mean(words, axis=0) if words else np.full(self.dimensions, 1e-3)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+
+
+def topic_note(rng, topic, synonym):
+    """A note on ``topic`` using the first (or, with ``synonym``, second) word of each group"""
+    words = [group[1 if synonym else 0] for group in TOPICS[topic]]
+    rng.shuffle(words)
+    return " ".join(rng.sample(FILLER, 4) + words + rng.sample(FILLER, 3))
+
+
+def paraphrase_query(rng, first, second):
+    """A query about a two-topic note using only synonyms of its topic words"""
+    words = [group[1] for topic in (first, second) for group in TOPICS[topic]]
+    rng.shuffle(words)
+    return " ".join(words + rng.sample(FILLER, 2))
+
+
+def build_contact(rng, notes_per_contact):
+    """(notes, queries) for one contact; notes are (text, group), queries (text, group)"""
+    notes, queries = [], []
+    topics = list(TOPICS)
+    for index in range(notes_per_contact):
+        topic = topics[index % len(topics)]
+        notes.append((topic_note(rng, topic, synonym=False), f"filler-{index}"))
+    
+    # Near-duplicates: a two-topic note re-entered three times with a word changed
+    for index in range(2):
+        first, second = rng.sample(topics, 2)
+        base = f"{topic_note(rng, first, synonym=False)} {topic_note(rng, second, synonym=False)}"
+        for copy in range(3):
+            words = base.split()
+            words[rng.randrange(len(words))] = rng.choice(FILLER)
+            notes.append((" ".join(words), f"dup-{index}"))
+        queries.append((paraphrase_query(rng, first, second), f"dup-{index}"))
+    
+    # Needles: rare terms in an otherwise ordinary note, queried in different words
+    for index, (name, place) in enumerate(zip(rng.sample(RARE_NAMES, 3), rng.sample(RARE_PLACES, 3))):
+        topic = rng.choice(topics)
+        month = rng.choice(MONTHS)
+        notes.append((f"{topic_note(rng, topic, synonym=False)} {name} {place} {month}", f"needle-{index}"))
+        queries.append((f"ask how {name} liked {place}", f"needle-{index}"))
+    
+    # Paraphrases: a note spanning two topics (filler notes have one), queried with synonyms only
+    for index in range(2):
+        first, second = rng.sample(topics, 2)
+        notes.append((f"{topic_note(rng, first, synonym=False)} {topic_note(rng, second, synonym=False)}", f"para-{index}"))
+        queries.append((paraphrase_query(rng, first, second), f"para-{index}"))
+    return notes, queries
+
+
+def evaluate(label, retriever, corpus, k):
+    from app.utils.chromadb_client import get_contact_collection, embed_texts
+    hits = {'needle': [], 'para': [], 'dup': []}
+    reciprocal_ranks = []
+    repeats = slots = 0
+    latencies = []
+    for contact_id, (groups, queries) in corpus.items():
+        collection = get_contact_collection(contact_id)
+        for text, group in queries:
+            embedding = embed_texts([text])[0]
+            start = time.perf_counter()
+            notes = retriever.retrieve(collection, contact_id, query_text=text, query_embedding=embedding, n_results=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            result_groups = [groups[note['id']] for note in notes]
+            rank = next((position for position, found in enumerate(result_groups, start=1) if found == group), None)
+            hits[group.split('-')[0]].append(rank is not None)
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+            slots += len(result_groups)
+            repeats += len(result_groups) - len(set(result_groups))
+    
+    all_hits = hits['needle'] + hits['para'] + hits['dup']
+    latencies.sort()
+    print(f"{label:<24} recall@{k} {statistics.mean(all_hits):4.2f} (needle {statistics.mean(hits['needle']):4.2f}, "
+          f"paraphrase {statistics.mean(hits['para']):4.2f})  MRR {statistics.mean(reciprocal_ranks):4.2f}  "
+          f"duplicates {repeats / slots if slots else 0:4.2f}  "
+          f"p50 {statistics.median(latencies):5.2f} ms  p95 {latencies[int(len(latencies) * 0.95) - 1]:5.2f} ms")
+
+
+def measure_index_refresh(corpus, rng, now):
+    """Time bringing a warm lexical index up to date after one new note, against a full build"""
+    from app.utils.chromadb_client import get_contact_collection, embed_texts
+    from app.utils.hybrid_retriever import HybridRetriever
+    warm = HybridRetriever()
+    for contact_id in corpus:
+        warm._lexical_index(get_contact_collection(contact_id), contact_id, None)
+    appends, builds = [], []
+    for contact_id in corpus:
+        collection = get_contact_collection(contact_id)
+        note_id = contact_id * 10000 + 9999
+        text = topic_note(rng, rng.choice(list(TOPICS)), synonym=False)
+        collection.add(ids=[f"note_{note_id}"], documents=[text], embeddings=embed_texts([text]),
+                       metadatas=[{"contact_id": contact_id, "note_id": note_id, "timestamp": now.isoformat()}])
+        start = time.perf_counter()
+        warm._lexical_index(collection, contact_id, None)
+        appends.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        HybridRetriever()._lexical_index(collection, contact_id, None)
+        builds.append((time.perf_counter() - start) * 1000)
+    print(f"\nIndex refresh after a new note: append p50 {statistics.median(appends):5.2f} ms, "
+          f"full rebuild p50 {statistics.median(builds):5.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate vector-only vs hybrid RAG retrieval')
+    parser.add_argument('--contacts', type=int, default=10, help='Synthetic contacts (default: 10)')
+    parser.add_argument('--notes', type=int, default=60, help='Filler notes per contact (default: 60)')
+    parser.add_argument('--k', type=int, default=3, help='Notes retrieved per query (default: 3)')
+    parser.add_argument('--simulate', action='store_true', help='Use the vocabulary-based stand-in embedding')
+    args = parser.parse_args()
+    
+    chroma_dir = tempfile.mkdtemp(prefix='eval_hybrid_retrieval_')
+    os.environ['CHROMA_DB_DIR'] = chroma_dir
+    os.environ['CHROMA_COLLECTION_MODE'] = 'per_contact'
+    os.environ['EMBEDDING_CACHE_ENABLED'] = 'false'
+    if args.simulate:
+        os.environ['EMBEDDING_FUNCTION'] = '__main__:SimulatedEmbedding'
+    
+    from app.utils.chromadb_client import get_contact_collection, embed_texts
+    from app.utils.hybrid_retriever import HybridRetriever
+    
+    rng = random.Random(11)
+    now = datetime.utcnow()
+    corpus = {}
+    try:
+        for contact_id in range(1, args.contacts + 1):
+            notes, queries = build_contact(rng, args.notes)
+            rng.shuffle(notes)
+            ids = [f"note_{contact_id * 10000 + index}" for index in range(len(notes))]
+            get_contact_collection(contact_id).add(
+                ids=ids,
+                documents=[text for text, _ in notes],
+                embeddings=embed_texts([text for text, _ in notes]),
+                metadatas=[{
+                    "contact_id": contact_id,
+                    "note_id": contact_id * 10000 + index,
+                    "timestamp": (now - timedelta(days=rng.uniform(0, 720))).isoformat()
+                } for index in range(len(notes))]
+            )
+            corpus[contact_id] = (dict(zip(ids, (group for _, group in notes))), queries)
+        
+        query_count = sum(len(queries) for _, queries in corpus.values())
+        print(f"{args.contacts} contacts, {query_count} queries, "
+              f"{'simulated' if args.simulate else 'default'} embedding model\n")
+        variants = [
+            ('vector only', HybridRetriever(candidates=args.k, lexical=False, mmr_lambda=1.0, recency_weight=0.0)),
+            ('hybrid (RRF)', HybridRetriever(mmr_lambda=1.0, recency_weight=0.0)),
+            ('hybrid + MMR', HybridRetriever(recency_weight=0.0)),
+            ('hybrid + MMR + recency', HybridRetriever()),
+        ]
+        for label, retriever in variants:
+            # Build the lexical indexes first so latency reflects steady state
+            for contact_id in corpus:
+                retriever._lexical_index(get_contact_collection(contact_id), contact_id, None)
+            evaluate(label, retriever, corpus, args.k)
+        measure_index_refresh(corpus, rng, now)
+    finally:
+        shutil.rmtree(chroma_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
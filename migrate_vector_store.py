@@ -0,0 +1,160 @@
+"""
+Vector Store Migration Script
+Moves stored note vectors between the two ChromaDB collection layouts:
+
+    per_contact  one collection per contact (contact_<id>)
+    per_user     one collection per user (user_<id>), notes tagged with contact_id metadata
+
+Embeddings are copied as stored, so nothing is re-embedded. Writes are upserts keyed
+by note ID, so an interrupted migration can simply be run again. Source collections
+are kept unless --delete-source is given; switch CHROMA_COLLECTION_MODE once the copy
+is done.
+
+Usage:
+    python migrate_vector_store.py --to per_user --dry-run     # Show what would move
+    python migrate_vector_store.py --to per_user               # Copy into per-user collections
+    python migrate_vector_store.py --to per_user --delete-source
+    python migrate_vector_store.py --to per_contact            # Back to one collection per contact
+"""
+
+import sys
+import os
+import time
+import argparse
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.chromadb_client import get_chroma_client, get_collection_name, COLLECTION_MODES
+
+PAGE_SIZE = 500
+
+
+def load_contact_owners():
+    """contact_id -> user_id for every contact in the database"""
+    from app.models import Contact
+    from app.utils.database import DatabaseManager
+    with DatabaseManager().get_session() as session:
+        return dict(session.query(Contact.id, Contact.user_id).all())
+
+
+def iter_records(collection):
+    """Yield (ids, embeddings, documents, metadatas) pages of a collection"""
+    offset = 0
+    while True:
+        page = collection.get(
+            limit=PAGE_SIZE,
+            offset=offset,
+            include=['embeddings', 'documents', 'metadatas']
+        )
+        if not page['ids']:
+            return
+        yield page['ids'], page['embeddings'], page['documents'], page['metadatas']
+        offset += len(page['ids'])
+
+
+def plan_sources(client, target_mode):
+    """Collections in the other layout, i.e. the ones to migrate"""
+    source_prefix = 'contact_' if target_mode == 'per_user' else 'user_'
+    return [c for c in client.list_collections() if c.name.startswith(source_prefix)]
+
+
+def target_for(metadata, owners, target_mode):
+    contact_id = metadata.get('contact_id') if metadata else None
+    if contact_id is None:
+        return None
+    contact_id = int(contact_id)
+    if target_mode == 'per_user':
+        user_id = owners.get(contact_id)
+        if user_id is None:
+            return None
+        return get_collection_name(contact_id, user_id=user_id, mode='per_user')
+    return get_collection_name(contact_id, mode='per_contact')
+
+
+def migrate_collection(client, source, owners, target_mode, dry_run):
+    """Copy one source collection; returns (copied, orphaned)"""
+    copied = 0
+    orphaned = 0
+    targets = {}
+    for ids, embeddings, documents, metadatas in iter_records(source):
+        batches = {}
+        for record in zip(ids, embeddings, documents, metadatas):
+            target_name = target_for(record[3], owners, target_mode)
+            if target_name is None:
+                orphaned += 1
+                continue
+            batches.setdefault(target_name, []).append(record)
+        
+        for target_name, records in batches.items():
+            copied += len(records)
+            if dry_run:
+                continue
+            target = targets.get(target_name)
+            if target is None:
+                if target_mode == 'per_user':
+                    metadata = {'user_id': int(target_name[len('user_'):])}
+                else:
+                    metadata = {'contact_id': int(target_name[len('contact_'):])}
+                target = client.get_or_create_collection(name=target_name, metadata=metadata)
+                targets[target_name] = target
+            target.upsert(
+                ids=[r[0] for r in records],
+                embeddings=[r[1] for r in records],
+                documents=[r[2] for r in records],
+                metadatas=[r[3] for r in records]
+            )
+    return copied, orphaned
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate ChromaDB note vectors between collection layouts')
+    parser.add_argument('--to', dest='target_mode', choices=COLLECTION_MODES, required=True,
+                       help='Layout to migrate into')
+    parser.add_argument('--delete-source', action='store_true',
+                       help='Delete each source collection once it has been copied without orphans')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be copied')
+    args = parser.parse_args()
+    
+    try:
+        client = get_chroma_client()
+        owners = load_contact_owners() if args.target_mode == 'per_user' else {}
+        sources = plan_sources(client, args.target_mode)
+        if not sources:
+            print(f"Nothing to migrate: no collections outside the {args.target_mode} layout")
+            return
+        
+        print(f"{'Checking' if args.dry_run else 'Migrating'} {len(sources)} collections into the {args.target_mode} layout...")
+        start = time.perf_counter()
+        total_copied = 0
+        total_orphaned = 0
+        deleted = 0
+        for source in sources:
+            copied, orphaned = migrate_collection(client, source, owners, args.target_mode, args.dry_run)
+            total_copied += copied
+            total_orphaned += orphaned
+            note = f", {orphaned} orphaned (contact no longer exists)" if orphaned else ''
+            print(f"  {source.name:<24} {copied:>6} notes{note}")
+            if args.delete_source and not args.dry_run and not orphaned:
+                client.delete_collection(name=source.name)
+                deleted += 1
+        
+        elapsed = time.perf_counter() - start
+        verb = 'would be copied' if args.dry_run else 'copied'
+        print(f"\n✅ {total_copied} notes {verb} in {elapsed:.1f}s")
+        if total_orphaned:
+            print(f"⚠️  {total_orphaned} vectors belong to deleted contacts and were skipped")
+        if deleted:
+            print(f"🗑️  Deleted {deleted} source collections")
+        if not args.dry_run:
+            print(f"Set CHROMA_COLLECTION_MODE={args.target_mode} to read from the new layout")
+    
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Vector Index Rebuild Script
+Re-embeds raw notes from the database and writes them into ChromaDB, e.g. after the
+Chroma directory was lost or corrupted, or after changing the embedding model. Notes
+are streamed in id order and progress is checkpointed after every batch, so an
+interrupted rebuild picks up where it left off.
+
+Usage:
+    python rebuild_vector_index.py --dry-run                  # Count notes to embed
+    python rebuild_vector_index.py --drop --workers 4         # Fresh rebuild with 4 embedding processes
+    python rebuild_vector_index.py                            # Resume an interrupted rebuild
+    python rebuild_vector_index.py --contact-id 12 --drop     # Rebuild one contact's vectors
+    python rebuild_vector_index.py --restart                  # Ignore the checkpoint and start over
+"""
+
+import sys
+import os
+import argparse
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.vector_rebuild_service import VectorRebuildJob
+
+
+def print_progress(progress):
+    eta = progress['eta_seconds']
+    eta_label = f"{eta / 60:.1f} min" if eta is not None else '?'
+    print(f"  {progress['done']:>7}/{progress['total']:<7} "
+          f"{progress['notes_per_second']:7.1f} notes/s   "
+          f"last note {progress['last_note_id']:<8} ETA {eta_label}",
+          flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the ChromaDB note vectors from raw_notes')
+    parser.add_argument('--contact-id', type=int, action='append', dest='contact_ids',
+                       help='Only notes for this contact (repeatable)')
+    parser.add_argument('--user-id', type=int, help="Only notes for this user's contacts")
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Embedding processes (default: 1, embed in this process)')
+    parser.add_argument('--batch-size', type=int, default=64,
+                       help='Notes per embedding batch and checkpoint (default: 64)')
+    parser.add_argument('--limit', type=int, help='Stop after this many notes (resume later)')
+    parser.add_argument('--drop', action='store_true',
+                       help='On a fresh start, delete the existing vectors first')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: data/vector_rebuild_checkpoint.json)')
+    parser.add_argument('--restart', action='store_true', help='Ignore any checkpoint and start over')
+    parser.add_argument('--dry-run', action='store_true', help='Only count the notes that would be embedded')
+    args = parser.parse_args()
+    
+    try:
+        job = VectorRebuildJob(
+            contact_ids=args.contact_ids,
+            user_id=args.user_id,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            checkpoint_path=args.checkpoint
+        )
+        checkpoint = None if args.restart else job.load_checkpoint()
+        after_id = checkpoint['last_note_id'] if checkpoint else 0
+        
+        if args.dry_run:
+            print(f"{job.count_remaining()} notes match the filters")
+            if checkpoint:
+                print(f"{job.count_remaining(after_id)} remaining after checkpoint (note {after_id})")
+            return
+        
+        if checkpoint:
+            print(f"Resuming after note {after_id} ({checkpoint['processed']} already embedded)")
+        elif args.drop:
+            print("Deleting existing vectors...")
+        print(f"Embedding {job.count_remaining(after_id)} notes with {job.workers} worker(s), "
+              f"batches of {job.batch_size} ({job.filters['collection_mode']} collections)...")
+        checkpoint = job.run(restart=args.restart, drop=args.drop, limit=args.limit, on_progress=print_progress)
+        
+        seconds = checkpoint.get('run_seconds') or 0
+        rate = checkpoint['run_notes'] / seconds if seconds else 0.0
+        print(f"\n✅ {checkpoint['run_notes']} notes embedded in {seconds}s ({rate:.1f} notes/s); "
+              f"{checkpoint['processed']} in total")
+    
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Vector Store Reconcile Script
+Compares the SQL contacts and notes with the ChromaDB collections and vectors. It
+deletes collections whose contact (or user) is gone and vectors whose note was deleted
+or moved. It also re-embeds notes that have no vector, for example because a write-behind
+flush was lost. It is safe to run on a schedule (e.g. nightly from cron), and
+overlapping runs are refused.
+
+Usage:
+    python reconcile_vector_store.py --dry-run               # Report drift without changing anything
+    python reconcile_vector_store.py                         # Fix drift
+    python reconcile_vector_store.py --max-reembed 5000      # Cap re-embedding per run
+    python reconcile_vector_store.py --json                  # Machine-readable summary
+"""
+
+import sys
+import os
+import json
+import argparse
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.vector_reconcile_service import VectorReconcileJob
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcile the ChromaDB note vectors with the SQL database')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+    parser.add_argument('--page-size', type=int, default=1000,
+                       help='Vectors read from Chroma per page (default: 1000)')
+    parser.add_argument('--batch-size', type=int, default=64,
+                       help='Notes per re-embedding batch (default: 64)')
+    parser.add_argument('--max-reembed', type=int, help='Re-embed at most this many notes per run')
+    parser.add_argument('--grace-minutes', type=float, default=10.0,
+                       help='Keep unmatched vectors and orphan collections with vectors younger than this (default: 10)')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    args = parser.parse_args()
+    
+    try:
+        job = VectorReconcileJob(
+            dry_run=args.dry_run,
+            page_size=args.page_size,
+            batch_size=args.batch_size,
+            max_reembed=args.max_reembed,
+            grace_minutes=args.grace_minutes
+        )
+        summary = job.run()
+        
+        if args.json:
+            print(json.dumps(summary, indent=2))
+            return
+        
+        action = 'would be' if args.dry_run else 'were'
+        print(f"Checked {summary['collections_checked']} {summary['collection_mode']} collections "
+              f"and {summary['vectors_checked']} vectors in {summary['seconds']}s")
+        print(f"  Orphan collections {action} deleted: {len(summary['orphan_collections'])}")
+        for name in summary['orphan_collections']:
+            print(f"    - {name}")
+        if summary['recent_orphan_collections']:
+            print(f"  Orphan collections kept (recent vectors): {summary['recent_orphan_collections']}")
+        print(f"  Orphan vectors {action} deleted:     {summary['orphan_vectors']}")
+        print(f"  Notes missing a vector:          {summary['missing_notes']}")
+        if not args.dry_run:
+            print(f"  Re-embedded:                     {summary['reembedded']}")
+            if summary['reembed_deferred']:
+                print(f"  Deferred to the next run:        {summary['reembed_deferred']}")
+        if summary['other_layout_collections']:
+            print(f"\n⚠️ {summary['other_layout_collections']} collections use the other layout; "
+                  f"see migrate_vector_store.py")
+        if not args.dry_run:
+            print("\n✅ Vector store reconciled")
+    
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Note Reprocessing Script
+Re-analyzes existing raw notes and replaces their synthesized entries, e.g. after
+CATEGORY_DEFINITIONS, VALID_CATEGORIES or CATEGORY_MAP change. Progress is checkpointed
+after every batch, so an interrupted run picks up where it left off.
+
+Cached analyses are keyed on a hash of the prompt templates (PROMPT_VERSION in
+app/services/prompt_builder.py), so a prompt change re-analyzes every note; otherwise
+cached analyses are reused and only the category normalization is re-applied.
+
+Usage:
+    python reprocess_notes.py --dry-run                       # Count matching notes
+    python reprocess_notes.py                                 # Reprocess (or resume) all notes
+    python reprocess_notes.py --contact-id 12 --contact-id 15 # Only these contacts
+    python reprocess_notes.py --since 2024-01-01 --source manual --concurrency 8
+    python reprocess_notes.py --retry-failed                  # Retry notes the last run could not analyze
+    python reprocess_notes.py --restart                       # Ignore the checkpoint and start over
+"""
+
+import sys
+import os
+import argparse
+from datetime import datetime
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.reprocess_service import ReprocessJob
+
+
+def parse_date(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}' (expected YYYY-MM-DD or ISO 8601)")
+
+
+def print_progress(progress):
+    eta = progress['eta_seconds']
+    eta_label = f"{eta / 60:.1f} min" if eta is not None else '?'
+    print(f"  {progress['done']:>6}/{progress['total']:<6} "
+          f"{progress['notes_per_second']:6.2f} notes/s   "
+          f"failed {progress['failed']:<4} last note {progress['last_note_id']:<8} ETA {eta_label}",
+          flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-analyze existing notes with the current taxonomy')
+    parser.add_argument('--contact-id', type=int, action='append', dest='contact_ids',
+                       help='Only notes for this contact (repeatable)')
+    parser.add_argument('--user-id', type=int, help="Only notes for this user's contacts")
+    parser.add_argument('--since', type=parse_date, help='Only notes created on or after this date')
+    parser.add_argument('--until', type=parse_date, help='Only notes created before this date')
+    parser.add_argument('--source', action='append', dest='sources',
+                       help="Only notes from this source, e.g. manual, telegram, file (repeatable); "
+                            "audit-trail notes (manual_edit, ui_edit) are only reprocessed when named here")
+    parser.add_argument('--concurrency', type=int, default=4,
+                       help='AI calls in flight at once (default: 4)')
+    parser.add_argument('--batch-size', type=int, default=50,
+                       help='Notes per checkpoint (default: 50)')
+    parser.add_argument('--limit', type=int, help='Stop after this many notes (resume later)')
+    parser.add_argument('--allow-offline', action='store_true',
+                       help='Use offline analysis when no AI provider answers (default: keep existing entries)')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: data/reprocess_checkpoint.json)')
+    parser.add_argument('--restart', action='store_true', help='Ignore any existing checkpoint')
+    parser.add_argument('--retry-failed', action='store_true',
+                       help='Only retry notes recorded as failed in the checkpoint')
+    parser.add_argument('--dry-run', action='store_true', help='Count matching notes and exit')
+    
+    args = parser.parse_args()
+    
+    try:
+        job = ReprocessJob(
+            contact_ids=args.contact_ids,
+            user_id=args.user_id,
+            since=args.since,
+            until=args.until,
+            sources=args.sources,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            allow_offline=args.allow_offline,
+            checkpoint_path=args.checkpoint
+        )
+        
+        checkpoint = None if args.restart else job.load_checkpoint()
+        after_id = checkpoint['last_note_id'] if checkpoint else 0
+        
+        if args.dry_run:
+            print(f"{job.count_remaining()} notes match the filters")
+            if checkpoint:
+                print(f"{job.count_remaining(after_id)} remaining after checkpoint (note {after_id}), "
+                      f"{len(checkpoint['failed'])} failed")
+            return
+        
+        if args.retry_failed:
+            failed = len(checkpoint['failed']) if checkpoint else 0
+            print(f"Retrying {failed} failed notes...")
+            checkpoint = job.retry_failed()
+        else:
+            if checkpoint:
+                print(f"Resuming after note {after_id} ({checkpoint['processed']} already reprocessed)")
+            print(f"Reprocessing {job.count_remaining(after_id)} notes with concurrency {job.concurrency}...")
+            checkpoint = job.run(restart=args.restart, limit=args.limit, on_progress=print_progress)
+            if checkpoint.get('run_seconds'):
+                print(f"\nThis run: {checkpoint['run_notes']} notes in {checkpoint['run_seconds']}s "
+                      f"({checkpoint['run_notes'] / checkpoint['run_seconds']:.2f} notes/s)")
+        
+        if not checkpoint:
+            print("Nothing to do")
+            return
+        print(f"✅ {checkpoint['processed']} notes reprocessed, {checkpoint['entries_written']} entries written")
+        if checkpoint['failed']:
+            print(f"⚠️  {len(checkpoint['failed'])} notes failed and kept their old entries "
+                  f"(rerun with --retry-failed):")
+            for note_id, error in list(checkpoint['failed'].items())[:10]:
+                print(f"   note {note_id}: {error}")
+    
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
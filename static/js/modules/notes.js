@@ -3,20 +3,46 @@
  * Handles note processing and analysis
  */
 
-import { post } from '../utils/api.js';
+import { post, postStream } from '../utils/api.js';
 import { showNotification, showLoading, hideLoading } from '../utils/ui.js';
 import { currentContactId } from './contacts.js';
 
 export async function processNote(noteText, contactId) {
     try {
         showLoading();
-        const result = await post('/notes/process-note', {
+        const payload = {
             note: noteText,
             contact_id: contactId
-        });
+        };
+        
+        let result;
+        let receivedEvents = false;
+        const streamed = [];
+        try {
+            // Show categories as the model produces them
+            result = await postStream('/notes/process-note/stream', payload, (event, data) => {
+                receivedEvents = true;
+                if (event === 'category') {
+                    hideLoading();
+                    streamed.push(data);
+                    displayAnalysisResults(streamed);
+                }
+            });
+        } catch (streamError) {
+            // Only retry without streaming if nothing was processed yet
+            if (receivedEvents || streamError.status) {
+                throw streamError;
+            }
+            console.warn('Streaming unavailable, falling back to a regular request:', streamError);
+            result = await post('/notes/process-note', payload);
+        }
         
         if (result.success) {
-            showNotification(`Note analyzed successfully! Found ${result.categories_count} categories.`);
+            if (result.duplicate_of) {
+                showNotification(`This note was already analyzed - showing its ${result.categories_count} categories.`);
+            } else {
+                showNotification(`Note analyzed successfully! Found ${result.categories_count} categories.`);
+            }
             displayAnalysisResults(result.synthesis);
             
             // Reload contact details to show updated categories
@@ -100,7 +100,7 @@ async function performSearch(query, updateContactsList = false) {
     if (!dropdown) return;
     
     try {
-        const response = await get(`/contacts/search?q=${encodeURIComponent(query)}`);
+        const response = await get(`/contacts/search/semantic?q=${encodeURIComponent(query)}`);
         const results = response.results || [];
         
         if (results.length > 0) {
@@ -142,6 +142,8 @@ function renderSearchResults(results, container, query) {
             } else if (match.type === 'note') {
                 const sourceLabel = match.source === 'manual_edit' ? 'Manual Edit' : 'Audit Trail';
                 return `Match in: ${sourceLabel}`;
+            } else if (match.type === 'semantic') {
+                return `Related note (${Math.round(match.similarity * 100)}% similar)`;
             }
             return 'Match found';
         }).join(', ');
@@ -191,6 +193,7 @@ function renderContactsFromSearch(results, query) {
             if (m.type === 'name') return 'Name match';
             if (m.type === 'category') return `${m.category.replace(/_/g, ' ')} match`;
             if (m.type === 'note') return 'Note match';
+            if (m.type === 'semantic') return 'Related note';
             return 'Match';
         }).join(', ');
         
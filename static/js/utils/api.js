@@ -70,6 +70,82 @@ export async function post(endpoint, data) {
     });
 }
 
+/**
+ * POST and consume a text/event-stream response, calling onEvent(event, data)
+ * for each server-sent event. Resolves with the data of the 'done' event.
+ */
+export async function postStream(endpoint, data, onEvent) {
+    const response = await fetch(`${API_BASE}${endpoint}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        credentials: 'same-origin',
+        body: JSON.stringify(data),
+    });
+    
+    if (!response.ok || !response.body) {
+        let errorData = {};
+        try {
+            errorData = await response.json();
+        } catch (jsonError) {
+            // Non-JSON error body
+        }
+        const error = new Error(errorData.error || `HTTP error! status: ${response.status}`);
+        error.status = response.status;
+        error.data = errorData;
+        throw error;
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = null;
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            const dataLines = [];
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            }
+            if (dataLines.length === 0) continue;
+            
+            const payload = JSON.parse(dataLines.join('\n'));
+            if (event === 'error') {
+                const error = new Error(payload.error || 'Stream failed');
+                error.streamed = true;
+                throw error;
+            }
+            if (event === 'done') {
+                result = payload;
+            }
+            onEvent(event, payload);
+        }
+    }
+    
+    if (!result) {
+        const error = new Error('Stream ended before the analysis finished');
+        error.streamed = true;
+        throw error;
+    }
+    return result;
+}
+
 export async function put(endpoint, data) {
     return apiRequest(endpoint, {
         method: 'PUT',
@@ -0,0 +1,49 @@
+"""
+Test configuration
+Points the database, Chroma and local stores at a temporary directory and replaces the
+embedding model, so the suite runs without network access or a configured deployment
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import itertools
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_test_dir = tempfile.mkdtemp(prefix='kith_tests_')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_test_dir, 'test.db')}",
+    'CHROMA_DB_DIR': os.path.join(_test_dir, 'chroma'),
+    'KITH_DATA_DIR': os.path.join(_test_dir, 'data'),
+    'EMBEDDING_FUNCTION': 'tests.helpers:FakeEmbedding',
+    'EMBEDDING_PRELOAD': 'off',
+    'GEMINI_API_KEY': '',
+    'OPENAI_API_KEY': '',
+})
+
+_usernames = itertools.count(1)
+
+
+@pytest.fixture
+def contact():
+    """A new user with one contact, in freshly created tables; returns (user_id, contact_id)"""
+    from app.models import User, Contact
+    from app.utils.database import DatabaseManager
+    db_manager = DatabaseManager()
+    db_manager.create_all_tables()
+    with db_manager.get_session() as session:
+        user = User(username=f"test-user-{next(_usernames)}", password_hash='x')
+        session.add(user)
+        session.flush()
+        contact = Contact(user_id=user.id, full_name='Alex Example')
+        session.add(contact)
+        session.commit()
+        return user.id, contact.id
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_test_dir, ignore_errors=True)
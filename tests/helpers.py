@@ -0,0 +1,35 @@
+"""
+Test helpers
+Stand-ins for the embedding model and AI providers
+"""
+
+
+class FakeEmbedding:
+    """Deterministic 8-dimensional letter-count embedding"""
+    
+    def __call__(self, input):
+        return [[float(sum(1 for char in text.lower() if char in letters)) + 1e-3
+                 for letters in ('ae', 'io', 'u', 'bcd', 'fgh', 'lmn', 'rst', 'vwxyz')] for text in input]
+
+
+class FakeAIService:
+    """Answers every note with one Goals category and counts the calls"""
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def _categories(self, content):
+        self.calls += 1
+        return {'Goals': {'content': content, 'confidence': 0.9}}
+    
+    def analyze_note(self, content, contact_name, context=None, allow_offline=True):
+        return {'categories': self._categories(content)}
+    
+    def stream_analyze_note(self, content, contact_name, context=None):
+        categories = self._categories(content)
+        for name, data in categories.items():
+            yield 'category', name, data
+        yield 'result', {'categories': categories}, 'fake'
+    
+    def offline_analysis(self, content, contact_name):
+        return {'categories': {}}
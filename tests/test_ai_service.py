@@ -0,0 +1,44 @@
+"""
+Tests for AIService streaming analysis
+"""
+
+import json
+import time
+
+from app.services.ai_service import AIService
+from app.utils.circuit_breaker import get_circuit_breaker, HALF_OPEN
+from app.utils.metrics import get_metrics, counter_total
+
+
+def _streaming_service(provider_chunks):
+    service = AIService()
+    service.gemini_api_key = 'test'
+    service.openai_api_key = None
+    
+    def stream(content, contact_name, context=None):
+        yield from provider_chunks
+    
+    service._stream_gemini = stream
+    return service
+
+
+def test_closed_stream_releases_half_open_probe():
+    response = json.dumps({'categories': {
+        'Goals': {'content': 'Run a marathon', 'confidence': 0.9},
+        'Social': {'content': 'Coffee on Fridays', 'confidence': 0.8},
+    }})
+    service = _streaming_service([response[:60], response[60:]])
+    breaker = get_circuit_breaker('gemini')
+    breaker._trip()
+    breaker._opened_at = time.monotonic() - breaker.open_seconds
+    assert breaker.state == HALF_OPEN
+    
+    events = service.stream_analyze_note('Wants to run a marathon (closed stream test)', 'Alex')
+    assert next(events)[0] == 'category'
+    events.close()
+    
+    # The probe slot came back, so the provider gets the next call
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    breaker.record_ignored()
+    assert counter_total(get_metrics().aggregate(), 'ai_calls', provider='gemini', outcome='cancelled') == 1
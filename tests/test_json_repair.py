@@ -0,0 +1,37 @@
+"""
+Tests for JSON repair of LLM responses
+"""
+
+import json
+
+import pytest
+
+from app.utils.json_repair import repair_json, parse_llm_json
+
+
+@pytest.mark.parametrize('text, expected', [
+    # Truncated after a comma: the last complete element is kept
+    ('[1, 2,', [1, 2]),
+    ('{"a": 1,', {'a': 1}),
+    ('{"a": {"x": [1, 2,', {'a': {'x': [1, 2]}}),
+    # Truncated after a colon: only the key without a value is dropped
+    ('{"a": 1, "b":', {'a': 1}),
+    ('{"a": "x", "b": ', {'a': 'x'}),
+    # Truncated inside a value
+    ('{"a": 1, "b": tr', {'a': 1}),
+    ('{"a": true', {'a': True}),
+    ('{"a": "unfinished', {'a': 'unfinished'}),
+])
+def test_truncated_response_keeps_complete_values(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_repairs_fenced_response_with_raw_newline_and_trailing_comma():
+    text = 'Here you go:\n```json\n{"categories": {"Goals": {"content": "line one\nline two",}},}\n```'
+    value, repaired = parse_llm_json(text)
+    assert repaired
+    assert value == {'categories': {'Goals': {'content': 'line one\nline two'}}}
+
+
+def test_valid_json_is_not_repaired():
+    assert parse_llm_json('{"a": [1, 2]}') == ({'a': [1, 2]}, False)
@@ -0,0 +1,45 @@
+"""
+Tests for NoteService duplicate handling
+"""
+
+import pytest
+
+from app.models import SynthesizedEntry
+from app.services.note_service import NoteService
+from app.utils.database import DatabaseManager
+from tests.helpers import FakeAIService
+
+
+def _submit(service, streamed, contact_id, content, user_id):
+    if not streamed:
+        return service.process_note(contact_id, content, user_id)
+    events = list(service.process_note_stream(contact_id, content, user_id))
+    assert events[-1]['event'] == 'done'
+    return events[-1]['data']
+
+
+@pytest.mark.parametrize('streamed', [False, True])
+def test_duplicate_of_note_left_without_entries_is_analyzed(contact, streamed):
+    user_id, contact_id = contact
+    service = NoteService()
+    service.ai_service = FakeAIService()
+    content = f"Started training for the Porto marathon ({'stream' if streamed else 'sync'})"
+    
+    # The first submission's stream is dropped after the raw note is committed
+    events = service.process_note_stream(contact_id, content, user_id)
+    note_id = next(events)['data']['raw_note_id']
+    events.close()
+    assert service.ai_service.calls == 0
+    
+    result = _submit(service, streamed, contact_id, content, user_id)
+    assert result['raw_note_id'] == note_id
+    assert result['categories_count'] == 1
+    assert service.ai_service.calls == 1
+    
+    # Now that the note has entries, an exact duplicate reuses them
+    again = _submit(service, streamed, contact_id, content, user_id)
+    assert again['duplicate'] == 'exact'
+    assert again['categories_count'] == 1
+    assert service.ai_service.calls == 1
+    with DatabaseManager().get_session() as session:
+        assert session.query(SynthesizedEntry).filter(SynthesizedEntry.raw_note_id == note_id).count() == 1
@@ -0,0 +1,40 @@
+"""
+Tests for the note reprocessing job's note selection
+"""
+
+from app.models import RawNote
+from app.services.reprocess_service import ReprocessJob
+from app.utils.database import DatabaseManager
+
+
+def _add_notes(contact_id, *notes):
+    with DatabaseManager().get_session() as session:
+        for content, source, *tags in notes:
+            session.add(RawNote(contact_id=contact_id, content=content, source=source,
+                                metadata_tags=tags[0] if tags else None))
+        session.commit()
+
+
+def test_audit_notes_are_skipped_unless_named(contact, tmp_path):
+    _, contact_id = contact
+    _add_notes(contact_id, ("Training for a marathon", 'manual'),
+               ("Manual edit: Name changed from 'A' to 'B'", 'manual_edit'))
+    
+    job = ReprocessJob(contact_ids=[contact_id], checkpoint_path=str(tmp_path / 'checkpoint.json'))
+    assert job.count_remaining() == 1
+    
+    audit_job = ReprocessJob(contact_ids=[contact_id], sources=['manual_edit'],
+                             checkpoint_path=str(tmp_path / 'checkpoint.json'))
+    assert audit_job.count_remaining() == 1
+
+
+def test_near_duplicates_are_skipped(contact, tmp_path):
+    _, contact_id = contact
+    _add_notes(contact_id, ("Moved to Porto in March", 'manual', {'source_file': 'notes.txt'}))
+    with DatabaseManager().get_session() as session:
+        original_id = session.query(RawNote.id).filter(RawNote.contact_id == contact_id).scalar()
+    _add_notes(contact_id, ("Moved to Porto in March!", 'manual', {'duplicate_of': original_id, 'similarity': 0.93}))
+    
+    job = ReprocessJob(contact_ids=[contact_id], checkpoint_path=str(tmp_path / 'checkpoint.json'))
+    assert job.count_remaining() == 1
+    assert job._next_batch(0) == [original_id]
@@ -0,0 +1,113 @@
+"""
+Local Classifier Training Script
+Trains the offline category classifier from existing synthesized entries. Web workers load
+the saved model on first use and consult it when no AI provider is available.
+
+Usage:
+    python train_classifier.py                          # Train on entries with confidence >= 0.75
+    python train_classifier.py --min-confidence 0.8     # Only use higher-confidence labels
+    python train_classifier.py --output model.npz       # Save somewhere else (see LOCAL_CLASSIFIER_PATH)
+"""
+
+import sys
+import os
+import time
+import argparse
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.database import DatabaseManager
+from app.models import SynthesizedEntry
+from app.services.local_classifier import train_classifier, get_model_path
+
+
+def load_examples(min_confidence, min_per_category, limit=None):
+    """Read (content, category) pairs, skipping low-confidence labels (e.g. keyword fallback output)"""
+    db = DatabaseManager()
+    texts, labels = [], []
+    with db.get_session() as session:
+        query = session.query(SynthesizedEntry.content, SynthesizedEntry.category).filter(
+            SynthesizedEntry.confidence_score >= min_confidence
+        ).order_by(SynthesizedEntry.id.desc())
+        if limit:
+            query = query.limit(limit)
+        for content, category in query.yield_per(1000):
+            if content and len(content.strip()) > 5:
+                texts.append(content.strip())
+                labels.append(category)
+    
+    counts = {}
+    for label in labels:
+        counts[label] = counts.get(label, 0) + 1
+    rare = {label for label, count in counts.items() if count < min_per_category}
+    if rare:
+        print(f"⚠️  Skipping categories with fewer than {min_per_category} examples: {', '.join(sorted(rare))}")
+        pairs = [(text, label) for text, label in zip(texts, labels) if label not in rare]
+        texts = [text for text, _ in pairs]
+        labels = [label for _, label in pairs]
+    return texts, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the offline note category classifier')
+    parser.add_argument('--output', default=None,
+                       help='Model file (default: LOCAL_CLASSIFIER_PATH or data/category_classifier.npz)')
+    parser.add_argument('--min-confidence', type=float, default=0.75,
+                       help='Only train on entries at or above this confidence (default: 0.75)')
+    parser.add_argument('--min-per-category', type=int, default=10,
+                       help='Drop categories with fewer examples (default: 10)')
+    parser.add_argument('--limit', type=int, help='Use only the most recent N entries')
+    parser.add_argument('--feature-bits', type=int, default=18,
+                       help='Hash 2^N features (default: 18, ~1MB of weights per category)')
+    parser.add_argument('--epochs', type=int, default=12, help='Training epochs (default: 12)')
+    parser.add_argument('--validation-fraction', type=float, default=0.1,
+                       help='Held out for accuracy and calibration (default: 0.1)')
+    
+    args = parser.parse_args()
+    
+    try:
+        print("Loading synthesized entries...")
+        texts, labels = load_examples(args.min_confidence, args.min_per_category, args.limit)
+        if len(set(labels)) < 2:
+            print(f"❌ Need at least two categories with {args.min_per_category}+ examples (found {len(texts)} usable entries)")
+            sys.exit(1)
+        print(f"✅ {len(texts)} examples across {len(set(labels))} categories")
+        
+        print(f"Training ({args.epochs} epochs, 2^{args.feature_bits} features)...")
+        classifier, report = train_classifier(
+            texts, labels,
+            n_features=2 ** args.feature_bits,
+            epochs=args.epochs,
+            validation_fraction=args.validation_fraction
+        )
+        
+        print(f"\n{'Category':<30} {'Examples':>8}")
+        for label, count in report['classes'].items():
+            print(f"{label:<30} {count:>8}")
+        print(f"\nTrained in {report['train_seconds']}s")
+        if report.get('validation_examples'):
+            print(f"Validation accuracy:  {report['validation_accuracy']:.1%} on {report['validation_examples']} held-out entries")
+            print(f"Calibration error:    {report['ece_before_calibration']:.3f} -> {report['ece_after_calibration']:.3f} "
+                  f"(temperature {report['temperature']})")
+        
+        sample = max(texts[:200], key=len)
+        start = time.perf_counter()
+        for _ in range(100):
+            classifier.predict(sample)
+        print(f"Prediction latency:   {(time.perf_counter() - start) * 10:.2f} ms for a {len(sample)}-character entry")
+        
+        output = args.output or get_model_path()
+        classifier.save(output)
+        print(f"\n✅ Saved model to {output}")
+        print("Restart the web workers (or set LOCAL_CLASSIFIER_PATH) to pick it up.")
+    
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()